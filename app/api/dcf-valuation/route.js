@@ -517,6 +517,20 @@ MANAGEMENT COMMENTARY & GUIDANCE:
   }
 }
 
+// Last Python API body per URL with its ETag. Repeat lookups send
+// If-None-Match and reuse the body when python_service answers 304.
+const PY_YF_CACHE_MAX = 200;
+const pyYfCache = new Map();
+
+function rememberPyYf(url, etag, data) {
+  // Re-inserting keeps Map order least recently used first
+  pyYfCache.delete(url);
+  pyYfCache.set(url, { etag, data });
+  if (pyYfCache.size > PY_YF_CACHE_MAX) {
+    pyYfCache.delete(pyYfCache.keys().next().value);
+  }
+}
+
 // Direct yfinance fetch - HTTP to Python API (Vercel) or spawn locally, with JS fallback
 async function fetchYFinanceDataDirect(ticker, hdrs) {
   const isVercel = !!process.env.VERCEL_URL || process.env.VERCEL === '1';
@@ -527,7 +541,8 @@ async function fetchYFinanceDataDirect(ticker, hdrs) {
     // Try Python API via HTTP with timeout to leave time for LLM
     const startTime = Date.now();
     try {
-      const url = `${pyYfUrl.replace(/\?.*$/, '')}?ticker=${encodeURIComponent(ticker)}`;
+      // deadline makes the Python side answer with partial data before our 8s abort
+      const url = `${pyYfUrl.replace(/\?.*$/, '')}?ticker=${encodeURIComponent(ticker)}&deadline=7`;
       console.log(`[Python API] Calling ${url}`);
 
       // Build headers with Vercel protection bypass if available
@@ -538,19 +553,35 @@ async function fetchYFinanceDataDirect(ticker, hdrs) {
       if (process.env.VERCEL_PROTECTION_BYPASS) {
         headers['x-vercel-protection-bypass'] = process.env.VERCEL_PROTECTION_BYPASS;
       }
+      const cached = pyYfCache.get(url);
+      if (cached) {
+        headers['If-None-Match'] = cached.etag;
+      }
 
       // 8 second timeout - leave 50+ seconds for LLM within Vercel 60s limit
       const controller = new AbortController();
       const timeoutId = setTimeout(() => controller.abort(), 8000);
 
-      const response = await fetch(url, { method: 'GET', headers, signal: controller.signal });
+      // no-store: revalidation is ours, Next's data cache would answer without asking
+      const response = await fetch(url, { method: 'GET', headers, signal: controller.signal, cache: 'no-store' });
       clearTimeout(timeoutId);
 
       const elapsed = Date.now() - startTime;
+      if (response.status === 304 && cached) {
+        console.log(`[Python API] Not modified in ${elapsed}ms, reusing cached body`);
+        rememberPyYf(url, cached.etag, cached.data);
+        return cached.data;
+      }
       if (response.ok) {
         const data = await response.json();
         if (data && Array.isArray(data.historical_financials) && data.historical_financials.length > 0) {
           console.log(`[Python API] Success in ${elapsed}ms: ${data.historical_financials.length} historical records`);
+          const etag = response.headers.get('etag');
+          // Partial or stale-refilled answers are marked no-cache; don't keep them
+          const partial = (response.headers.get('cache-control') || '').includes('no-cache');
+          if (etag && !partial) {
+            rememberPyYf(url, etag, data);
+          }
           return data;
         }
         console.log(`[Python API] No valid data in ${elapsed}ms`);
@@ -2,16 +2,18 @@ from fastapi import FastAPI, HTTPException
 from fastapi.responses import JSONResponse
 
 # Import the existing fetcher from your repo
-from scripts.fetch_yfinance import fetch_financials
+from scripts.fetch_yfinance import fetch_financials_cached
 
 app = FastAPI()
 
 
 @app.get("/yf")
-def yf(ticker: str | None = None):
+def yf(ticker: str | None = None, deadline: float | None = None):
     if not ticker:
         raise HTTPException(status_code=400, detail="Missing ticker")
-    data = fetch_financials(ticker)
+    if deadline is not None and deadline <= 0:
+        raise HTTPException(status_code=400, detail="deadline must be positive")
+    data = fetch_financials_cached(ticker, deadline=deadline)
     return JSONResponse(content=data)
 
 
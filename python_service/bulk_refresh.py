@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Bulk refresh of `fetch_financials` snapshots for a ticker universe.
+
+    python bulk_refresh.py universes/sp500.txt --workers 8 --rate 4
+
+The universe file has one ticker per line (# comments allowed) or is a CSV
+with a Symbol/Ticker column. Tickers are fetched by a worker pool, with
+every Yahoo call going through the shared YAHOO rate limit (--rate
+overrides YAHOO_RATE_LIMIT for the run). Each finished ticker is appended
+to the run's checkpoint.jsonl right away, so rerunning the same command
+with the same --run-id (default: today's date) resumes where an
+interrupted run stopped and retries only what failed.
+
+When every ticker has been tried, the run is written out as a snapshot
+(see snapshot.py) and published as CURRENT unless more than
+--max-failure-ratio of the universe failed. A JSON report with throughput
+and failures goes to stdout; progress goes to stderr.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from datetime import date
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.fetch_yfinance import fetch_financials  # noqa: E402
+from scripts.rate_limit import yahoo as yahoo_rate  # noqa: E402
+
+import replay  # noqa: E402
+import snapshot  # noqa: E402
+
+
+def read_universe(path):
+    """Tickers from a text or CSV file, upper-cased, Yahoo-style (BRK.B -> BRK-B)."""
+    text = Path(path).read_text()
+    lines = [line.strip() for line in text.splitlines() if line.strip() and not line.startswith("#")]
+    if lines and "," in lines[0]:
+        rows = csv.DictReader(lines)
+        column = next((c for c in rows.fieldnames if c.strip().lower() in ("symbol", "ticker")), rows.fieldnames[0])
+        raw = [row[column] for row in rows]
+    else:
+        raw = lines
+    tickers = [t.strip().upper().replace(".", "-") for t in raw if t and t.strip()]
+    return list(dict.fromkeys(tickers))
+
+
+def load_checkpoint(path):
+    """{ticker: record} of finished tickers; later lines win, torn last lines are skipped."""
+    done = {}
+    if not path.exists():
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            done[record["ticker"]] = record
+    return done
+
+
+def failure_reason(payload):
+    if not payload:
+        return "empty"
+    if payload.get("source") == "yfinance_alternative":
+        return "fetch_failed"
+    if payload.get("missing"):
+        return "partial: " + ", ".join(payload["missing"])
+    if not (payload.get("fy24_financials") or {}).get("revenue"):
+        return "no_revenue"
+    return None
+
+
+def fetch_one(fetch, ticker, retries, deadline):
+    start = time.monotonic()
+    reason, payload, error = None, None, None
+    for attempt in range(retries + 1):
+        try:
+            payload = fetch(ticker, deadline=deadline)
+            reason = failure_reason(payload)
+        except Exception as e:
+            reason, error = "exception", f"{type(e).__name__}: {e}"
+        if reason is None:
+            break
+        if attempt < retries:
+            time.sleep(min(2 ** attempt, 10))
+    record = {
+        "ticker": ticker,
+        "ok": reason is None,
+        "elapsed_s": round(time.monotonic() - start, 3),
+        "attempts": attempt + 1,
+        "fetched_at": time.time(),
+    }
+    if reason is None:
+        record["payload"] = payload
+    else:
+        record["error"] = error or reason
+    return record
+
+
+def write_snapshot(run_dir, version, records, started_at, stats):
+    ok = [r for r in records.values() if r["ok"]]
+    failed = {t: r.get("error") for t, r in records.items() if not r["ok"]}
+    tmp = run_dir / "payloads.jsonl.tmp"
+    with open(tmp, "w") as f:
+        for r in ok:
+            f.write(json.dumps({"ticker": r["ticker"], "payload": r["payload"]}) + "\n")
+    os.replace(tmp, run_dir / "payloads.jsonl")
+    table = snapshot.build_table([snapshot.flatten(r["ticker"], r["payload"], r["fetched_at"]) for r in ok])
+    snapshot.write_table(table, run_dir)
+    manifest = {
+        "version": version,
+        "started_at": started_at,
+        "finished_at": time.time(),
+        "tickers": len(records),
+        "ok": len(ok),
+        "failed": failed,
+        "table": snapshot.TABLE_FILE,
+        **stats,
+    }
+    (run_dir / "manifest.json").write_text(json.dumps(manifest, indent=2))
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh fetch_financials snapshots for a ticker universe")
+    parser.add_argument("universe", help="ticker file (one per line, or CSV with a Symbol column)")
+    parser.add_argument("--run-id", default=date.today().strftime("%Y%m%d"),
+                        help="snapshot version; reuse it to resume an interrupted run")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=None, help="Yahoo requests per second for this run")
+    parser.add_argument("--burst", type=float, default=None)
+    parser.add_argument("--retries", type=int, default=1)
+    parser.add_argument("--deadline", type=float, default=None, help="per-ticker fetch budget in seconds")
+    parser.add_argument("--backend", choices=("yfinance", "replay"), default="yfinance")
+    parser.add_argument("--max-failure-ratio", type=float, default=0.2)
+    parser.add_argument("--no-publish", action="store_true")
+    args = parser.parse_args()
+
+    universe = read_universe(args.universe)
+    if not universe:
+        parser.error("universe file has no tickers")
+    if args.rate is not None:
+        yahoo_rate.configure(args.rate, args.burst)
+    fetch = replay.replay_financials if args.backend == "replay" else fetch_financials
+
+    run_dir = snapshot.SNAPSHOT_DIR / args.run_id
+    run_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = run_dir / "checkpoint.jsonl"
+    records = load_checkpoint(checkpoint_path)
+    pending = [t for t in universe if not records.get(t, {}).get("ok")]
+    started_at = time.time()
+    print(f"[bulk] {len(universe)} tickers, {len(universe) - len(pending)} already done, "
+          f"{len(pending)} to fetch with {args.workers} workers", file=sys.stderr)
+
+    start = time.monotonic()
+    finished = failures = 0
+    interrupted = False
+    with open(checkpoint_path, "a") as checkpoint, ThreadPoolExecutor(max_workers=args.workers) as pool:
+        if checkpoint.tell() and not checkpoint_path.read_bytes().endswith(b"\n"):
+            checkpoint.write("\n")  # a killed run may have left half a line
+        futures = [pool.submit(fetch_one, fetch, t, args.retries, args.deadline) for t in pending]
+        try:
+            for future in as_completed(futures):
+                record = future.result()
+                checkpoint.write(json.dumps(record) + "\n")
+                checkpoint.flush()
+                records[record["ticker"]] = record
+                finished += 1
+                failures += not record["ok"]
+                if finished % 25 == 0 or finished == len(pending):
+                    rate = finished / max(time.monotonic() - start, 1e-9)
+                    print(f"[bulk] {finished}/{len(pending)} done, {failures} failed, {rate:.2f} tickers/s",
+                          file=sys.stderr)
+        except KeyboardInterrupt:
+            interrupted = True
+            print("[bulk] interrupted; rerun with the same --run-id to resume", file=sys.stderr)
+            for future in futures:
+                future.cancel()
+
+    elapsed = time.monotonic() - start
+    stats = {
+        "fetched_this_run": finished,
+        "elapsed_s": round(elapsed, 2),
+        "throughput_per_s": round(finished / elapsed, 3) if elapsed > 0 else None,
+        "rate_limit_wait_s": round(yahoo_rate.waited, 2),
+        "workers": args.workers,
+    }
+    records = {t: records[t] for t in universe if t in records}
+    report = {"version": args.run_id, "tickers": len(universe), "interrupted": interrupted, **stats}
+    if not interrupted:
+        manifest = write_snapshot(run_dir, args.run_id, records, started_at, stats)
+        failure_ratio = len(manifest["failed"]) / len(universe)
+        publish = not args.no_publish and failure_ratio <= args.max_failure_ratio
+        if publish:
+            snapshot.publish(args.run_id)
+        report.update({"ok": manifest["ok"], "failed": manifest["failed"], "published": publish})
+    print(json.dumps(report, indent=2))
+    # Abandoned fetch stage threads must not keep the process alive
+    sys.stdout.flush()
+    os._exit(130 if interrupted else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Incremental covariance of daily returns over a sliding window.
+
+Instead of recomputing a five-year covariance matrix whenever one more
+daily close arrives, the store keeps the running mean and co-moment matrix
+of the tracked tickers' returns (benchmark included) and updates them with
+Welford's formulas:
+
+    add x:    m' = m + (x - m) / n'          C' = C + (x - m) (x - m')^T
+    remove x: m' = m - (x - m) / (n - 1)     C' = C - (x - m') (x - m)^T
+
+Appending a bar is O(N^2) for N tickers, dropping the oldest bar of the
+window is the same, and reading the covariance, correlations, betas or a
+portfolio's volatility is a slice of the current matrices. The window's
+returns are kept so the statistics can be recomputed exactly every
+RESYNC_EVERY updates, which stops rounding drift from removals building up.
+
+The statistics are joint, so the window only covers days on which every
+ticker of the store traded: a recent listing shortens it to its own
+history. Stores are therefore kept per portfolio (see get_store), and a
+newly listed holding only shortens the window of the portfolios it is in.
+"""
+import os
+import threading
+from collections import OrderedDict, deque
+from datetime import date
+
+import numpy as np
+
+import price_matrix
+from scripts.timing import span
+
+DEFAULT_WINDOW = 5 * price_matrix.TRADING_DAYS
+RESYNC_EVERY = 2_000
+COVARIANCE_STORES_MAX = int(os.environ.get("COVARIANCE_STORES_MAX", "64"))
+
+
+class CovarianceStore:
+    """Sliding-window mean/co-moment of daily simple returns for a ticker set."""
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = int(window)
+        self.tickers = []
+        self._index = {}
+        self._bars = deque()          # (date, returns vector) oldest first
+        self._last_close = np.empty(0)
+        self.last_date = None
+        self.n = 0
+        self.mean = np.empty(0)
+        self.comoment = np.empty((0, 0))
+        self._updates = 0
+        self.lock = threading.RLock()
+
+    # -- updates --------------------------------------------------------
+
+    def _add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.comoment += np.outer(delta, x - self.mean)
+
+    def _remove(self, x):
+        if self.n <= 1:
+            self.n = 0
+            self.mean[:] = 0.0
+            self.comoment[:] = 0.0
+            return
+        delta = x - self.mean
+        self.n -= 1
+        self.mean -= delta / self.n
+        self.comoment -= np.outer(x - self.mean, delta)
+
+    def resync(self):
+        """Recompute mean and co-moment exactly from the bars in the window."""
+        with self.lock:
+            if not self._bars:
+                self.n, self.mean, self.comoment = 0, np.zeros(len(self.tickers)), np.zeros((len(self.tickers),) * 2)
+            else:
+                returns = np.stack([x for _, x in self._bars])
+                self.n = returns.shape[0]
+                self.mean = returns.mean(axis=0)
+                centred = returns - self.mean
+                self.comoment = centred.T @ centred
+            self._updates = 0
+
+    def append(self, day, closes):
+        """Add one day of closes ({ticker: close}); returns False if not newer.
+
+        Tickers missing from the bar keep their last close (a zero return).
+        """
+        with self.lock:
+            if self.last_date is not None and day <= self.last_date:
+                return False
+            prices = self._last_close.copy()
+            for ticker, close in closes.items():
+                i = self._index.get(ticker)
+                if i is not None and close and np.isfinite(close):
+                    prices[i] = close
+            if self.last_date is not None:
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    x = np.where(self._last_close > 0, prices / self._last_close - 1.0, 0.0)
+                self._bars.append((day, x))
+                self._add(x)
+                self._updates += 1
+                while len(self._bars) > self.window:
+                    self.drop_oldest()
+            self._last_close = prices
+            self.last_date = day
+            if self._updates >= RESYNC_EVERY:
+                self.resync()
+            return True
+
+    def drop_oldest(self, count=1):
+        """Remove the oldest `count` bars from the window."""
+        with self.lock:
+            for _ in range(min(count, len(self._bars))):
+                _, x = self._bars.popleft()
+                self._remove(x)
+                self._updates += 1
+
+    def load(self, closes):
+        """Replace the tracked set and history with a date x ticker close frame.
+
+        Gaps are carried forward; days before the latest listing are dropped.
+        """
+        closes = closes.ffill().dropna(how="any")
+        with self.lock:
+            self.tickers = list(closes.columns)
+            self._index = {t: i for i, t in enumerate(self.tickers)}
+            prices = closes.to_numpy(dtype=float)
+            returns = prices[1:] / prices[:-1] - 1.0
+            dates = [d.date() for d in closes.index]
+            keep = min(self.window, len(returns))
+            self._bars = deque(zip(dates[len(dates) - keep:], returns[len(returns) - keep:]))
+            self._last_close = prices[-1] if len(prices) else np.zeros(len(self.tickers))
+            self.last_date = dates[-1] if dates else None
+            self.resync()
+
+    def extend(self, closes):
+        """Append every row of a close frame newer than the last stored bar."""
+        added = 0
+        for day, row in closes.iterrows():
+            if self.append(day.date(), {t: v for t, v in row.items() if t in self._index}):
+                added += 1
+        return added
+
+    # -- reads ------------------------------------------------------------
+
+    def covariance(self, tickers=None, annualize=True):
+        """Sample covariance of daily returns for `tickers` (all by default)."""
+        with self.lock:
+            idx = self._positions(tickers)
+            cov = self.comoment[np.ix_(idx, idx)] / max(self.n - 1, 1)
+        return cov * price_matrix.TRADING_DAYS if annualize else cov
+
+    def correlation(self, tickers=None):
+        cov = self.covariance(tickers, annualize=False)
+        std = np.sqrt(np.diag(cov))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return cov / np.outer(std, std)
+
+    def betas(self, benchmark, tickers=None):
+        """{ticker: beta against `benchmark`}."""
+        with self.lock:
+            tickers = list(tickers or self.tickers)
+            b = self._index[benchmark]
+            idx = self._positions(tickers)
+            bench_var = self.comoment[b, b]
+            cov = self.comoment[idx, b]
+        return {t: float(c / bench_var) if bench_var > 0 else None for t, c in zip(tickers, cov)}
+
+    def portfolio(self, weights, benchmark=None):
+        """Annualized volatility and mean return (and beta) of fixed weights."""
+        with self.lock:
+            tickers = list(weights)
+            w = np.array([float(weights[t]) for t in tickers])
+            idx = self._positions(tickers)
+            cov = self.comoment[np.ix_(idx, idx)] / max(self.n - 1, 1)
+            out = {
+                "volatility": float(np.sqrt(max(w @ cov @ w, 0.0) * price_matrix.TRADING_DAYS)),
+                "mean_return": float(self.mean[idx] @ w * price_matrix.TRADING_DAYS),
+                "observations": self.n,
+                "since": self._bars[0][0].isoformat() if self._bars else None,
+                "as_of": self.last_date.isoformat() if self.last_date else None,
+            }
+            if benchmark is not None:
+                b = self._index[benchmark]
+                bench_var = self.comoment[b, b]
+                out["beta"] = float(self.comoment[idx, b] @ w / bench_var) if bench_var > 0 else None
+        return out
+
+    def _positions(self, tickers):
+        if tickers is None:
+            return list(range(len(self.tickers)))
+        missing = [t for t in tickers if t not in self._index]
+        if missing:
+            raise KeyError(f"Not tracked: {', '.join(missing)}")
+        return [self._index[t] for t in tickers]
+
+
+class _Slot:
+    """A cached store, the day it was last synced and the lock its fetches run under."""
+
+    def __init__(self):
+        self.store = CovarianceStore()
+        self.synced_on = None
+        self.lock = threading.Lock()
+
+
+_stores = OrderedDict()   # frozenset of tickers -> _Slot, least recently used first
+_stores_lock = threading.Lock()
+
+
+def get_store(tickers, benchmark="SPY"):
+    """The store for exactly `tickers` + benchmark, synced for today.
+
+    One store is kept per ticker set, up to COVARIANCE_STORES_MAX, so a
+    portfolio's window and matrix only depend on its own holdings. The first
+    request for a set loads the full history; later days only append the
+    closes newer than the last stored bar (at most one price fetch per set
+    per day). A set that came back without some of its tickers is loaded in
+    full again the next day.
+    """
+    wanted = list(dict.fromkeys([t.upper() for t in tickers] + [benchmark.upper()]))
+    key = frozenset(wanted)
+    with _stores_lock:
+        slot = _stores.get(key)
+        if slot is None:
+            slot = _stores[key] = _Slot()
+        _stores.move_to_end(key)
+        while len(_stores) > COVARIANCE_STORES_MAX:
+            _stores.popitem(last=False)
+    # Fetches hold only this set's lock, so other portfolios aren't held up
+    with slot.lock:
+        today = date.today()
+        if slot.synced_on == today:
+            return slot.store
+        if slot.store.last_date is None or set(slot.store.tickers) != key:
+            with span("covariance_store_load", tickers=len(wanted)):
+                slot.store.load(price_matrix.load_closes(wanted))
+        else:
+            with span("covariance_store_extend"):
+                slot.store.extend(price_matrix.load_closes(slot.store.tickers, lookback_days=10))
+        slot.synced_on = today
+    return slot.store
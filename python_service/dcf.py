@@ -0,0 +1,142 @@
+"""
+Vectorized DCF engine with sensitivity grids.
+
+Takes the `fy24_financials` / `historical_financials` / `market_data`
+output of fetch_financials plus projection assumptions, and evaluates fair
+value over every discount rate x terminal growth x FCF-margin shift at once
+with NumPy broadcasting. Several companies are evaluated in the same pass
+(arrays carry a leading company axis), so a batch of 100x100 tables costs
+one set of array operations.
+
+All rates and margins are in percent, like the rest of the app
+("Discount Rate: 9%", `fcfMargin`).
+"""
+import numpy as np
+
+DEFAULT_YEARS = 5
+# Used when a company has no usable history to derive assumptions from
+DEFAULT_GROWTH_PCT = 5.0
+DEFAULT_FCF_MARGIN_PCT = 15.0
+# Upper bound on companies x grid cells per request, to keep responses sane
+DCF_MAX_CELLS = 2_000_000
+
+
+def grid_values(spec, default):
+    """Expand a grid spec: a list of values or {"start", "stop", "num"}."""
+    if spec is None:
+        spec = default
+    if isinstance(spec, dict):
+        num = int(spec.get("num", 10))
+        # Checked before linspace allocates anything
+        if not 1 <= num <= DCF_MAX_CELLS:
+            raise ValueError(f"num must be between 1 and {DCF_MAX_CELLS}")
+        return np.linspace(float(spec["start"]), float(spec["stop"]), num)
+    values = np.atleast_1d(np.asarray(spec, dtype=float))
+    if values.size == 0:
+        raise ValueError("grid must not be empty")
+    return values
+
+
+def _per_year(value, years):
+    """Scalar or per-year list -> array of length `years` (last value repeats)."""
+    arr = np.atleast_1d(np.asarray(value, dtype=float))
+    if arr.size >= years:
+        return arr[:years]
+    return np.concatenate([arr, np.repeat(arr[-1], years - arr.size)])
+
+
+def assumptions_from_financials(financials, years=DEFAULT_YEARS, revenue_growth=None, fcf_margin=None):
+    """Base revenue ($M), per-year growth and FCF margin (%) for one company.
+
+    Missing assumptions default to the mean historical revenue growth and the
+    latest reported FCF margin.
+    """
+    fy = financials.get("fy24_financials") or {}
+    md = financials.get("market_data") or {}
+    history = financials.get("historical_financials") or []
+
+    base_revenue_m = float(fy.get("revenue") or 0.0) / 1_000_000.0
+    if not base_revenue_m and history:
+        base_revenue_m = float(history[-1].get("revenue") or 0.0)
+
+    if revenue_growth is None:
+        growths = [float(row.get("revenueGrowth") or 0.0) for row in history[1:]]
+        revenue_growth = float(np.mean(growths)) if growths else DEFAULT_GROWTH_PCT
+    if fcf_margin is None:
+        if fy.get("fcf_margin_pct") is not None:
+            fcf_margin = float(fy["fcf_margin_pct"])
+        elif history:
+            fcf_margin = float(history[-1].get("fcfMargin") or DEFAULT_FCF_MARGIN_PCT)
+        else:
+            fcf_margin = DEFAULT_FCF_MARGIN_PCT
+
+    market_cap = float(md.get("market_cap") or 0.0)
+    enterprise_value = float(md.get("enterprise_value") or 0.0)
+    # EV - market cap is the net debt implied by the quote, used for the equity bridge
+    net_debt_m = (enterprise_value - market_cap) / 1_000_000.0 if market_cap and enterprise_value else 0.0
+
+    return {
+        "base_revenue_m": base_revenue_m,
+        "revenue_growth": _per_year(revenue_growth, years),
+        "fcf_margin": _per_year(fcf_margin, years),
+        "net_debt_m": net_debt_m,
+        "shares_outstanding": float(fy.get("shares_outstanding") or 0.0),
+        "current_price": float(md.get("current_price") or 0.0),
+    }
+
+
+def dcf_grid(base_revenue_m, revenue_growth, fcf_margin, discount_rates, terminal_growths, margin_shifts):
+    """Enterprise value ($M) for every company x discount x growth x margin shift.
+
+    base_revenue_m: (C,)          latest annual revenue per company
+    revenue_growth: (C, T)        projected growth per year, %
+    fcf_margin:     (C, T)        projected FCF margin per year, %
+    discount_rates: (R,), terminal_growths: (G,), margin_shifts: (M,) in %
+    Returns an array of shape (C, R, G, M); NaN where discount <= growth.
+    """
+    base = np.asarray(base_revenue_m, dtype=float)[:, None]
+    growth = np.asarray(revenue_growth, dtype=float) / 100.0
+    margin = np.asarray(fcf_margin, dtype=float) / 100.0
+    r = np.asarray(discount_rates, dtype=float) / 100.0
+    g = np.asarray(terminal_growths, dtype=float) / 100.0
+    shift = np.asarray(margin_shifts, dtype=float) / 100.0
+    years = growth.shape[1]
+
+    revenue = base * np.cumprod(1.0 + growth, axis=1)                        # (C, T)
+    fcf = revenue[:, None, :] * (margin[:, None, :] + shift[None, :, None])  # (C, M, T)
+    periods = np.arange(1, years + 1)
+    discount = (1.0 + r)[:, None] ** -periods[None, :]                       # (R, T)
+
+    pv_explicit = np.einsum("cmt,rt->crm", fcf, discount)                    # (C, R, M)
+
+    final_fcf = fcf[:, :, -1]                                                # (C, M)
+    spread = r[:, None] - g[None, :]                                         # (R, G)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tv_factor = np.where(spread > 0, (1.0 + g)[None, :] / spread, np.nan)  # (R, G)
+    tv_factor = tv_factor * discount[:, -1][:, None]
+    pv_terminal = final_fcf[:, None, None, :] * tv_factor[None, :, :, None]  # (C, R, G, M)
+
+    return pv_explicit[:, :, None, :] + pv_terminal
+
+
+def evaluate(companies, discount_rates, terminal_growths, margin_shifts):
+    """Run the grid for a batch of assumption dicts (see assumptions_from_financials)."""
+    base = np.array([c["base_revenue_m"] for c in companies])
+    growth = np.stack([c["revenue_growth"] for c in companies])
+    margin = np.stack([c["fcf_margin"] for c in companies])
+    ev = dcf_grid(base, growth, margin, discount_rates, terminal_growths, margin_shifts)
+
+    net_debt = np.array([c["net_debt_m"] for c in companies])[:, None, None, None]
+    equity = ev - net_debt
+    shares = np.array([c["shares_outstanding"] for c in companies])[:, None, None, None]
+    price = np.array([c["current_price"] for c in companies])[:, None, None, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        per_share = np.where(shares > 0, equity * 1_000_000.0 / shares, np.nan)
+        upside = np.where(price > 0, (per_share / price - 1.0) * 100.0, np.nan)
+    return {"enterprise_value_m": ev, "fair_value_m": equity, "per_share": per_share, "upside_pct": upside}
+
+
+def json_grid(arr, digits=4):
+    """Nested lists with NaN/inf as null, for JSONResponse."""
+    arr = np.asarray(arr, dtype=float)
+    return np.where(np.isfinite(arr), np.round(arr, digits), None).tolist()
@@ -0,0 +1,148 @@
+"""
+Statistical factor model of portfolio risk.
+
+The aligned daily returns of a ticker universe (T days x N tickers) are
+demeaned and the top k principal components extracted with a randomized
+truncated SVD (Halko, Martinsson & Tropp): project onto k + oversampling
+random directions, sharpen with a couple of power iterations, and take an
+exact SVD of the small projected matrix. Cost is O(T N k) instead of the
+O(T N min(T, N)) of a full decomposition, so universes of thousands of
+tickers stay tractable.
+
+With X = U S V^T, the factor loadings are V (N x k), factor variances are
+S^2 / (T - 1) and whatever a ticker's variance the factors don't explain
+is its idiosyncratic variance (assumed uncorrelated across tickers).
+A portfolio's factor exposures are V^T w, which splits its variance into
+a systematic and an idiosyncratic part.
+
+Models are cached per universe, lookback, k and day.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+import metrics
+import price_matrix
+from scripts.timing import span
+
+DEFAULT_FACTORS = 5
+OVERSAMPLE = 10
+POWER_ITERATIONS = 2
+# Tickers with less history than this share of the lookback are left out
+MIN_COVERAGE = 0.8
+MODEL_CACHE_MAX = 16
+
+_models = OrderedDict()
+_models_lock = threading.Lock()
+
+
+def randomized_svd(x, k, oversample=OVERSAMPLE, power_iterations=POWER_ITERATIONS, seed=0):
+    """Top-k singular triplets (U, s, Vt) of `x` by randomized range finding."""
+    rng = np.random.default_rng(seed)
+    rank = min(k + oversample, *x.shape)
+    q, _ = np.linalg.qr(x @ rng.standard_normal((x.shape[1], rank)))
+    for _ in range(power_iterations):
+        # Re-orthonormalize between multiplications to keep small singular values
+        q, _ = np.linalg.qr(x.T @ q)
+        q, _ = np.linalg.qr(x @ q)
+    u_small, s, vt = np.linalg.svd(q.T @ x, full_matrices=False)
+    k = min(k, s.size)
+    return (q @ u_small)[:, :k], s[:k], vt[:k]
+
+
+class FactorModel:
+    """k-factor decomposition of a universe's daily return covariance."""
+
+    def __init__(self, returns, k=DEFAULT_FACTORS, seed=0):
+        self.tickers = list(returns.columns)
+        self._index = {t: i for i, t in enumerate(self.tickers)}
+        self.as_of = returns.index[-1].strftime("%Y-%m-%d")
+        x = returns.to_numpy(dtype=float)
+        self.observations = x.shape[0]
+        x = x - x.mean(axis=0)
+        dof = max(self.observations - 1, 1)
+
+        _, s, vt = randomized_svd(x, k, seed=seed)
+        # Fix the arbitrary SVD signs so factors read the same way each day
+        signs = np.where(vt.sum(axis=1) < 0, -1.0, 1.0)
+        self.loadings = (vt * signs[:, None]).T              # (N, k)
+        self.factor_variance = s ** 2 / dof                 # (k,)
+        self.total_variance = (x ** 2).sum(axis=0) / dof    # (N,)
+        systematic = (self.loadings ** 2) @ self.factor_variance
+        self.idiosyncratic_variance = np.maximum(self.total_variance - systematic, 0.0)
+        self.explained_ratio = self.factor_variance / self.total_variance.sum()
+
+    def factor_volatility(self):
+        """Annualized volatility of each factor's returns."""
+        return np.sqrt(self.factor_variance * price_matrix.TRADING_DAYS)
+
+    def decompose(self, weights):
+        """Annualized systematic/idiosyncratic split and factor exposures."""
+        missing = [t for t in weights if t not in self._index]
+        if missing:
+            raise KeyError(", ".join(missing))
+        idx = [self._index[t] for t in weights]
+        w = np.array([float(v) for v in weights.values()])
+        exposures = self.loadings[idx].T @ w
+        by_factor = exposures ** 2 * self.factor_variance * price_matrix.TRADING_DAYS
+        systematic = float(by_factor.sum())
+        idiosyncratic = float((w ** 2) @ self.idiosyncratic_variance[idx] * price_matrix.TRADING_DAYS)
+        total = systematic + idiosyncratic
+        return {
+            "volatility": float(np.sqrt(total)),
+            "variance": total,
+            "systematic_variance": systematic,
+            "idiosyncratic_variance": idiosyncratic,
+            "systematic_share": systematic / total if total > 0 else None,
+            "exposures": exposures.tolist(),
+            "factor_variance_contribution": by_factor.tolist(),
+        }
+
+    def ticker_summary(self, tickers):
+        """Loadings and the share of variance the factors explain, per ticker."""
+        out = {}
+        for t in tickers:
+            i = self._index[t]
+            total = self.total_variance[i]
+            out[t] = {
+                "loadings": self.loadings[i].tolist(),
+                "r_squared": float(1.0 - self.idiosyncratic_variance[i] / total) if total > 0 else None,
+                "volatility": float(np.sqrt(total * price_matrix.TRADING_DAYS)),
+            }
+        return out
+
+
+def universe_returns(tickers, lookback_days):
+    """Daily simple returns for the universe, dropping thinly covered tickers."""
+    closes = price_matrix.load_closes(tickers, lookback_days)
+    if closes.empty:
+        return closes
+    coverage = closes.notna().mean()
+    closes = closes.loc[:, coverage >= MIN_COVERAGE].ffill().dropna(how="any")
+    return closes.pct_change().iloc[1:]
+
+
+def get_model(universe, k=DEFAULT_FACTORS, lookback_days=756):
+    """Cached FactorModel for a universe; returns (model, cache_hit)."""
+    key = (tuple(sorted({t.upper() for t in universe})), int(k), int(lookback_days), date.today().isoformat())
+    with _models_lock:
+        model = _models.get(key)
+        if model is not None:
+            _models.move_to_end(key)
+    metrics.record_cache("factor_model", model is not None)
+    if model is not None:
+        return model, True
+
+    with span("factor_universe", tickers=len(key[0])):
+        returns = universe_returns(list(key[0]), lookback_days)
+    if returns.shape[0] < 2 * k or returns.shape[1] < 2:
+        raise ValueError("Not enough overlapping price history for a factor model")
+    with span("factor_svd", tickers=returns.shape[1], days=returns.shape[0], k=k):
+        model = FactorModel(returns, k)
+    with _models_lock:
+        _models[key] = model
+        while len(_models) > MODEL_CACHE_MAX:
+            _models.popitem(last=False)
+    return model, False
@@ -0,0 +1,211 @@
+"""
+Daily historical valuation multiples from quarterly statements.
+
+Quarterly income, cash flow and balance sheet rows are put into one frame,
+trailing-twelve-month sums are computed once with a rolling 4-quarter
+window, and the result is joined onto the daily price series with an
+as-of merge. P/E, EV/EBITDA, EV/Sales and P/FCF then come out of a single
+vectorized pass instead of re-scanning the quarters for every price point.
+
+Each day only sees quarters that had been filed by then: a quarter becomes
+usable FILING_LAG_DAYS after it ends (the 10-Q deadline), not on the
+quarter end itself, which would look ahead.
+
+Yahoo only serves the last 4-6 quarterly statements, so TTM figures start
+at the fourth of them plus the filing lag, and the multiples cover roughly
+the last year however many `years` of prices are asked for. The payload
+starts at the first day with a multiple; `years` caps the range.
+
+Statements and prices go through the same rate limit, circuit breakers and
+hedging as the /yf stages, and payloads are shared through the result cache
+("multiples").
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from scripts.fetch_yfinance import debug, safe_float, fetch_attr
+from scripts.rate_limit import yahoo as yahoo_rate
+from scripts.result_cache import cache as result_cache
+from scripts.timing import span
+from scripts import upstream
+
+FILING_LAG_DAYS = int(os.environ.get("FILING_LAG_DAYS", "45"))
+TTM_FIELDS = ["revenue", "net_income", "ebitda", "fcf"]
+MULTIPLES = ["pe", "ev_ebitda", "ev_sales", "p_fcf"]
+
+# Candidate yfinance row labels per field, first match wins
+INCOME_LABELS = {
+    "revenue": ["Total Revenue"],
+    "net_income": ["Net Income", "Net Income Common Stockholders"],
+    "ebitda": ["EBITDA", "Normalized EBITDA"],
+    "diluted_shares": ["Diluted Average Shares"],
+}
+CASH_FLOW_LABELS = {
+    "operating_cash_flow": ["Operating Cash Flow", "Total Cash From Operating Activities"],
+    "capex": ["Capital Expenditure", "Capital Expenditures"],
+}
+BALANCE_LABELS = {
+    "total_debt": ["Total Debt"],
+    "cash": ["Cash And Cash Equivalents", "Cash Cash Equivalents And Short Term Investments"],
+    "shares": ["Ordinary Shares Number", "Share Issued"],
+}
+
+
+def _rows(stmt, labels):
+    """Pick the first available row for each field, as float Series by period."""
+    out = {}
+    if stmt is None or stmt.empty:
+        return pd.DataFrame(out)
+    for field, candidates in labels.items():
+        for label in candidates:
+            if label in stmt.index:
+                out[field] = pd.to_numeric(stmt.loc[label], errors="coerce")
+                break
+    frame = pd.DataFrame(out)
+    frame.index = pd.to_datetime(frame.index)
+    return frame
+
+
+def quarterly_frame(income_stmt, cash_flow, balance_sheet):
+    """One row per quarter end with flow and point-in-time balance fields."""
+    frame = pd.concat(
+        [
+            _rows(income_stmt, INCOME_LABELS),
+            _rows(cash_flow, CASH_FLOW_LABELS),
+            _rows(balance_sheet, BALANCE_LABELS),
+        ],
+        axis=1,
+    ).sort_index()
+    for col in ["revenue", "net_income", "ebitda", "diluted_shares",
+                "operating_cash_flow", "capex", "total_debt", "cash", "shares"]:
+        if col not in frame:
+            frame[col] = np.nan
+    # CapEx is reported negative by Yahoo, so OCF + CapEx is free cash flow
+    frame["fcf"] = frame["operating_cash_flow"] + frame["capex"]
+    frame["shares"] = frame["shares"].fillna(frame["diluted_shares"])
+    # Without any statement (ETFs, funds) the index would not be dates
+    frame.index = pd.to_datetime(frame.index)
+    return frame
+
+
+def compute_multiples(prices, quarters, shares_fallback=0.0, filing_lag_days=FILING_LAG_DAYS):
+    """Join TTM fundamentals onto daily closes and derive the multiples.
+
+    prices: Series of closes indexed by date.
+    quarters: frame from quarterly_frame().
+    Each day gets the latest quarter filed (ended `filing_lag_days` ago).
+    Returns a frame indexed by date; multiples are NaN where undefined.
+    """
+    quarters = quarters.sort_index()
+    ttm = quarters[TTM_FIELDS].rolling(4, min_periods=4).sum()
+    ttm = ttm.add_suffix("_ttm")
+    point_in_time = quarters[["total_debt", "cash", "shares"]].ffill()
+    fundamentals = pd.concat([ttm, point_in_time], axis=1)
+    fundamentals["quarter"] = fundamentals.index
+    # A quarter's figures are public once it has been filed, not when it ends
+    fundamentals["filed"] = fundamentals.index + pd.Timedelta(days=filing_lag_days)
+    fundamentals = fundamentals.reset_index(drop=True)
+
+    daily = pd.DataFrame({"date": pd.to_datetime(prices.index), "close": prices.to_numpy(dtype=float)})
+    daily = daily.dropna().sort_values("date")
+    merged = pd.merge_asof(daily, fundamentals, left_on="date", right_on="filed", direction="backward")
+
+    shares = merged["shares"].fillna(shares_fallback).replace(0, np.nan)
+    market_cap = merged["close"] * shares
+    ev = market_cap + merged["total_debt"].fillna(0.0) - merged["cash"].fillna(0.0)
+
+    def ratio(numerator, denominator):
+        return numerator / denominator.where(denominator > 0)
+
+    out = pd.DataFrame({
+        "date": merged["date"],
+        "price": merged["close"],
+        "market_cap": market_cap,
+        "enterprise_value": ev,
+        "pe": ratio(market_cap, merged["net_income_ttm"]),
+        "ev_ebitda": ratio(ev, merged["ebitda_ttm"]),
+        "ev_sales": ratio(ev, merged["revenue_ttm"]),
+        "p_fcf": ratio(market_cap, merged["fcf_ttm"]),
+        "quarter": merged["quarter"],
+    })
+    out = out.set_index("date")
+    # Before the first TTM quarter was filed there is nothing to show but the price
+    usable = out[MULTIPLES].notna().any(axis=1)
+    return out[usable.cummax().to_numpy()] if usable.any() else out.iloc[:0]
+
+
+def _column(series, digits=4):
+    values = series.to_numpy(dtype=float)
+    return [None if not np.isfinite(v) else round(float(v), digits) for v in values]
+
+
+def to_payload(ticker, multiples):
+    """Columnar JSON-safe payload (one array per series)."""
+    quarters = multiples["quarter"]
+    return {
+        "ticker": ticker.upper(),
+        "dates": [d.strftime("%Y-%m-%d") for d in multiples.index],
+        "price": _column(multiples["price"]),
+        "market_cap": _column(multiples["market_cap"], 0),
+        "enterprise_value": _column(multiples["enterprise_value"], 0),
+        "pe": _column(multiples["pe"]),
+        "ev_ebitda": _column(multiples["ev_ebitda"]),
+        "ev_sales": _column(multiples["ev_sales"]),
+        "p_fcf": _column(multiples["p_fcf"]),
+        "quarter": [None if pd.isna(q) else q.strftime("%Y-%m-%d") for q in quarters],
+    }
+
+
+def _price_history(ticker, years):
+    yahoo_rate.acquire()
+    with span("price_history", ticker=ticker) as sp:
+        hist = upstream.call(
+            "price_fallback",
+            lambda: yf.Ticker(ticker).history(period=f"{int(years)}y", interval="1d", auto_adjust=False),
+        )
+        if hist is None or hist.empty:
+            sp["status"] = "empty"
+    return hist
+
+
+def fetch_multiples(ticker, years=5):
+    """Fetch statements and daily prices for a ticker and build the payload (None without either)."""
+    company = yf.Ticker(ticker)
+    with span("quarterly_statements", ticker=ticker):
+        quarters = quarterly_frame(
+            fetch_attr(company, "quarterly_income_stmt", ticker),
+            fetch_attr(company, "quarterly_cash_flow", ticker),
+            fetch_attr(company, "quarterly_balance_sheet", ticker),
+        )
+    if quarters.empty:
+        # ETFs and funds have no statements, so no multiples
+        return None
+    hist = _price_history(ticker, years)
+    if hist is None or hist.empty:
+        return None
+    closes = hist["Close"]
+    if getattr(closes.index, "tz", None) is not None:
+        closes.index = closes.index.tz_localize(None)
+
+    shares_fallback = 0.0
+    if quarters["shares"].isna().all():
+        try:
+            shares_fallback = safe_float(fetch_attr(company, "info", ticker).get("sharesOutstanding"))
+        except Exception as e:
+            debug(f"No share count for {ticker}: {e}")
+
+    with span("multiples", ticker=ticker):
+        multiples = compute_multiples(closes, quarters, shares_fallback)
+        return to_payload(ticker, multiples)
+
+
+def historical_multiples(ticker, years=5):
+    """fetch_multiples behind the shared result cache; tickers without statements or prices are cached as negative."""
+    ticker = ticker.upper()
+    return result_cache.cached(
+        "multiples", f"{ticker}:{int(years)}", lambda: fetch_multiples(ticker, years),
+        negative=lambda payload: payload is None,
+    )
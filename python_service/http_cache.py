@@ -0,0 +1,136 @@
+"""
+Conditional responses for the GET endpoints.
+
+Every JSON body gets a strong ETag (a BLAKE2b hash of the rendered bytes),
+a Last-Modified (when this process first served that ETag) and the
+Cache-Control policy of its data class. A request whose If-None-Match (or,
+without one, If-Modified-Since) still matches gets an empty 304, so a
+client holding the body revalidates without downloading or parsing it
+again.
+
+Identical data renders to identical bytes, whichever cache or snapshot it
+came from, so ETags agree across workers and restarts; Last-Modified is
+only as old as the process that answers.
+
+compressed() negotiates Accept-Encoding for bodies worth compressing:
+Brotli when the brotli package is installed, gzip otherwise.
+"""
+import gzip
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+import metrics
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Data class -> Cache-Control. Quotes move during the day, statements
+# quarterly; price histories gain one bar a day.
+CACHE_CONTROL = {
+    "financials": "public, max-age=300, stale-while-revalidate=600",
+    "prices": "public, max-age=900, stale-while-revalidate=2700",
+    "history": "public, max-age=3600, stale-while-revalidate=82800",
+    # Deadline-limited or stale-refilled answers; always revalidate
+    "partial": "no-cache",
+}
+FIRST_SEEN_MAX = 4096
+# Below this a compressed body saves less than the headers cost
+COMPRESS_MIN_BYTES = 256
+
+_first_seen = OrderedDict()
+_first_seen_lock = threading.Lock()
+
+
+def etag_for(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def first_seen(etag, now=None):
+    """When this process first served `etag`."""
+    with _first_seen_lock:
+        seen = _first_seen.get(etag)
+        if seen is None:
+            seen = _first_seen[etag] = int(now if now is not None else time.time())
+            if len(_first_seen) > FIRST_SEEN_MAX:
+                _first_seen.popitem(last=False)
+        else:
+            _first_seen.move_to_end(etag)
+        return seen
+
+
+def not_modified(request: Request, etag, modified):
+    """True if the request's validators still match; None if it sent none."""
+    match = request.headers.get("if-none-match")
+    if match is not None:
+        tags = [tag.strip() for tag in match.split(",")]
+        # If-None-Match uses weak comparison
+        return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+    since = request.headers.get("if-modified-since")
+    if since is not None:
+        try:
+            return parsedate_to_datetime(since).timestamp() >= modified
+        except (TypeError, ValueError):
+            return False
+    return None
+
+
+def respond(request: Request, content, data_class):
+    """JSONResponse for `content` with validators, or a 304 if the client's copy is current."""
+    response = JSONResponse(content=content)
+    etag = etag_for(response.body)
+    modified = first_seen(etag)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(modified, usegmt=True),
+        "Cache-Control": CACHE_CONTROL[data_class],
+    }
+    current = not_modified(request, etag, modified)
+    if current is not None:
+        metrics.record_cache("http_conditional", current)
+    if current:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
+
+
+def accepted_encoding(request: Request):
+    """"br" or "gzip" if the client accepts it (and we can produce it), else None."""
+    offered = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    for encoding in ("br", "gzip"):
+        if encoding == "br" and brotli is None:
+            continue
+        if offered.get(encoding, offered.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compressed(request: Request, content):
+    """JSONResponse for `content`, Brotli or gzip encoded when the client accepts it."""
+    response = JSONResponse(content=content)
+    response.headers["Vary"] = "Accept-Encoding"
+    encoding = accepted_encoding(request)
+    if encoding is None or len(response.body) < COMPRESS_MIN_BYTES:
+        return response
+    if encoding == "br":
+        body = brotli.compress(response.body, quality=5)
+    else:
+        body = gzip.compress(response.body, compresslevel=6, mtime=0)
+    return Response(content=body, media_type="application/json",
+                    headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
@@ -0,0 +1,288 @@
+"""
+Background valuation jobs for multi-holding portfolios.
+
+Valuing a portfolio one /dcf-valuation call per holding runs into the
+serverless request limit for large portfolios. Instead a client submits the
+portfolio, gets a job id back at once, and either polls the job or streams
+its progress as server-sent events while the holdings are valued in the
+background.
+
+Each holding is a financials fetch (through the service's usual backend:
+snapshot, result cache, upstream) plus a point DCF with the job's
+assumptions. Up to JOB_CONCURRENCY holdings are valued at once per process,
+across all jobs, each within JOB_HOLDING_TIMEOUT seconds. A holding's
+result is cached under its ticker and assumptions ("valuation" in the
+result cache), so the same ticker in the next portfolio, or in another job
+running at the same time, is valued once. Results valued from partial or
+stale-refilled financials are marked "partial" and not cached.
+
+Jobs live in the process that accepted them and are kept for
+JOB_KEEP_SECONDS after they finish. Their state is also written to the
+result cache ("jobs"), so with a shared L2 any worker can answer a poll.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+import dcf
+import metrics
+from scripts.result_cache import cache as result_cache
+
+JOB_CONCURRENCY = int(os.environ.get("JOB_CONCURRENCY", "8"))
+JOB_HOLDING_TIMEOUT = float(os.environ.get("JOB_HOLDING_TIMEOUT", "60"))
+JOB_KEEP_SECONDS = float(os.environ.get("JOB_KEEP_SECONDS", "3600"))
+JOB_MAX_HOLDINGS = int(os.environ.get("JOB_MAX_HOLDINGS", "500"))
+JOBS_MAX = 1000
+# Minimum seconds between writes of a running job's state to the result cache
+PUBLISH_INTERVAL = 1.0
+# Comment lines sent on an idle event stream so proxies don't close it
+KEEPALIVE_SECONDS = 15.0
+
+
+def assumptions_key(assumptions):
+    """Short stable key of the valuation assumptions, for the per-ticker cache."""
+    raw = json.dumps(assumptions, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.blake2b(raw, digest_size=8).hexdigest()
+
+
+def _finite(value, digits=4):
+    value = float(value)
+    return round(value, digits) if np.isfinite(value) else None
+
+
+def value_holding(financials, assumptions):
+    """Point DCF of one company: fair value per share, upside and the inputs used."""
+    a = dcf.assumptions_from_financials(
+        financials, assumptions["years"], assumptions["revenue_growth"], assumptions["fcf_margin"]
+    )
+    grids = dcf.evaluate(
+        [a],
+        np.array([assumptions["discount_rate"]]),
+        np.array([assumptions["terminal_growth"]]),
+        np.array([0.0]),
+    )
+    per_share = grids["per_share"][0, 0, 0, 0]
+    if not a["base_revenue_m"] or not np.isfinite(per_share):
+        raise ValueError("Not enough data for a DCF")
+    return {
+        "fair_value": _finite(per_share),
+        "upside_pct": _finite(grids["upside_pct"][0, 0, 0, 0]),
+        "current_price": a["current_price"],
+        "enterprise_value_m": _finite(grids["enterprise_value_m"][0, 0, 0, 0]),
+        "fair_value_m": _finite(grids["fair_value_m"][0, 0, 0, 0]),
+        "revenue_growth": a["revenue_growth"].tolist(),
+        "fcf_margin": a["fcf_margin"].tolist(),
+    }
+
+
+def summarize(holdings, results):
+    """Expected portfolio return over the holdings valued so far.
+
+    Renormalised over the valued holdings' weights, so a holding that failed
+    doesn't count as a 0% return; `valued_weight_pct` says how much of the
+    portfolio the figure covers.
+    """
+    valued = [(w, results[t]["upside_pct"]) for t, w in holdings
+              if t in results and results[t].get("upside_pct") is not None]
+    weight = sum(w for w, _ in valued)
+    return {
+        "expected_return_pct": round(sum(w * u for w, u in valued) / weight, 4) if weight > 0 else None,
+        "valued_weight_pct": round(weight, 4),
+    }
+
+
+class Job:
+    def __init__(self, holdings, assumptions):
+        self.id = uuid.uuid4().hex
+        self.holdings = holdings
+        self.assumptions = assumptions
+        self.results = {}
+        self.status = "queued"
+        self.created = time.time()
+        self.finished = None
+        self.task = None
+        self.published = 0.0
+        self.dirty = False
+        self.publisher = None
+        self.changed = asyncio.Event()
+
+    def snapshot(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created": self.created,
+            "finished": self.finished,
+            "total": len(self.holdings),
+            "completed": len(self.results),
+            "assumptions": self.assumptions,
+            "holdings": [
+                {"ticker": t, "weight": w, **self.results[t]} for t, w in self.holdings if t in self.results
+            ],
+            "summary": summarize(self.holdings, self.results),
+        }
+
+    def notify(self):
+        # Waiters hold the old event; the next change needs a fresh one
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class JobQueue:
+    """Accepts jobs and values their holdings on the running event loop.
+
+    `fetch(ticker)` is the service's async financials fetcher and
+    `run_sync(fn, *args)` runs blocking work off the loop.
+    """
+
+    def __init__(self, fetch, run_sync, concurrency=JOB_CONCURRENCY):
+        self.fetch = fetch
+        self.run_sync = run_sync
+        self.concurrency = concurrency
+        self.jobs = OrderedDict()
+        self.in_flight = {}
+        self._slots = None
+
+    def submit(self, holdings, assumptions):
+        """Start valuing [(ticker, weight)] and return the Job."""
+        self._expire()
+        job = Job(holdings, assumptions)
+        self.jobs[job.id] = job
+        job.task = asyncio.get_running_loop().create_task(self._run(job))
+        self._changed(job)
+        return job
+
+    def _changed(self, job):
+        """Wake the job's event streams and, at most every PUBLISH_INTERVAL, publish its state."""
+        job.notify()
+        now = time.monotonic()
+        if job.finished is None and now - job.published < PUBLISH_INTERVAL:
+            return
+        job.published = now
+        job.dirty = True
+        if job.publisher is None or job.publisher.done():
+            job.publisher = asyncio.get_running_loop().create_task(self._publish(job))
+
+    async def _publish(self, job):
+        # One writer per job, off the event loop, so a slow write can't land after a newer one
+        while job.dirty:
+            job.dirty = False
+            await self.run_sync(result_cache.set, "jobs", job.id, job.snapshot())
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished is not None and now - job.finished > JOB_KEEP_SECONDS:
+                del self.jobs[job_id]
+        while len(self.jobs) >= JOBS_MAX:
+            oldest = next(iter(self.jobs.values()))
+            if oldest.finished is None:
+                break
+            self.jobs.popitem(last=False)
+
+    def get(self, job_id):
+        """Job state as served to clients: this process's job, else the cached copy (None if unknown)."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        hit, snapshot = result_cache.get("jobs", job_id)
+        return snapshot if hit else None
+
+    async def _run(self, job):
+        job.status = "running"
+        self._changed(job)
+        key = assumptions_key(job.assumptions)
+
+        async def one(ticker):
+            try:
+                job.results[ticker] = await self._valuation(ticker, job.assumptions, key)
+            except asyncio.TimeoutError:
+                metrics.JOB_HOLDINGS.inc(result="failed")
+                job.results[ticker] = {"error": "Valuation timeout"}
+            except Exception as e:
+                metrics.JOB_HOLDINGS.inc(result="failed")
+                job.results[ticker] = {"error": str(e) or type(e).__name__}
+            self._changed(job)
+
+        await asyncio.gather(*(one(t) for t in dict.fromkeys(t for t, _ in job.holdings)))
+        job.status = "done"
+        job.finished = time.time()
+        self._changed(job)
+
+    async def _valuation(self, ticker, assumptions, key):
+        """Cached valuation of one ticker, computed once however many jobs want it."""
+        cache_key = f"{ticker}:{key}"
+        hit, result = await self.run_sync(result_cache.get, "valuation", cache_key)
+        metrics.record_cache("valuation", hit and result is not None)
+        if hit and result is not None:
+            metrics.JOB_HOLDINGS.inc(result="reused")
+            return result
+        pending = self.in_flight.get(cache_key)
+        if pending is None:
+            pending = self.in_flight[cache_key] = asyncio.ensure_future(self._compute(ticker, assumptions, cache_key))
+            pending.add_done_callback(lambda _: self.in_flight.pop(cache_key, None))
+        else:
+            metrics.JOB_HOLDINGS.inc(result="reused")
+        # Shielded: one job giving up doesn't cancel the valuation for the others
+        return await asyncio.shield(pending)
+
+    async def _compute(self, ticker, assumptions, cache_key):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+        async with self._slots:
+            financials = await asyncio.wait_for(self.fetch(ticker), JOB_HOLDING_TIMEOUT)
+            result = await self.run_sync(value_holding, financials, assumptions)
+        metrics.JOB_HOLDINGS.inc(result="valued")
+        if financials.get("missing") or financials.get("stale"):
+            # Valued from partial financials: good enough for this job, not for the next
+            result["partial"] = True
+        else:
+            await self.run_sync(result_cache.set, "valuation", cache_key, result)
+        return result
+
+    async def events(self, job_id):
+        """Server-sent event lines for a job: each holding as it completes, then the summary."""
+        sent = set()
+        last_keepalive = time.monotonic()
+        while True:
+            job = self.jobs.get(job_id)
+            changed = job.changed if job is not None else None
+            snapshot = job.snapshot() if job is not None else await self.run_sync(self.get, job_id)
+            if snapshot is None:
+                yield _event("error", {"job_id": job_id, "error": "Unknown job"})
+                return
+            for holding in snapshot["holdings"]:
+                if holding["ticker"] not in sent:
+                    sent.add(holding["ticker"])
+                    yield _event("holding", {
+                        "completed": len(sent), "total": snapshot["total"], **holding,
+                    })
+            if snapshot["status"] == "done":
+                yield _event("done", snapshot)
+                return
+            # This process runs the job: wake on its next change; otherwise poll the cached copy
+            try:
+                if changed is not None:
+                    await asyncio.wait_for(changed.wait(), KEEPALIVE_SECONDS)
+                else:
+                    await asyncio.sleep(PUBLISH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            if time.monotonic() - last_keepalive >= KEEPALIVE_SECONDS:
+                last_keepalive = time.monotonic()
+                yield ": keepalive\n\n"
+
+    async def stop(self):
+        tasks = [job.task for job in self.jobs.values() if job.task is not None and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data)}\n\n"
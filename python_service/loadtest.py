@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Concurrency sweep load test for python_service.
+
+Runs a fixed-duration burst of /yf requests at each concurrency level and
+ticker mix, then reports throughput, p50/p95/p99 latency and error rate.
+
+    python loadtest.py --spawn --concurrency 1,8,32,64 --mix hot,cold
+
+--spawn starts `uvicorn main:app` with FETCH_BACKEND=replay on a free port,
+so the sweep measures the service itself rather than Yahoo, and reports
+the server's peak RSS at the end. Without it, --url points at an already
+running instance.
+
+Mixes: `hot` cycles through --hot-tickers (already warm after the first
+pass), `cold` uses a fresh ticker for every request, `mixed` sends
+--cold-share of requests cold and the rest hot.
+"""
+import os
+import sys
+import json
+import math
+import time
+import socket
+import random
+import argparse
+import itertools
+import threading
+import subprocess
+from pathlib import Path
+
+import requests
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def ticker_source(mix, hot_tickers, cold_share, run_id):
+    hot = itertools.cycle(hot_tickers)
+    cold_counter = itertools.count()
+    lock = threading.Lock()
+    rng = random.Random(run_id)
+
+    def next_ticker():
+        with lock:
+            cold = mix == "cold" or (mix == "mixed" and rng.random() < cold_share)
+            if cold:
+                return f"LT{run_id}X{next(cold_counter)}"
+            return next(hot)
+    return next_ticker
+
+
+def run_level(url, concurrency, duration, next_ticker, timeout):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        nonlocal errors
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            ticker = next_ticker()
+            start = time.perf_counter()
+            ok = False
+            try:
+                resp = session.get(f"{url}/yf", params={"ticker": ticker}, timeout=timeout)
+                ok = resp.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    total = len(latencies) + errors
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000.0,
+        "p95_ms": percentile(latencies, 95) * 1000.0,
+        "p99_ms": percentile(latencies, 99) * 1000.0,
+        "error_rate": errors / total if total else 0.0,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def peak_rss_mb(pid):
+    """VmHWM of a process in MiB, None where /proc isn't available."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def spawn_replay_service(port):
+    env = dict(os.environ, FETCH_BACKEND="replay")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=str(Path(__file__).parent),
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            if requests.get(f"{url}/metrics", timeout=1).status_code == 200:
+                return proc, url
+        except requests.RequestException:
+            pass
+        if proc.poll() is not None:
+            break
+        time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("replay service did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrency sweep for python_service /yf")
+    parser.add_argument("--url", default="http://127.0.0.1:10000")
+    parser.add_argument("--spawn", action="store_true", help="start a replay-backed service on a free port")
+    parser.add_argument("--concurrency", default="1,4,16,32,64")
+    parser.add_argument("--mix", default="hot,cold,mixed")
+    parser.add_argument("--hot-tickers", default="AAPL,MSFT,NVDA,AMZN,META,TSLA,JNJ,WMT")
+    parser.add_argument("--cold-share", type=float, default=0.2)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per level")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    mixes = [m.strip() for m in args.mix.split(",") if m.strip()]
+    hot_tickers = [t.strip().upper() for t in args.hot_tickers.split(",") if t.strip()]
+
+    proc = None
+    url = args.url.rstrip("/")
+    if args.spawn:
+        proc, url = spawn_replay_service(free_port())
+
+    results = []
+    try:
+        for mix in mixes:
+            # Warm the hot set once so "hot" really measures warm requests
+            for ticker in hot_tickers:
+                try:
+                    requests.get(f"{url}/yf", params={"ticker": ticker}, timeout=args.timeout)
+                except requests.RequestException:
+                    pass
+            for run_id, level in enumerate(levels):
+                next_ticker = ticker_source(mix, hot_tickers, args.cold_share, f"{mix[0]}{run_id}P{os.getpid()}")
+                row = run_level(url, level, args.duration, next_ticker, args.timeout)
+                row["mix"] = mix
+                if proc is not None:
+                    # High-water mark so far, so each row shows the peak up to its level
+                    row["server_peak_rss_mb"] = peak_rss_mb(proc.pid)
+                results.append(row)
+                if not args.json:
+                    sys.stderr.write(
+                        f"{mix:>6} c={level:<4} {row['throughput_rps']:8.1f} req/s  "
+                        f"p50={row['p50_ms']:8.1f}ms p95={row['p95_ms']:8.1f}ms "
+                        f"p99={row['p99_ms']:8.1f}ms err={row['error_rate'] * 100:5.1f}%\n"
+                    )
+    finally:
+        if proc is not None:
+            peak = peak_rss_mb(proc.pid)
+            if peak is not None and not args.json:
+                sys.stderr.write(f"server peak RSS {peak:.1f}MB\n")
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    if args.json:
+        print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,47 @@
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+import os
 import sys
+import asyncio
+import time
 from pathlib import Path
+from typing import Annotated
 
 # Add parent directory to path to import scripts module
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 # Reuse existing logic from the repo
-from scripts.fetch_yfinance import fetch_financials
+from scripts.fetch_yfinance import fetch_financials, cached_financials, cache_financials
+from scripts.timing import span
+from scripts.fetch_portfolio_prices import fetch_prices_cached
+from scripts import price_sampling
+from scripts import fetch_yfinance as yfinance_fetcher
+
+import metrics
+import profiling
+import replay
+import yahoo_async
+import historical_multiples
+import dcf
+import montecarlo
+import optimizer
+import risk
+import covariance_store
+import factors
+import snapshot
+import screener
+import peer_multiples
+import prewarm
+import shared_data
+import http_cache
+import price_store
+import jobs
 
 app = FastAPI()
+# Every endpoint can be sampled on demand (see profiling.py)
+app.router.route_class = profiling.ProfilingRoute
 
 # Add CORS middleware to allow requests from localhost:3000
 app.add_middleware(
@@ -19,14 +50,576 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified"],
 )
 
+metrics.install()
+# Workers started by shared_loader.py read FX rates from its shared table
+yfinance_fetcher.fx_table_lookup = shared_data.fx_rate
+app.middleware("http")(profiling.profile_middleware)
+
+
+def path_is_routed(path):
+    return any(getattr(route, "path", None) == path for route in app.routes)
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # Only known routes get their own in-flight series; probes and typos share one
+    path = request.url.path if path_is_routed(request.url.path) else "unmatched"
+    metrics.IN_FLIGHT.inc(path=path)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.IN_FLIGHT.dec(path=path)
+        route = request.scope.get("route")
+        # Label by route template so unknown paths don't explode cardinality
+        label = getattr(route, "path", "unmatched")
+        metrics.REQUEST_LATENCY.observe(
+            time.perf_counter() - start, path=label, method=request.method, status=status
+        )
+
+
+# FETCH_BACKEND picks where /yf data comes from: yfinance (default), async, replay or record
+FETCH_BACKEND = os.environ.get("FETCH_BACKEND", "yfinance").lower()
+if FETCH_BACKEND == "replay":
+    sync_fetch = replay.replay_financials
+elif FETCH_BACKEND == "record":
+    sync_fetch = replay.record_financials(fetch_financials)
+else:
+    sync_fetch = fetch_financials
+
+
+# Replays stand in for Yahoo itself, so they skip the result cache and pre-warming
+USE_RESULT_CACHE = FETCH_BACKEND not in ("replay", "record")
+
+
+async def fetch_upstream(ticker, deadline=None):
+    if FETCH_BACKEND == "async":
+        return await yahoo_async.fetch_financials(ticker, deadline=deadline)
+    # The blocking fetchers run in the threadpool, as a sync endpoint would
+    return await profiling.run_sync(sync_fetch, ticker, deadline=deadline)
+
+
+async def fetch_backend(ticker, deadline=None):
+    prewarm.popularity.record(ticker)
+    # Tickers covered by the nightly bulk refresh are answered from its snapshot
+    payload, _ = snapshot.lookup(ticker)
+    if payload is not None:
+        return payload
+    if USE_RESULT_CACHE:
+        hit, payload = await profiling.run_sync(cached_financials, ticker)
+        if hit:
+            return payload
+    payload = await fetch_upstream(ticker, deadline=deadline)
+    if USE_RESULT_CACHE:
+        await profiling.run_sync(cache_financials, ticker, payload)
+        prewarm.note_fetched("financials", ticker)
+    return payload
+
+
+@app.on_event("startup")
+async def start_prewarm():
+    if USE_RESULT_CACHE:
+        prewarm.start(fetch_upstream, profiling.run_sync)
+
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    await prewarm.stop()
+    await valuation_jobs.stop()
+    await yahoo_async.close_client()
+    montecarlo.shutdown_pool()
+
 
 @app.get("/yf")
-def yf(ticker: str | None = None):
+async def yf(request: Request, ticker: str | None = None, deadline: float | None = None):
+    """Financials for one ticker. `deadline` (seconds) returns partial data in time."""
+    if not ticker:
+        raise HTTPException(status_code=400, detail="Missing ticker")
+    if deadline is not None and deadline <= 0:
+        raise HTTPException(status_code=400, detail="deadline must be positive")
+    data = await fetch_backend(ticker, deadline=deadline)
+    with span("serialization", ticker=ticker):
+        partial = data.get("missing") or data.get("stale")
+        response = http_cache.respond(request, data, "partial" if partial else "financials")
+    return response
+
+
+@app.get("/historical-multiples")
+def historical_multiples_endpoint(request: Request, ticker: str | None = None, years: int = 5):
+    """Daily P/E, EV/EBITDA, EV/Sales and P/FCF over the last `years` years."""
+    if not ticker:
+        raise HTTPException(status_code=400, detail="Missing ticker")
+    if not 1 <= years <= 20:
+        raise HTTPException(status_code=400, detail="years must be between 1 and 20")
+    data = historical_multiples.historical_multiples(ticker.upper(), years)
+    if data is None:
+        raise HTTPException(status_code=404, detail="No quarterly statements or price history for ticker")
+    return http_cache.respond(request, data, "history")
+
+
+@app.get("/prices")
+async def prices(
+    request: Request,
+    tickers: str | None = None,
+    interval: str = "daily",
+    lookback: str | None = None,
+    points: int | None = None,
+):
+    """Close histories for comma-separated tickers, optionally resampled and downsampled."""
+    symbols = list(dict.fromkeys(t.strip().upper() for t in (tickers or "").split(",") if t.strip()))
+    if not symbols:
+        raise HTTPException(status_code=400, detail="Missing tickers")
+    if interval not in price_sampling.INTERVALS:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {', '.join(price_sampling.INTERVALS)}")
+    if points is not None and points < 3:
+        raise HTTPException(status_code=400, detail="points must be at least 3")
+    try:
+        price_sampling.parse_lookback(lookback)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    data = await profiling.run_sync(fetch_prices_cached, symbols, False, interval, lookback, points)
+    with span("serialization", tickers=len(symbols)):
+        response = http_cache.respond(request, data, "prices")
+    return response
+
+
+class PriceDeltaRequest(BaseModel):
+    # Defaults to the token's tickers
+    tickers: list[str] = []
+    # {ticker: last date held}, for clients without a token
+    since: dict[str, str] | None = None
+    # From the previous response
+    token: str | None = None
+
+
+@app.post("/prices/delta")
+async def prices_delta(request: Request, body: PriceDeltaRequest):
+    """New and restated daily closes since a sync token or per-ticker dates, plus the next token."""
+    tickers = [t.strip() for t in body.tickers if t.strip()]
+    if not tickers and not body.token:
+        raise HTTPException(status_code=400, detail="Missing tickers")
+    try:
+        data = await profiling.run_sync(price_store.sync, tickers, body.since, body.token)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    with span("serialization", tickers=len(data["prices"])):
+        response = http_cache.compressed(request, data)
+    return response
+
+
+# A percent for every projection year, or one list of them (the last repeats)
+PerYear = float | Annotated[list[float], Field(min_length=1)] | None
+
+
+class DCFCompany(BaseModel):
+    ticker: str
+    # fetch_financials output; fetched through the configured backend when omitted
+    financials: dict | None = None
+    revenue_growth: PerYear = None
+    fcf_margin: PerYear = None
+
+
+class DCFGridRequest(BaseModel):
+    companies: list[DCFCompany]
+    years: int = dcf.DEFAULT_YEARS
+    # Each grid is a list of percents or {"start", "stop", "num"}
+    discount_rates: list[float] | dict | None = None
+    terminal_growths: list[float] | dict | None = None
+    margin_shifts: list[float] | dict | None = None
+
+
+@app.post("/dcf/grid")
+async def dcf_grid_endpoint(body: DCFGridRequest):
+    """Fair value sensitivity tables (discount x terminal growth x margin shift)."""
+    if not body.companies:
+        raise HTTPException(status_code=400, detail="No companies given")
+    if not 1 <= body.years <= 30:
+        raise HTTPException(status_code=400, detail="years must be between 1 and 30")
+    try:
+        rates = dcf.grid_values(body.discount_rates, {"start": 6, "stop": 14, "num": 17})
+        growths = dcf.grid_values(body.terminal_growths, {"start": 1, "stop": 4, "num": 7})
+        shifts = dcf.grid_values(body.margin_shifts, [0.0])
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid grid: {e}")
+    if len(body.companies) * rates.size * growths.size * shifts.size > dcf.DCF_MAX_CELLS:
+        raise HTTPException(status_code=400, detail="Grid too large")
+
+    missing = [c for c in body.companies if c.financials is None]
+    fetched = await asyncio.gather(*(fetch_backend(c.ticker.upper()) for c in missing))
+    for company, financials in zip(missing, fetched):
+        company.financials = financials
+
+    assumptions = [
+        dcf.assumptions_from_financials(c.financials, body.years, c.revenue_growth, c.fcf_margin)
+        for c in body.companies
+    ]
+    grids = await profiling.run_sync(dcf.evaluate, assumptions, rates, growths, shifts)
+
+    results = []
+    for i, (company, a) in enumerate(zip(body.companies, assumptions)):
+        results.append({
+            "ticker": company.ticker.upper(),
+            "assumptions": {
+                "base_revenue_m": a["base_revenue_m"],
+                "revenue_growth": a["revenue_growth"].tolist(),
+                "fcf_margin": a["fcf_margin"].tolist(),
+                "net_debt_m": a["net_debt_m"],
+                "shares_outstanding": a["shares_outstanding"],
+                "current_price": a["current_price"],
+            },
+            **{name: dcf.json_grid(grid[i]) for name, grid in grids.items()},
+        })
+    return JSONResponse(content={
+        "discount_rates": rates.tolist(),
+        "terminal_growths": growths.tolist(),
+        "margin_shifts": shifts.tolist(),
+        "shape": ["discount_rate", "terminal_growth", "margin_shift"],
+        "results": results,
+    })
+
+
+class MonteCarloRequest(BaseModel):
+    ticker: str
+    financials: dict | None = None
+    paths: int = 1_000_000
+    seed: int = 0
+    years: int = dcf.DEFAULT_YEARS
+    discount_rate_band: list[float] = [8.0, 12.0]
+    terminal_growth: float = 2.5
+    revenue_growth: PerYear = None
+    fcf_margin: PerYear = None
+    growth_vol: float | None = None
+    margin_vol: float | None = None
+
+
+@app.post("/montecarlo")
+async def montecarlo_endpoint(body: MonteCarloRequest):
+    """Distribution of per-share fair values from simulated DCF paths."""
+    if not 1 <= body.paths <= montecarlo.MAX_PATHS:
+        raise HTTPException(status_code=400, detail=f"paths must be between 1 and {montecarlo.MAX_PATHS}")
+    if not 1 <= body.years <= 30:
+        raise HTTPException(status_code=400, detail="years must be between 1 and 30")
+    band = body.discount_rate_band
+    if len(band) != 2 or not 0 < band[0] <= band[1]:
+        raise HTTPException(status_code=400, detail="discount_rate_band must be [low, high] in percent")
+
+    financials = body.financials or await fetch_backend(body.ticker.upper())
+    params = montecarlo.params_from_financials(
+        financials, body.years, body.revenue_growth, body.fcf_margin,
+        band, body.terminal_growth, body.growth_vol, body.margin_vol,
+    )
+    if params["shares_outstanding"] <= 0 or params["base_revenue_m"] <= 0:
+        raise HTTPException(status_code=422, detail="Not enough financial data to simulate")
+
+    start = time.perf_counter()
+    summary = await profiling.run_sync(montecarlo.simulate, params, body.paths, body.seed)
+    summary["elapsed_ms"] = round((time.perf_counter() - start) * 1000.0, 1)
+    summary["ticker"] = body.ticker.upper()
+    summary["params"] = params
+    return JSONResponse(content=summary)
+
+
+class OptimizeRequest(BaseModel):
+    tickers: list[str]
+    expected_returns: dict[str, float] | None = None
+    upsides: dict[str, float] | None = None
+    horizon_years: float = 5.0
+    bounds: dict | None = None
+    risk_free_rate: float = 4.0
+    frontier_points: int = 20
+    lookback_days: int = 756
+
+
+def run_optimizer(body):
+    model, cached = optimizer.get_model(body.tickers, body.lookback_days)
+    mu = optimizer.expected_returns(model, body.expected_returns, body.upsides, body.horizon_years)
+    lower, upper = optimizer.weight_bounds(model, body.bounds)
+    with span("optimize", holdings=len(model.tickers)):
+        result = optimizer.optimize(model, mu, lower, upper, body.risk_free_rate / 100.0, body.frontier_points)
+    result.update({
+        "tickers": model.tickers,
+        "expected_returns": {t: float(m) * 100.0 for t, m in zip(model.tickers, mu)},
+        "as_of": model.as_of,
+        "observations": model.observations,
+        "covariance_cached": cached,
+    })
+    return result
+
+
+@app.post("/portfolio/optimize")
+async def portfolio_optimize(body: OptimizeRequest):
+    """Efficient frontier, max-Sharpe and min-variance weights for a holdings set."""
+    tickers = sorted({t.strip().upper() for t in body.tickers if t.strip()})
+    if len(tickers) < 2:
+        raise HTTPException(status_code=400, detail="At least two tickers are required")
+    if not 2 <= body.frontier_points <= 200:
+        raise HTTPException(status_code=400, detail="frontier_points must be between 2 and 200")
+    body.tickers = tickers
+    try:
+        result = await profiling.run_sync(run_optimizer, body)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return JSONResponse(content=result)
+
+
+class RollingRiskRequest(BaseModel):
+    tickers: list[str]
+    # {ticker: weight}; equal weights when omitted
+    weights: dict[str, float] | None = None
+    windows: list[int] = list(risk.DEFAULT_WINDOWS)
+    benchmark: str = risk.BENCHMARK
+    risk_free_rate: float = risk.DEFAULT_RISK_FREE_PCT
+    # Only return the most recent `points` rows of each series
+    points: int | None = None
+    include_series: bool = True
+
+
+@app.post("/risk/rolling")
+async def rolling_risk_endpoint(body: RollingRiskRequest):
+    """Rolling volatility, beta, Sharpe and max drawdown per holding and for the portfolio."""
+    tickers = [t.strip().upper() for t in body.tickers if t.strip()]
+    if not tickers:
+        raise HTTPException(status_code=400, detail="No tickers given")
+    if not body.windows or any(not 2 <= w <= 2520 for w in body.windows):
+        raise HTTPException(status_code=400, detail="windows must be between 2 and 2520 days")
+    if body.points is not None and body.points < 1:
+        raise HTTPException(status_code=400, detail="points must be positive")
+    try:
+        data = await profiling.run_sync(
+            risk.rolling_risk, tickers, body.weights, body.windows, body.benchmark,
+            body.risk_free_rate, body.points, body.include_series,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return JSONResponse(content=data)
+
+
+class PortfolioRiskRequest(BaseModel):
+    # {ticker: weight}
+    weights: dict[str, float]
+    benchmark: str = risk.BENCHMARK
+
+
+def portfolio_risk(weights, benchmark):
+    store = covariance_store.get_store(list(weights), benchmark)
+    tickers = list(weights)
+    summary = store.portfolio(weights, benchmark)
+    summary.update({
+        "benchmark": benchmark,
+        "betas": store.betas(benchmark, tickers),
+        "tickers": tickers,
+        "correlation": dcf.json_grid(store.correlation(tickers)),
+    })
+    return summary
+
+
+@app.post("/risk/portfolio")
+async def portfolio_risk_endpoint(body: PortfolioRiskRequest):
+    """Volatility, beta and correlations read from the incremental covariance store."""
+    weights = {t.strip().upper(): w for t, w in body.weights.items() if t.strip()}
+    if not weights:
+        raise HTTPException(status_code=400, detail="No weights given")
+    try:
+        data = await profiling.run_sync(portfolio_risk, weights, body.benchmark.upper())
+    except KeyError as e:
+        raise HTTPException(status_code=422, detail=f"No price history: {e.args[0]}")
+    return JSONResponse(content=data)
+
+
+class FactorRiskRequest(BaseModel):
+    # {name: {ticker: weight}}
+    portfolios: dict[str, dict[str, float]]
+    # Tickers to fit the factors on; the portfolios' holdings are always included
+    universe: list[str] = []
+    factors: int = factors.DEFAULT_FACTORS
+    lookback_days: int = 756
+
+
+def factor_risk(body):
+    portfolios = {
+        name: {t.strip().upper(): w for t, w in weights.items() if t.strip()}
+        for name, weights in body.portfolios.items()
+    }
+    holdings = {t for weights in portfolios.values() for t in weights}
+    universe = {t.strip().upper() for t in body.universe if t.strip()} | holdings
+    model, cached = factors.get_model(universe, body.factors, body.lookback_days)
+    results, missing = {}, set()
+    for name, weights in portfolios.items():
+        try:
+            results[name] = model.decompose(weights)
+        except KeyError as e:
+            missing.update(e.args[0].split(", "))
+    return {
+        "as_of": model.as_of,
+        "observations": model.observations,
+        "universe_size": len(model.tickers),
+        "factor_volatility": model.factor_volatility().tolist(),
+        "explained_variance_ratio": model.explained_ratio.tolist(),
+        "portfolios": results,
+        "holdings": model.ticker_summary(sorted(holdings - missing)),
+        "missing": sorted(missing),
+        "model_cached": cached,
+    }
+
+
+@app.post("/risk/factors")
+async def factor_risk_endpoint(body: FactorRiskRequest):
+    """Systematic vs idiosyncratic variance and factor exposures per portfolio."""
+    if not body.portfolios:
+        raise HTTPException(status_code=400, detail="No portfolios given")
+    if not 1 <= body.factors <= 50:
+        raise HTTPException(status_code=400, detail="factors must be between 1 and 50")
+    try:
+        data = await profiling.run_sync(factor_risk, body)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return JSONResponse(content=data)
+
+
+class ScreenRequest(BaseModel):
+    # e.g. ["ebitda_margin_pct > 30", "revenue_growth_pct > 15%"]
+    filters: list[str] = []
+    # column, "-column" or "column asc|desc"; descending by default
+    sort: str | None = None
+    offset: int = 0
+    limit: int = 50
+    columns: list[str] | None = None
+
+
+def run_screen(body):
+    universe = screener.current_universe()
+    if universe is None:
+        raise LookupError("No universe snapshot has been published")
+    try:
+        filters = [screener.parse_filter(f, universe.columns) for f in body.filters]
+        sort, descending = screener.parse_sort(body.sort, universe.columns)
+        unknown = [c for c in body.columns or [] if c not in universe.columns]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    with span("screen", filters=len(filters), universe=universe.size):
+        return screener.screen(universe, filters, sort, descending, body.offset, body.limit, body.columns)
+
+
+@app.post("/screener")
+async def screener_endpoint(body: ScreenRequest):
+    """Filter, sort and page the published universe snapshot."""
+    if body.offset < 0 or not 1 <= body.limit <= screener.MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"offset must be >= 0 and limit between 1 and {screener.MAX_LIMIT}")
+    try:
+        data = await profiling.run_sync(run_screen, body)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return JSONResponse(content=data)
+
+
+class PeerMultiplesRequest(BaseModel):
+    ticker: str
+    # Figures to apply the multiples to instead of fy24, e.g. a forecast's exit year
+    metrics: dict[str, float] | None = None
+
+
+@app.post("/peer-multiples")
+async def peer_multiples_endpoint(body: PeerMultiplesRequest):
+    """Sector/industry quartile P/E, EV/EBITDA, EV/FCF and EV/Sales applied to a company."""
+    ticker = body.ticker.strip().upper()
     if not ticker:
         raise HTTPException(status_code=400, detail="Missing ticker")
-    data = fetch_financials(ticker)
+    unknown = set(body.metrics or {}) - {"eps", "ebitda", "fcf", "revenue", "shares_outstanding"}
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown metrics: {', '.join(sorted(unknown))}")
+    index = await profiling.run_sync(peer_multiples.current_index)
+    if index is None:
+        raise HTTPException(status_code=404, detail="No universe snapshot has been published")
+    payload = await fetch_backend(ticker)
+    with span("peer_multiples", ticker=ticker):
+        data = peer_multiples.value(index, payload, body.metrics, ticker)
+    data["ticker"] = ticker
+    return JSONResponse(content=data)
+
+
+valuation_jobs = jobs.JobQueue(fetch_backend, profiling.run_sync)
+
+
+class JobHolding(BaseModel):
+    ticker: str
+    # Percent of the portfolio; equal weights when no holding gives one
+    weight: float | None = None
+
+
+class PortfolioValuationRequest(BaseModel):
+    holdings: list[JobHolding]
+    years: int = dcf.DEFAULT_YEARS
+    discount_rate: float = 10.0
+    terminal_growth: float = 2.5
+    # Derived from each company's history when omitted
+    revenue_growth: PerYear = None
+    fcf_margin: PerYear = None
+
+
+@app.post("/jobs/portfolio-valuation", status_code=202)
+async def submit_portfolio_valuation(body: PortfolioValuationRequest):
+    """Start valuing every holding in the background; poll /jobs/{id} or stream /jobs/{id}/events."""
+    holdings = [(h.ticker.strip().upper(), h.weight) for h in body.holdings if h.ticker.strip()]
+    if not holdings:
+        raise HTTPException(status_code=400, detail="No holdings given")
+    if len(holdings) > jobs.JOB_MAX_HOLDINGS:
+        raise HTTPException(status_code=400, detail=f"At most {jobs.JOB_MAX_HOLDINGS} holdings per job")
+    if not 1 <= body.years <= 30:
+        raise HTTPException(status_code=400, detail="years must be between 1 and 30")
+    if body.discount_rate <= body.terminal_growth:
+        raise HTTPException(status_code=400, detail="discount_rate must exceed terminal_growth")
+    if all(w is None for _, w in holdings):
+        holdings = [(t, 100.0 / len(holdings)) for t, _ in holdings]
+    elif any(w is None for _, w in holdings):
+        raise HTTPException(status_code=400, detail="Give a weight for every holding or for none")
+    job = valuation_jobs.submit(holdings, {
+        "years": body.years,
+        "discount_rate": body.discount_rate,
+        "terminal_growth": body.terminal_growth,
+        "revenue_growth": body.revenue_growth,
+        "fcf_margin": body.fcf_margin,
+    })
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job.id, "status": job.status, "total": len(holdings)},
+        headers={"Location": f"/jobs/{job.id}"},
+    )
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Progress, per-holding results so far and the portfolio summary of a job."""
+    data = await profiling.run_sync(valuation_jobs.get, job_id)
+    if data is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
     return JSONResponse(content=data)
 
 
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """The job's progress as server-sent events: one per holding, then "done"."""
+    return StreamingResponse(
+        valuation_jobs.events(job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+if FETCH_BACKEND == "replay":
+    @app.post("/replay/reset")
+    def replay_reset():
+        replay.reset()
+        return {"ok": True}
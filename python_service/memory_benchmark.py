@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Peak-memory benchmark for loading price histories.
+
+Loads --tickers synthetic 5-year daily histories through each price path
+and reports wall time and peak RSS, every mode in a fresh process so the
+peaks don't mask each other:
+
+    python memory_benchmark.py --tickers 1000 --modes rows,float64,float32
+
+    rows      fetch_prices_cached + close_matrix: [{date, close}] lists first
+    float64   fetch_close_matrix, the path load_closes takes
+    float32   fetch_close_matrix with dtype=float32
+
+Downloads come from replay.synthetic_download (no Yahoo, no rate limit);
+the result cache runs with its default backend. `baseline_mb` is the RSS
+after imports, so peak_mb - baseline_mb is what the load itself cost.
+"""
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+MODES = ("rows", "float64", "float32")
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return peak_rss_mb()
+
+
+def run_mode(mode, count):
+    """Load `count` tickers in this process; returns the result row."""
+    import replay
+    import price_matrix
+    from scripts import fetch_portfolio_prices as prices
+
+    def download(chunk, start_date, end_date):
+        return replay.synthetic_download(chunk, start_date, end_date)
+
+    prices._download = download
+    tickers = [f"BM{i:05d}" for i in range(count)]
+    baseline = current_rss_mb()
+    started = time.perf_counter()
+    if mode == "rows":
+        frame = price_matrix.close_matrix(prices.fetch_prices_cached(tickers))
+    else:
+        frame = prices.fetch_close_matrix(tickers, dtype=mode)
+    elapsed = time.perf_counter() - started
+    return {
+        "mode": mode,
+        "tickers": frame.shape[1],
+        "days": frame.shape[0],
+        "seconds": elapsed,
+        "matrix_mb": frame.memory_usage(index=True, deep=True).sum() / 2**20,
+        "baseline_mb": baseline,
+        "peak_mb": peak_rss_mb(),
+    }
+
+
+def spawn_mode(mode, count):
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child", mode, "--tickers", str(count)],
+        cwd=str(Path(__file__).parent), capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{mode} run failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Peak RSS of the price loading paths")
+    parser.add_argument("--tickers", type=int, default=1000)
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.stderr = open(os.devnull, "w")
+        print(json.dumps(run_mode(args.child, args.tickers)))
+        return
+
+    results = []
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        if mode not in MODES:
+            parser.error(f"unknown mode {mode!r} (use {', '.join(MODES)})")
+        row = spawn_mode(mode, args.tickers)
+        results.append(row)
+        if not args.json:
+            sys.stderr.write(
+                f"{mode:>8} {row['tickers']:5d} tickers x {row['days']:5d} days  {row['seconds']:6.1f}s  "
+                f"matrix={row['matrix_mb']:7.1f}MB  peak={row['peak_mb']:7.1f}MB "
+                f"(+{row['peak_mb'] - row['baseline_mb']:.1f}MB over imports)\n"
+            )
+    if args.json:
+        print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
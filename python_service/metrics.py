@@ -0,0 +1,268 @@
+"""
+Minimal Prometheus metrics for python_service.
+
+Counters, gauges and histograms are kept in-process and rendered in the
+Prometheus text exposition format by `/metrics`. Stage spans from
+scripts.timing are recorded automatically once `install()` has run.
+"""
+import threading
+from bisect import bisect_left
+
+from scripts.timing import add_listener
+
+# Latency buckets in seconds, spanning cache hits up to the 60s Vercel budget
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_str(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _fmt(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}_total{_label_str(self.labelnames, key)} {_fmt(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def total(self):
+        """Sum over every label set (e.g. all in-flight requests)."""
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_label_str(self.labelnames, key)} {_fmt(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._values.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                labels = _label_str(self.labelnames, key, (("le", _fmt(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            base = _label_str(self.labelnames, key)
+            lines.append(f"{self.name}_sum{base} {_fmt(total)}")
+            lines.append(f"{self.name}_count{base} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        lines.extend(_cache_ratio_lines())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    "fincast_http_request_duration_seconds",
+    "End-to-end latency of python_service requests.",
+    ("path", "method", "status"),
+))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "fincast_http_requests_in_flight",
+    "Requests currently being handled.",
+    ("path",),
+))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "fincast_stage_duration_seconds",
+    "Latency of individual fetch stages (download, statements, info, FX, ...).",
+    ("stage",),
+))
+UPSTREAM_ERRORS = REGISTRY.register(Counter(
+    "fincast_upstream_errors",
+    "Fetch stages that failed, by stage and exception type.",
+    ("stage", "error"),
+))
+PREWARM_REFRESHES = REGISTRY.register(Counter(
+    "fincast_prewarm_refreshes",
+    "Background refreshes of popular tickers by data kind and result.",
+    ("kind", "result"),
+))
+HEDGED_REQUESTS = REGISTRY.register(Counter(
+    "fincast_upstream_hedges",
+    "Hedged upstream calls by endpoint and whether the hedge won, lost or both failed.",
+    ("endpoint", "outcome"),
+))
+BREAKER_EVENTS = REGISTRY.register(Counter(
+    "fincast_circuit_breaker_events",
+    "Circuit breaker transitions (open, half_open, closed) and rejected calls, by endpoint.",
+    ("endpoint", "outcome"),
+))
+BREAKER_STATE = REGISTRY.register(Gauge(
+    "fincast_circuit_breaker_state",
+    "Circuit breaker state per upstream endpoint: 0 closed, 1 half-open, 2 open.",
+    ("endpoint",),
+))
+JOB_HOLDINGS = REGISTRY.register(Counter(
+    "fincast_job_holdings",
+    "Holdings of portfolio valuation jobs by result (valued, reused, failed).",
+    ("result",),
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "fincast_cache_requests",
+    "Cache lookups by cache tier and result (hit/miss).",
+    ("cache", "result"),
+))
+
+
+def record_cache(cache, hit):
+    """Count a cache lookup; the hit ratio is derived at render time."""
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def _cache_ratio_lines():
+    with CACHE_REQUESTS._lock:
+        values = dict(CACHE_REQUESTS._values)
+    caches = sorted({cache for cache, _ in values})
+    if not caches:
+        return []
+    lines = [
+        "# HELP fincast_cache_hit_ratio Share of cache lookups served from the cache.",
+        "# TYPE fincast_cache_hit_ratio gauge",
+    ]
+    for cache in caches:
+        hits = values.get((cache, "hit"), 0.0)
+        total = hits + values.get((cache, "miss"), 0.0)
+        ratio = hits / total if total else 0.0
+        lines.append(f'fincast_cache_hit_ratio{{cache="{_escape(cache)}"}} {_fmt(ratio)}')
+    return lines
+
+
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+def _record_event(record):
+    stage = record.get("stage")
+    if stage == "hedge":
+        HEDGED_REQUESTS.inc(endpoint=record.get("endpoint", "unknown"), outcome=record.get("outcome", "unknown"))
+    elif stage == "breaker":
+        endpoint = record.get("endpoint", "unknown")
+        BREAKER_EVENTS.inc(endpoint=endpoint, outcome=record.get("outcome", "unknown"))
+        if record.get("state") in BREAKER_STATES:
+            BREAKER_STATE.set(BREAKER_STATES[record["state"]], endpoint=endpoint)
+
+
+def _record_span(record):
+    if record.get("event"):
+        _record_event(record)
+        return
+    stage = record.get("stage", "unknown")
+    STAGE_LATENCY.observe(record.get("duration_ms", 0.0) / 1000.0, stage=stage)
+    if record.get("status") == "error":
+        UPSTREAM_ERRORS.inc(stage=stage, error=record.get("error", "unknown"))
+    if "cache_hit" in record:
+        record_cache(record.get("cache", stage), record["cache_hit"])
+
+
+_installed = False
+
+
+def install():
+    """Start recording scripts.timing spans. Safe to call more than once."""
+    global _installed
+    if not _installed:
+        add_listener(_record_span)
+        _installed = True
+
+
+def render():
+    return REGISTRY.render()
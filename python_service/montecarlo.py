@@ -0,0 +1,133 @@
+"""
+Monte Carlo DCF simulator.
+
+Each path draws a revenue growth and an FCF margin for every projection
+year, with the spread taken from the volatility of the company's
+`historical_financials`, and draws its discount rate uniformly from a
+band. Paths are evaluated in fixed-size vectorized chunks, so memory stays
+at roughly chunk_size x years floats per worker. Chunks are spread over a
+process pool.
+
+Chunk i always uses the i-th child of SeedSequence(seed), so results are
+identical for a given seed regardless of how many workers run them.
+"""
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import dcf
+
+DEFAULT_CHUNK_SIZE = 250_000
+MAX_PATHS = 20_000_000
+# Spread used when there isn't enough history to measure volatility, in pp
+DEFAULT_GROWTH_VOL = 5.0
+DEFAULT_MARGIN_VOL = 3.0
+MIN_DISCOUNT_SPREAD = 0.5  # terminal growth is kept at least this far below the discount rate
+PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+
+MC_WORKERS = int(os.environ.get("MC_WORKERS", "0")) or os.cpu_count() or 1
+
+_pool = None
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the service process has live threads
+        _pool = ProcessPoolExecutor(max_workers=MC_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def volatility_from_history(history):
+    """Std dev (pp) of historical revenue growth and FCF margin."""
+    growths = [float(row.get("revenueGrowth") or 0.0) for row in history[1:]]
+    margins = [float(row.get("fcfMargin") or 0.0) for row in history]
+    growth_vol = float(np.std(growths, ddof=1)) if len(growths) >= 2 else DEFAULT_GROWTH_VOL
+    margin_vol = float(np.std(margins, ddof=1)) if len(margins) >= 2 else DEFAULT_MARGIN_VOL
+    return max(growth_vol, 0.5), max(margin_vol, 0.25)
+
+
+def simulate_chunk(params, seed_seq, size):
+    """Per-share fair values for `size` paths (float32)."""
+    rng = np.random.Generator(np.random.PCG64(seed_seq))
+    growth_mean = np.asarray(params["revenue_growth"]) / 100.0
+    margin_mean = np.asarray(params["fcf_margin"]) / 100.0
+    years = growth_mean.size
+
+    growth = rng.normal(growth_mean, params["growth_vol"] / 100.0, size=(size, years))
+    margin = rng.normal(margin_mean, params["margin_vol"] / 100.0, size=(size, years))
+    np.clip(margin, -0.5, 0.8, out=margin)
+    low, high = params["discount_band"]
+    r = rng.uniform(low / 100.0, high / 100.0, size=size)
+    g = np.minimum(params["terminal_growth"] / 100.0, r - MIN_DISCOUNT_SPREAD / 100.0)
+
+    revenue = params["base_revenue_m"] * np.cumprod(1.0 + growth, axis=1)
+    fcf = revenue * margin
+    discount = (1.0 + r)[:, None] ** -np.arange(1, years + 1)[None, :]
+    ev = (fcf * discount).sum(axis=1) + fcf[:, -1] * (1.0 + g) / (r - g) * discount[:, -1]
+    equity = ev - params["net_debt_m"]
+    return (equity * 1_000_000.0 / params["shares_outstanding"]).astype(np.float32)
+
+
+def _run_chunk(args):
+    return simulate_chunk(*args)
+
+
+def simulate(params, paths, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, parallel=True):
+    """Run `paths` simulations and summarize the per-share fair value distribution."""
+    paths = int(min(max(paths, 1), MAX_PATHS))
+    chunk_size = int(max(1_000, chunk_size))
+    sizes = [chunk_size] * (paths // chunk_size)
+    if paths % chunk_size:
+        sizes.append(paths % chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(params, s, n) for s, n in zip(seeds, sizes)]
+
+    if parallel and len(jobs) > 1 and MC_WORKERS > 1:
+        chunks = list(_get_pool().map(_run_chunk, jobs))
+    else:
+        chunks = [_run_chunk(job) for job in jobs]
+    values = np.concatenate(chunks)
+
+    finite = values[np.isfinite(values)]
+    price = params.get("current_price") or 0.0
+    summary = {
+        "paths": int(values.size),
+        "mean": float(finite.mean()) if finite.size else None,
+        "std": float(finite.std()) if finite.size else None,
+        "percentiles": {
+            f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(finite, PERCENTILES))
+        } if finite.size else {},
+        "current_price": price,
+        "prob_above_price": float((finite > price).mean()) if finite.size and price > 0 else None,
+    }
+    return summary
+
+
+def params_from_financials(financials, years=dcf.DEFAULT_YEARS, revenue_growth=None, fcf_margin=None,
+                           discount_band=(8.0, 12.0), terminal_growth=2.5,
+                           growth_vol=None, margin_vol=None):
+    """Simulation parameters built on the DCF assumptions for one company."""
+    a = dcf.assumptions_from_financials(financials, years, revenue_growth, fcf_margin)
+    hist_growth_vol, hist_margin_vol = volatility_from_history(financials.get("historical_financials") or [])
+    return {
+        "base_revenue_m": a["base_revenue_m"],
+        "revenue_growth": a["revenue_growth"].tolist(),
+        "fcf_margin": a["fcf_margin"].tolist(),
+        "net_debt_m": a["net_debt_m"],
+        "shares_outstanding": a["shares_outstanding"],
+        "current_price": a["current_price"],
+        "growth_vol": float(growth_vol if growth_vol is not None else hist_growth_vol),
+        "margin_vol": float(margin_vol if margin_vol is not None else hist_margin_vol),
+        "discount_band": [float(discount_band[0]), float(discount_band[1])],
+        "terminal_growth": float(terminal_growth),
+    }
@@ -0,0 +1,244 @@
+"""
+Mean-variance portfolio optimizer.
+
+Risk comes from the annualized covariance of daily log returns of the
+holdings' fetch_prices history. Expected returns come from the valuation
+flow: either annualized expected returns, or the upsides from
+dcf-valuation/portfolio-calculator, converted to an annual rate over a
+horizon.
+
+The covariance and its eigendecomposition are cached per holdings set and
+price date. A re-solve with different bounds, expected returns or risk-free
+rate skips the price fetch and the factorization and only runs the cheap
+projected-gradient solver. Constraints are fully invested (weights sum to
+1) with per-ticker lower/upper bounds.
+"""
+import threading
+from collections import OrderedDict
+from datetime import date
+
+import numpy as np
+
+import metrics
+import price_matrix
+
+MODEL_CACHE_MAX = 64
+_models = OrderedDict()
+_models_lock = threading.Lock()
+
+
+class CovarianceModel:
+    """Annualized covariance of a holdings set plus its factorization."""
+
+    def __init__(self, tickers, returns):
+        self.tickers = list(tickers)
+        daily = returns[self.tickers].to_numpy(dtype=float)
+        self.observations = daily.shape[0]
+        self.as_of = returns.index[-1].strftime("%Y-%m-%d")
+        self.mean_returns = daily.mean(axis=0) * price_matrix.TRADING_DAYS
+        self.cov = np.cov(daily, rowvar=False, ddof=1).reshape(len(self.tickers), len(self.tickers))
+        self.cov *= price_matrix.TRADING_DAYS
+        eigvals, eigvecs = np.linalg.eigh(self.cov)
+        self.eigvals = np.clip(eigvals, 0.0, None)
+        self.eigvecs = eigvecs
+        # Step size for projected gradient: 1 / largest eigenvalue
+        self.lipschitz = max(float(self.eigvals[-1]), 1e-12)
+
+    def variance(self, weights):
+        projected = self.eigvecs.T @ weights
+        return float(projected @ (self.eigvals * projected))
+
+
+def get_model(tickers, lookback_days=756):
+    """Cached CovarianceModel for a holdings set (sorted, upper-cased).
+
+    Keyed by calendar day as well, so a new daily close rebuilds the model.
+    """
+    key = (tuple(sorted(t.upper() for t in tickers)), int(lookback_days or 0), date.today().isoformat())
+    with _models_lock:
+        model = _models.get(key)
+        if model is not None:
+            _models.move_to_end(key)
+    metrics.record_cache("covariance", model is not None)
+    if model is not None:
+        return model, True
+
+    closes = price_matrix.load_closes(key[0], lookback_days)
+    returns = price_matrix.log_returns(closes)
+    missing = [t for t in key[0] if t not in returns.columns]
+    if missing:
+        raise ValueError(f"No price history for: {', '.join(missing)}")
+    if len(returns) < 30:
+        raise ValueError("Not enough overlapping price history")
+    model = CovarianceModel(key[0], returns)
+    with _models_lock:
+        _models[key] = model
+        while len(_models) > MODEL_CACHE_MAX:
+            _models.popitem(last=False)
+    return model, False
+
+
+def invalidate(tickers=None):
+    """Drop cached models (all, or those containing any of `tickers`)."""
+    with _models_lock:
+        if tickers is None:
+            _models.clear()
+            return
+        wanted = {t.upper() for t in tickers}
+        for key in [k for k in _models if wanted & set(k[0])]:
+            del _models[key]
+
+
+def project_capped_simplex(v, lower, upper):
+    """Euclidean projection onto {sum(w) = 1, lower <= w <= upper}.
+
+    The projection is clip(v - tau, lower, upper) for the tau where the
+    weights sum to 1. That sum is piecewise linear and decreasing in tau,
+    with breakpoints at v - upper (a weight leaves its cap) and v - lower (it
+    hits its floor), so one sort gives it exactly at every breakpoint.
+    """
+    breaks = np.concatenate([v - upper, v - lower])
+    order = np.argsort(breaks, kind="stable")
+    breaks = breaks[order]
+    # Number of weights strictly between their bounds on each segment
+    free = np.cumsum(np.where(order < v.size, 1, -1))[:-1]
+    sums = upper.sum() - np.concatenate([[0.0], np.cumsum(free * np.diff(breaks))])
+    k = int(np.searchsorted(-sums, -1.0))
+    if k == 0:
+        tau = breaks[0]
+    elif k >= breaks.size:
+        tau = breaks[-1]
+    else:
+        t0, t1, s0, s1 = breaks[k - 1], breaks[k], sums[k - 1], sums[k]
+        tau = t0 if s0 == s1 else t0 + (s0 - 1.0) * (t1 - t0) / (s0 - s1)
+    return np.clip(v - tau, lower, upper)
+
+
+def solve(model, mu, tradeoff, lower, upper, start=None, iterations=2000, tol=1e-9):
+    """argmin_w  w'Cw / 2 - tradeoff * mu'w  under the box/budget constraints (FISTA).
+
+    tradeoff = 0 is the minimum-variance portfolio; None maximizes return.
+    """
+    if tradeoff is None:
+        # Pure return maximization: fill the highest-return names up to their caps
+        return project_capped_simplex(mu * 1e6, lower, upper)
+    n = len(model.tickers)
+    w = project_capped_simplex(np.full(n, 1.0 / n) if start is None else start, lower, upper)
+    step = 1.0 / model.lipschitz
+    y, t = w.copy(), 1.0
+    for _ in range(iterations):
+        w_next = project_capped_simplex(y - step * (model.cov @ y - tradeoff * mu), lower, upper)
+        if np.max(np.abs(w_next - w)) < tol:
+            return w_next
+        if (y - w_next) @ (w_next - w) > 0:
+            # Momentum is pointing uphill: restart it (adaptive restart)
+            t = 1.0
+        t_next = 0.5 * (1.0 + np.sqrt(1.0 + 4.0 * t * t))
+        y = w_next + ((t - 1.0) / t_next) * (w_next - w)
+        w, t = w_next, t_next
+    return w
+
+
+def describe(model, mu, weights, risk_free):
+    ret = float(mu @ weights)
+    vol = float(np.sqrt(max(model.variance(weights), 0.0)))
+    return {
+        "weights": {t: round(float(w), 6) for t, w in zip(model.tickers, weights)},
+        "expected_return": ret * 100.0,
+        "volatility": vol * 100.0,
+        "sharpe": (ret - risk_free) / vol if vol > 0 else None,
+    }
+
+
+def optimize(model, mu, lower, upper, risk_free=0.0, frontier_points=20):
+    """Min-variance, max-Sharpe and efficient frontier portfolios (annual, in %)."""
+    def sharpe(w):
+        return (mu @ w - risk_free) / np.sqrt(max(model.variance(w), 1e-18))
+
+    min_var = solve(model, mu, 0.0, lower, upper)
+    top_return = float(mu @ solve(model, mu, None, lower, upper))
+
+    # Smallest tradeoff that reaches the max-return corner bounds the frontier
+    t_max = max(model.variance(min_var), 1e-8) / max(float(np.ptp(mu)), 1e-4)
+    w = min_var
+    for _ in range(40):
+        w = solve(model, mu, t_max, lower, upper, start=w)
+        if mu @ w >= top_return - 1e-6:
+            break
+        t_max *= 2.0
+
+    # Return is concave in the tradeoff, so an even tradeoff grid bunches up near
+    # the top. Sample it coarsely, then place the frontier at evenly spaced
+    # returns by interpolating the tradeoff that reaches each one.
+    coarse = np.concatenate([[0.0], np.geomspace(t_max * 1e-4, t_max, 2 * frontier_points)])
+    coarse_returns, w = [float(mu @ min_var)], min_var
+    for t in coarse[1:]:
+        w = solve(model, mu, t, lower, upper, start=w)
+        coarse_returns.append(float(mu @ w))
+    coarse_returns = np.maximum.accumulate(coarse_returns)
+    targets = np.linspace(coarse_returns[0], coarse_returns[-1], frontier_points)
+    tradeoffs = np.interp(targets, coarse_returns, coarse)
+    frontier, w = [min_var], min_var
+    for t in tradeoffs[1:]:
+        w = solve(model, mu, t, lower, upper, start=w)
+        frontier.append(w)
+
+    # Sharpe is unimodal along the frontier: refine around the best grid point
+    best = max(range(len(frontier)), key=lambda i: sharpe(frontier[i]))
+    a, b = tradeoffs[max(best - 1, 0)], tradeoffs[min(best + 1, len(tradeoffs) - 1)]
+    ratio = (np.sqrt(5.0) - 1.0) / 2.0
+    start = frontier[best]
+    c, d = b - ratio * (b - a), a + ratio * (b - a)
+    wc, wd = solve(model, mu, c, lower, upper, start=start), solve(model, mu, d, lower, upper, start=start)
+    for _ in range(16):
+        if sharpe(wc) > sharpe(wd):
+            b, d, wd = d, c, wc
+            c = b - ratio * (b - a)
+            wc = solve(model, mu, c, lower, upper, start=wd)
+        else:
+            a, c, wc = c, d, wd
+            d = a + ratio * (b - a)
+            wd = solve(model, mu, d, lower, upper, start=wc)
+    max_sharpe = max([wc, wd, start], key=sharpe)
+
+    return {
+        "min_variance": describe(model, mu, min_var, risk_free),
+        "max_sharpe": describe(model, mu, max_sharpe, risk_free),
+        "frontier": [describe(model, mu, w, risk_free) for w in frontier],
+    }
+
+
+def expected_returns(model, annual=None, upsides=None, horizon_years=5.0):
+    """Annual expected returns (decimal) aligned with model.tickers.
+
+    `annual` maps ticker -> expected annual return in %; `upsides` maps
+    ticker -> total upside to fair value in % (as in portfolio-calculator),
+    annualized over `horizon_years`. Tickers with neither fall back to
+    their historical mean return.
+    """
+    annual = {k.upper(): v for k, v in (annual or {}).items()}
+    upsides = {k.upper(): v for k, v in (upsides or {}).items()}
+    out = model.mean_returns.copy()
+    for i, ticker in enumerate(model.tickers):
+        if ticker in annual:
+            out[i] = float(annual[ticker]) / 100.0
+        elif ticker in upsides:
+            total = max(1.0 + float(upsides[ticker]) / 100.0, 1e-6)
+            out[i] = total ** (1.0 / max(horizon_years, 1e-6)) - 1.0
+    return out
+
+
+def weight_bounds(model, bounds=None, default=(0.0, 1.0)):
+    """Lower/upper weight arrays from {"min", "max"} or {ticker: [lo, hi]} (decimals)."""
+    lower = np.full(len(model.tickers), float(default[0]))
+    upper = np.full(len(model.tickers), float(default[1]))
+    bounds = bounds or {}
+    if "min" in bounds or "max" in bounds:
+        lower[:] = float(bounds.get("min", default[0]))
+        upper[:] = float(bounds.get("max", default[1]))
+    for i, ticker in enumerate(model.tickers):
+        if ticker in bounds:
+            lower[i], upper[i] = (float(x) for x in bounds[ticker])
+    if np.any(lower > upper) or lower.sum() > 1.0 + 1e-9 or upper.sum() < 1.0 - 1e-9:
+        raise ValueError("Weight bounds are infeasible for a fully invested portfolio")
+    return lower, upper
@@ -0,0 +1,169 @@
+"""
+Peer-relative exit multiples from the published universe snapshot.
+
+For every sector and industry in the snapshot table the positive P/E,
+EV/EBITDA, EV/FCF and EV/Sales multiples are sorted in one group-by pass
+when a snapshot version is first used. Valuing a company afterwards reads
+the quartiles off those sorted arrays, leaving out the company's own
+multiple when it is in the group, so it isn't benchmarked against itself.
+
+Only positive, finite multiples count (a negative P/E says nothing about
+what the market pays for earnings), and a group needs MIN_PEERS of them;
+thinner industries fall back to the sector, thinner sectors to the whole
+universe.
+
+Applying a multiple follows the exit-multiple valuation: P/E times EPS is
+a price; EV multiples give an enterprise value from which today's net debt
+(enterprise value - market cap) is taken off before dividing by shares.
+"""
+import threading
+
+import numpy as np
+
+import snapshot
+
+# name -> (snapshot column, fy24 metric it multiplies, enterprise-value based)
+MULTIPLES = {
+    "pe": ("pe_ratio", "eps", False),
+    "ev_ebitda": ("ev_ebitda", "ebitda", True),
+    "ev_fcf": ("ev_fcf", "fcf", True),
+    "ev_sales": ("ev_sales", "revenue", True),
+}
+QUANTILES = {"p25": 0.25, "median": 0.5, "p75": 0.75}
+MIN_PEERS = 5
+LEVELS = ("industry", "sector")
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _number(x):
+    return float(x) if np.isfinite(x) else None
+
+
+def _quantile(values, p):
+    """Linearly interpolated quantile of a sorted array (pandas' default)."""
+    position = p * (values.size - 1)
+    low = int(position)
+    high = min(low + 1, values.size - 1)
+    return float(values[low] + (values[high] - values[low]) * (position - low))
+
+
+def _group_values(frame, by):
+    """{group: {multiple: sorted positive values}} for one grouping."""
+    return {
+        group: {name: np.sort(rows[column].dropna().to_numpy()) for name, (column, _, _) in MULTIPLES.items()}
+        for group, rows in frame.groupby(by)
+    }
+
+
+def _stats(values):
+    """{p25, median, p75, peers} of a sorted array; quartiles None without peers."""
+    return {
+        **{label: _quantile(values, p) if values.size else None for label, p in QUANTILES.items()},
+        "peers": int(values.size),
+    }
+
+
+class PeerIndex:
+    """Sorted multiples per industry, sector and for the universe, for one snapshot."""
+
+    def __init__(self, table, version):
+        self.version = version
+        frame = table[["ticker", *LEVELS]].copy()
+        for column, _, _ in MULTIPLES.values():
+            values = table[column].astype(float)
+            frame[column] = values.where(np.isfinite(values) & (values > 0))
+        frame["universe"] = "all"
+        self.values = {level: _group_values(frame.dropna(subset=[level]), level) for level in (*LEVELS, "universe")}
+        # ticker -> its groups and multiples, to leave it out of its own peers
+        self.rows = {
+            row["ticker"]: row
+            for row in frame.drop_duplicates("ticker", keep="last").to_dict("records")
+        }
+
+    def _without(self, values, level, group, name, ticker):
+        row = self.rows.get(ticker) if ticker else None
+        if row is None or row[level] != group:
+            return values
+        own = row[MULTIPLES[name][0]]
+        if not np.isfinite(own):
+            return values
+        return np.delete(values, np.searchsorted(values, own))
+
+    def peers(self, name, sector=None, industry=None, ticker=None):
+        """(level, group, stats) of the narrowest group with enough peers for a multiple, excluding `ticker`."""
+        for level, group in (("industry", industry), ("sector", sector), ("universe", "all")):
+            if not group:
+                continue
+            values = self.values[level].get(group, {}).get(name)
+            if values is None:
+                continue
+            values = self._without(values, level, group, name, ticker)
+            if values.size >= MIN_PEERS or level == "universe":
+                return level, group if level != "universe" else None, _stats(values)
+        # Empty snapshot table: no universe group at all
+        return "universe", None, _stats(np.empty(0))
+
+
+def current_index():
+    """PeerIndex for the published snapshot, rebuilt only when its version changes."""
+    global _index
+    snap = snapshot.current()
+    if snap is None:
+        return None
+    with _index_lock:
+        if _index is None or _index.version != snap.version:
+            _index = PeerIndex(snap.table, snap.version)
+        return _index
+
+
+def implied_price(name, multiple, metrics, market_data):
+    """Per-share value of `multiple` applied to the company's metric, or None."""
+    _, metric, enterprise = MULTIPLES[name]
+    base = metrics.get(metric)
+    if multiple is None or not base or base <= 0:
+        return None
+    if not enterprise:
+        return multiple * base
+    shares = metrics.get("shares_outstanding") or market_data.get("shares_outstanding")
+    ev = market_data.get("enterprise_value")
+    market_cap = market_data.get("market_cap")
+    if not shares or ev is None or market_cap is None:
+        return None
+    net_debt = ev - market_cap
+    return (multiple * base - net_debt) / shares
+
+
+def value(index, payload, metrics=None, ticker=None):
+    """Peer quartile multiples and the prices they imply for one company.
+
+    `metrics` overrides the fy24 figures the multiples are applied to, e.g.
+    with the exit year of a forecast ({"eps": ..., "ebitda": ...}). `ticker`
+    is the company's own, left out of its peer groups.
+    """
+    fy = dict(payload.get("fy24_financials") or {})
+    fy.update({k: v for k, v in (metrics or {}).items() if v is not None})
+    md = payload.get("market_data") or {}
+    price = md.get("current_price")
+    sector, industry = payload.get("sector"), payload.get("industry")
+    out = {}
+    for name in MULTIPLES:
+        level, group, entry = index.peers(name, sector, industry, ticker)
+        implied = {label: implied_price(name, entry[label], fy, md) for label in QUANTILES}
+        median = implied["median"]
+        out[name] = {
+            "peer_level": level,
+            "peer_group": group,
+            "peers": entry["peers"],
+            "multiple": {label: entry[label] for label in QUANTILES},
+            "implied_price": implied,
+            "upside_pct": (median / price - 1.0) * 100.0 if median and price else None,
+        }
+    return {
+        "snapshot_version": index.version,
+        "sector": sector,
+        "industry": industry,
+        "current_price": price,
+        "multiples": out,
+    }
@@ -0,0 +1,270 @@
+"""
+Popularity-driven pre-warming of the result cache.
+
+Every /yf lookup bumps the ticker's popularity, an exponentially decayed
+request count (POPULARITY_HALF_LIFE_HOURS). A background task wakes every
+PREWARM_INTERVAL seconds, takes the PREWARM_TOP_N most popular tickers and
+refetches those whose cached financials (statements and quote) or price
+history are close to expiring (PREWARM_REFRESH_AT of their TTL has passed
+since the last upstream fetch), so the first user of the morning gets a
+cache hit instead of a cold fetch.
+
+Pre-warming only spends spare upstream budget: it backs off while more
+than PREWARM_MAX_IN_FLIGHT live requests are being served, and while the
+shared Yahoo rate limit has fewer than PREWARM_MIN_TOKENS tokens to spare
+beyond what the refresh itself needs.
+
+PREWARM_TOP_N=0 (the default) turns the scheduler off.
+
+With several workers (shared_loader.py) the scheduler runs once, in the
+loader process, rather than once per worker. Workers only write their
+popularity, fetch times and in-flight count to SHARED_DATA_DIR/prewarm
+every PREWARM_INTERVAL seconds, and the loader merges them before each
+cycle. Its refreshes reach the workers through the result cache, so this
+needs a shared L2 (RESULT_CACHE_URL).
+"""
+import os
+import json
+import math
+import time
+import heapq
+import asyncio
+import threading
+
+import metrics
+import snapshot
+import shared_data
+from scripts.rate_limit import yahoo as yahoo_rate
+from scripts.result_cache import TTLS
+from scripts import fetch_portfolio_prices
+from scripts.fetch_yfinance import cache_financials, debug
+from scripts.fetch_portfolio_prices import fetch_prices_cached
+
+PREWARM_TOP_N = int(os.environ.get("PREWARM_TOP_N", "0"))
+PREWARM_INTERVAL = float(os.environ.get("PREWARM_INTERVAL", "60"))
+PREWARM_REFRESH_AT = float(os.environ.get("PREWARM_REFRESH_AT", "0.8"))
+PREWARM_MAX_IN_FLIGHT = int(os.environ.get("PREWARM_MAX_IN_FLIGHT", "4"))
+PREWARM_MIN_TOKENS = float(os.environ.get("PREWARM_MIN_TOKENS", "2"))
+POPULARITY_HALF_LIFE_HOURS = float(os.environ.get("POPULARITY_HALF_LIFE_HOURS", "6"))
+POPULARITY_MAX_TRACKED = 5000
+REPORT_DIR = shared_data.SHARED_DATA_DIR / "prewarm"
+# Upstream calls a financials fetch makes (price, statements, cash flow, info)
+FINANCIALS_CALLS = 4
+PRICE_BATCH = 50
+
+
+class Popularity:
+    """Exponentially decayed request counts per ticker."""
+
+    def __init__(self, half_life_hours=POPULARITY_HALF_LIFE_HOURS, max_tracked=POPULARITY_MAX_TRACKED):
+        self.decay = math.log(2) / (half_life_hours * 3600.0)
+        self.max_tracked = max_tracked
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def _decayed(self, entry, now):
+        count, updated = entry
+        return count * math.exp(-self.decay * (now - updated))
+
+    def record(self, ticker, now=None):
+        now = time.time() if now is None else now
+        ticker = ticker.upper()
+        with self.lock:
+            entry = self.counts.get(ticker)
+            self.counts[ticker] = ((self._decayed(entry, now) if entry else 0.0) + 1.0, now)
+            if len(self.counts) > self.max_tracked:
+                # Forget the coldest half rather than trimming one per request
+                keep = heapq.nlargest(self.max_tracked // 2, self.counts.items(),
+                                      key=lambda item: self._decayed(item[1], now))
+                self.counts = dict(keep)
+
+    def replace(self, scores, now=None):
+        """Set the counts to {ticker: score} as of now (merged from other processes)."""
+        now = time.time() if now is None else now
+        with self.lock:
+            self.counts = {ticker: (score, now) for ticker, score in scores.items()}
+
+    def top(self, n, now=None):
+        """[(ticker, score)] of the n most popular tickers right now."""
+        now = time.time() if now is None else now
+        with self.lock:
+            items = list(self.counts.items())
+        scored = ((ticker, self._decayed(entry, now)) for ticker, entry in items)
+        return heapq.nlargest(n, scored, key=lambda item: item[1])
+
+
+popularity = Popularity()
+# (kind, ticker) -> time.monotonic() of the last upstream fetch
+_fetched = {}
+_task = None
+# Requests in flight across the workers, as of their last reports
+_reported_in_flight = 0.0
+
+
+def note_fetched(kind, ticker):
+    _fetched[(kind, ticker.upper())] = time.monotonic()
+
+
+# Every cached price download counts, whoever made it
+fetch_portfolio_prices.on_prices_cached = lambda ticker: note_fetched("prices", ticker)
+
+
+def due(kind, tickers, now=None):
+    """Tickers whose cached `kind` is past PREWARM_REFRESH_AT of its TTL (or was never fetched)."""
+    now = time.monotonic() if now is None else now
+    horizon = TTLS[kind] * PREWARM_REFRESH_AT
+    return [t for t in tickers if now - _fetched.get((kind, t), -math.inf) >= horizon]
+
+
+def busy(calls=1):
+    """Why a refresh needing `calls` upstream requests should wait, or None."""
+    if max(metrics.IN_FLIGHT.total(), _reported_in_flight) > PREWARM_MAX_IN_FLIGHT:
+        return "paused_traffic"
+    if yahoo_rate.available() < PREWARM_MIN_TOKENS + calls:
+        return "paused_rate_limit"
+    return None
+
+
+def write_report(directory=None):
+    """Write this worker's popularity, fetch times and load for the loader to merge."""
+    directory = directory or REPORT_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    now = time.monotonic()
+    report = {
+        "written": time.time(),
+        "in_flight": metrics.IN_FLIGHT.total(),
+        "popularity": popularity.top(max(2 * PREWARM_TOP_N, 1)),
+        "fetched": [[kind, ticker, now - at] for (kind, ticker), at in list(_fetched.items())],
+    }
+    path = directory / f"{os.getpid()}.json"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(report))
+    os.replace(tmp, path)
+
+
+def merge_reports(directory=None, max_age=None):
+    """Take popularity, fetch times and load from the workers' recent reports."""
+    global _reported_in_flight
+    directory = directory or REPORT_DIR
+    max_age = 3 * PREWARM_INTERVAL if max_age is None else max_age
+    wall, now = time.time(), time.monotonic()
+    scores, in_flight = {}, 0.0
+    for path in directory.glob("*.json"):
+        try:
+            report = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        age = wall - report.get("written", 0.0)
+        if age > max_age:
+            # A worker that stopped reporting has exited
+            path.unlink(missing_ok=True)
+            continue
+        in_flight += report.get("in_flight", 0.0)
+        for ticker, score in report.get("popularity", []):
+            scores[ticker] = scores.get(ticker, 0.0) + score
+        for kind, ticker, fetched_ago in report.get("fetched", []):
+            at = now - fetched_ago - age
+            if at > _fetched.get((kind, ticker), -math.inf):
+                _fetched[(kind, ticker)] = at
+    popularity.replace(scores, wall)
+    _reported_in_flight = in_flight
+
+
+def _from_snapshot(ticker):
+    """True if fetch_backend answers the ticker from a fresh bulk snapshot."""
+    try:
+        snap = snapshot.current() if snapshot.SNAPSHOT_SERVE else None
+    except (OSError, ValueError, KeyError):
+        return False
+    return snap is not None and ticker in snap.payloads and snap.age_hours() <= snapshot.SNAPSHOT_MAX_AGE_HOURS
+
+
+async def run_once(fetch, run_sync, top_n=PREWARM_TOP_N):
+    """Refresh what is due among the top_n tickers; returns {kind: refreshed tickers}."""
+    hot = [ticker for ticker, _ in popularity.top(top_n)]
+    refreshed = {"financials": [], "prices": []}
+    # Tickers in a fresh bulk snapshot are answered from it, not the cache
+    for ticker in [t for t in due("financials", hot) if not _from_snapshot(t)]:
+        reason = busy(FINANCIALS_CALLS)
+        if reason:
+            metrics.PREWARM_REFRESHES.inc(kind="financials", result=reason)
+            return refreshed
+        try:
+            payload = await fetch(ticker)
+            await run_sync(cache_financials, ticker, payload)
+        except Exception as e:
+            debug(f"[prewarm] financials for {ticker} failed: {e}")
+            metrics.PREWARM_REFRESHES.inc(kind="financials", result="error")
+            continue
+        note_fetched("financials", ticker)
+        refreshed["financials"].append(ticker)
+        metrics.PREWARM_REFRESHES.inc(kind="financials", result="partial" if payload.get("missing") or payload.get("stale") else "ok")
+
+    pending = due("prices", hot)
+    for start in range(0, len(pending), PRICE_BATCH):
+        batch = pending[start:start + PRICE_BATCH]
+        reason = busy()
+        if reason:
+            metrics.PREWARM_REFRESHES.inc(kind="prices", result=reason)
+            break
+        try:
+            await run_sync(fetch_prices_cached, batch, True)
+        except Exception as e:
+            debug(f"[prewarm] price histories failed: {e}")
+            metrics.PREWARM_REFRESHES.inc(len(batch), kind="prices", result="error")
+            continue
+        refreshed["prices"].extend(batch)
+        metrics.PREWARM_REFRESHES.inc(len(batch), kind="prices", result="ok")
+    return refreshed
+
+
+async def run_forever(fetch, run_sync, merge=False):
+    """Refresh cycles every PREWARM_INTERVAL; `merge` first folds in the workers' reports."""
+    while True:
+        try:
+            if merge:
+                await run_sync(merge_reports)
+            await run_once(fetch, run_sync)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            debug(f"[prewarm] cycle failed: {e}")
+        await asyncio.sleep(PREWARM_INTERVAL)
+
+
+async def report_forever(run_sync):
+    while True:
+        try:
+            await run_sync(write_report)
+        except asyncio.CancelledError:
+            raise
+        except OSError as e:
+            debug(f"[prewarm] report failed: {e}")
+        await asyncio.sleep(PREWARM_INTERVAL)
+
+
+def start(fetch, run_sync):
+    """Start the scheduler on the running loop if PREWARM_TOP_N is set.
+
+    Workers of a shared-data deployment only report to the loader, which
+    runs the scheduler for all of them.
+    """
+    global _task
+    if PREWARM_TOP_N > 0 and _task is None:
+        loop = asyncio.get_running_loop()
+        if shared_data.SHARED_DATA:
+            _task = loop.create_task(report_forever(run_sync))
+        else:
+            _task = loop.create_task(run_forever(fetch, run_sync))
+    return _task
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,87 @@
+"""
+Aligned close-price and return matrices built on fetch_prices.
+
+The portfolio analytics (optimizer, risk metrics, factor model) all want
+the same thing: one date x ticker frame of closes with the tickers'
+histories aligned on common trading days.
+
+With a multi-worker deployment the loader also publishes the closes of a
+ticker set as a shared matrix (see shared_data.py); requests covered by it
+are sliced from there instead of each worker fetching and holding its own.
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import shared_data
+from scripts.fetch_portfolio_prices import fetch_close_matrix
+
+TRADING_DAYS = 252
+SHARED_PRICES_MAX_AGE_HOURS = float(os.environ.get("SHARED_PRICES_MAX_AGE_HOURS", "24"))
+
+
+def close_matrix(price_history):
+    """fetch_prices output ({ticker: [{date, close}]}) -> date x ticker frame."""
+    columns = {}
+    for ticker, rows in price_history.items():
+        if not rows:
+            continue
+        columns[ticker] = pd.Series(
+            [row["close"] for row in rows],
+            index=pd.to_datetime([row["date"] for row in rows]),
+            dtype=float,
+        )
+    if not columns:
+        return pd.DataFrame()
+    frame = pd.DataFrame(columns).sort_index()
+    return frame[~frame.index.duplicated(keep="last")]
+
+
+def shared_arrays(frame):
+    """(arrays, meta) publishing a close frame as a shared segment, tickers sorted."""
+    frame = frame.reindex(columns=sorted(frame.columns))
+    arrays = {
+        "closes": np.ascontiguousarray(frame.to_numpy()),
+        "dates": frame.index.to_numpy(dtype="datetime64[ns]"),
+        "tickers": np.array(list(frame.columns), dtype=str),
+    }
+    return arrays, {"published_at": time.time()}
+
+
+def shared_closes(tickers, dtype=None):
+    """Closes of `tickers` from the shared matrix, None unless it is fresh and has all of them."""
+    segment = shared_data.segment("prices")
+    if segment is None or (time.time() - segment.meta["published_at"]) / 3600.0 > SHARED_PRICES_MAX_AGE_HOURS:
+        return None
+    positions = shared_data.lookup(segment["tickers"], tickers)
+    if positions is None:
+        return None
+    closes = segment["closes"][:, positions]
+    if dtype is not None:
+        closes = closes.astype(dtype, copy=False)
+    frame = pd.DataFrame(closes, index=pd.DatetimeIndex(segment["dates"]), columns=tickers)
+    # The shared matrix spans every ticker's dates; keep those these tickers traded on
+    return frame.dropna(how="all")
+
+
+def load_closes(tickers, lookback_days=None, dtype=None):
+    """Fetch and align closes; tickers without data are dropped.
+
+    dtype defaults to PRICE_DTYPE; returns are computed in float64 either way.
+    """
+    tickers = list(dict.fromkeys(t.upper() for t in tickers))
+    frame = shared_closes(tickers, dtype)
+    if frame is None:
+        frame = fetch_close_matrix(tickers, dtype)
+    if lookback_days and not frame.empty:
+        frame = frame.iloc[-(int(lookback_days) + 1):]
+    return frame
+
+
+def log_returns(closes):
+    """Daily log returns on the days where every ticker traded."""
+    if closes.empty:
+        return closes
+    return np.log(closes.astype(float)).diff().iloc[1:].dropna(how="any")
@@ -0,0 +1,212 @@
+"""
+Incrementally refreshed price histories and delta sync against them.
+
+The store keeps each ticker's daily closes in memory. A history older than
+PRICE_STORE_REFRESH seconds isn't downloaded again in full: only the last
+RECENT_DAYS are fetched and spliced over the end of it. If the overlap
+disagrees before the last REVISION_BARS bars, Yahoo has re-adjusted the
+whole history (a split or dividend under auto_adjust) and the ticker is
+reloaded from scratch; so is a history that ends before the recent window
+starts, which would otherwise lose the bars in between.
+
+Clients sync with an opaque token. For every ticker it records the last
+date the client holds plus two short digests: the last REVISION_BARS bars
+(which Yahoo may still restate) and the ANCHOR_BARS before them (which only
+change when the history is re-adjusted). Against the current history that
+gives one of three answers:
+
+    both match       only the bars after the client's last date
+    tail differs     the bars from the start of the tail on ("replace_from")
+    anchor differs   the whole history ("reset")
+
+so a daily refresh costs a bar and a token entry per ticker.
+"""
+import os
+import json
+import time
+import zlib
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from scripts import price_sampling
+from scripts.fetch_portfolio_prices import fetch_prices_cached, fetch_close_series, cache_prices
+
+PRICE_STORE_REFRESH = float(os.environ.get("PRICE_STORE_REFRESH", "900"))
+PRICE_STORE_MAX_TICKERS = int(os.environ.get("PRICE_STORE_MAX_TICKERS", "2000"))
+RECENT_DAYS = 14
+# Calendar days a recent window may start after the stored history ends (a long weekend)
+MAX_GAP_DAYS = 4
+REVISION_BARS = 5
+ANCHOR_BARS = 20
+TOKEN_VERSION = 1
+
+
+class History:
+    __slots__ = ("dates", "closes", "synced")
+
+    def __init__(self, dates, closes, synced):
+        self.dates = dates
+        self.closes = closes
+        self.synced = synced
+
+
+def splice(dates, closes, new_dates, new_closes):
+    """History with a recent window laid over its end; None if re-adjusted or not contiguous."""
+    if new_dates.size == 0:
+        return dates, closes
+    if dates.size and new_dates[0] - dates[-1] > np.timedelta64(MAX_GAP_DAYS, "D"):
+        # The window starts after the history ends; the bars in between are unknown
+        return None
+    keep = dates < new_dates[0]
+    # Bars both have, except the last few that may legitimately be restated
+    settled = dates[~keep][:-REVISION_BARS] if REVISION_BARS else dates[~keep]
+    common, old_i, new_i = np.intersect1d(settled, new_dates, return_indices=True)
+    offset = int(keep.sum())
+    if common.size and not np.allclose(closes[offset + old_i], new_closes[new_i], rtol=1e-6, atol=0.0):
+        return None
+    return np.concatenate([dates[keep], new_dates]), np.concatenate([closes[keep], new_closes])
+
+
+class PriceStore:
+    """{ticker: History}, least recently used dropped past max_tickers."""
+
+    def __init__(self, max_tickers=PRICE_STORE_MAX_TICKERS, refresh=PRICE_STORE_REFRESH):
+        self.max_tickers = max_tickers
+        self.refresh = refresh
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _put(self, ticker, dates, closes, now):
+        with self.lock:
+            self.entries[ticker] = History(dates, closes, now)
+            self.entries.move_to_end(ticker)
+            while len(self.entries) > self.max_tickers:
+                self.entries.popitem(last=False)
+
+    def _load(self, tickers, now, refresh=False):
+        for ticker, rows in fetch_prices_cached(tickers, refresh).items():
+            if rows:
+                self._put(ticker, *price_sampling.to_arrays(rows), now)
+
+    def _top_up(self, stale, now):
+        # A history that ends before the recent window can't be topped up from it
+        start = np.datetime64("today", "D") - RECENT_DAYS + MAX_GAP_DAYS
+        reload = [t for t, h in stale if h.dates[-1] < start]
+        stale = [(t, h) for t, h in stale if h.dates[-1] >= start]
+        fresh = fetch_close_series([t for t, _ in stale], days=RECENT_DAYS) if stale else {}
+        for ticker, history in stale:
+            close = fresh.get(ticker)
+            if close is None:
+                continue  # keep serving what we have; retried on the next read
+            new_dates = close.index.to_numpy().astype("datetime64[D]")
+            spliced = splice(history.dates, history.closes, new_dates, close.to_numpy(dtype=float))
+            if spliced is None:
+                reload.append(ticker)
+                continue
+            self._put(ticker, *spliced, now)
+            # Keep the shared cache as current as the store
+            cache_prices(ticker, price_sampling.to_rows(*spliced))
+        if reload:
+            self._load(reload, now, refresh=True)
+
+    def histories(self, tickers):
+        """{ticker: (dates, closes)} for the tickers with data, refreshed as needed."""
+        now = time.monotonic()
+        with self.lock:
+            known = {t: self.entries.get(t) for t in tickers}
+        missing = [t for t, h in known.items() if h is None]
+        stale = [(t, h) for t, h in known.items() if h is not None and now - h.synced >= self.refresh]
+        if missing:
+            self._load(missing, now)
+        if stale:
+            self._top_up(stale, now)
+        with self.lock:
+            return {t: (self.entries[t].dates, self.entries[t].closes) for t in tickers if t in self.entries}
+
+
+store = PriceStore()
+
+
+def _digest(dates, closes):
+    raw = dates.astype("int64").tobytes() + np.round(closes, 6).tobytes()
+    return base64.urlsafe_b64encode(hashlib.blake2b(raw, digest_size=6).digest()).decode()
+
+
+def marks(dates, closes, end=None):
+    """[last date, tail digest, anchor digest] of a history up to index `end`."""
+    end = dates.size if end is None else end
+    tail = max(0, end - REVISION_BARS)
+    anchor = max(0, tail - ANCHOR_BARS)
+    return [str(dates[end - 1]), _digest(dates[tail:end], closes[tail:end]),
+            _digest(dates[anchor:tail], closes[anchor:tail])]
+
+
+def encode_token(entries):
+    raw = json.dumps({"v": TOKEN_VERSION, "t": entries}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(zlib.compress(raw, 9)).decode().rstrip("=")
+
+
+def decode_token(token):
+    """{ticker: marks} from a sync token; ValueError if it isn't one."""
+    try:
+        raw = zlib.decompress(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        data = json.loads(raw)
+    except (ValueError, zlib.error) as e:
+        raise ValueError("Invalid sync token") from e
+    if not isinstance(data, dict) or data.get("v") != TOKEN_VERSION or not isinstance(data.get("t"), dict):
+        raise ValueError("Invalid sync token")
+    for mark in data["t"].values():
+        if not (isinstance(mark, list) and len(mark) == 3 and all(isinstance(m, str) for m in mark)):
+            raise ValueError("Invalid sync token")
+        np.datetime64(mark[0], "D")
+    return data["t"]
+
+
+def delta(dates, closes, since=None, mark=None):
+    """{replace_from, reset, bars} bringing a client at `mark` (or holding up to `since`) current."""
+    if mark is not None:
+        last = np.datetime64(mark[0], "D")
+        end = int(np.searchsorted(dates, last, side="right"))
+        if end and dates[end - 1] == last:
+            current = marks(dates, closes, end)
+            if current[2] == mark[2]:
+                start = end if current[1] == mark[1] else max(0, end - REVISION_BARS)
+                return _bars(dates, closes, start)
+        return {"replace_from": None, "reset": True, "bars": price_sampling.to_rows(dates, closes)}
+    if since is not None:
+        return _bars(dates, closes, int(np.searchsorted(dates, np.datetime64(since, "D"), side="right")))
+    return {"replace_from": None, "reset": True, "bars": price_sampling.to_rows(dates, closes)}
+
+
+def _bars(dates, closes, start):
+    return {
+        "replace_from": str(dates[start]) if start < dates.size else None,
+        "reset": False,
+        "bars": price_sampling.to_rows(dates[start:], closes[start:]),
+    }
+
+
+def sync(tickers, since=None, token=None):
+    """Delta response for `tickers` (the token's when empty); ValueError on a bad token or date."""
+    previous = decode_token(token) if token else {}
+    since = {t.upper(): d for t, d in (since or {}).items()}
+    for day in since.values():
+        np.datetime64(day, "D")  # ValueError on a malformed date
+    tickers = list(dict.fromkeys(t.upper() for t in (tickers or previous)))
+    histories = store.histories(tickers)
+    prices, entries, missing = {}, {}, []
+    for ticker in tickers:
+        history = histories.get(ticker)
+        if history is None or history[0].size == 0:
+            missing.append(ticker)
+            if ticker in previous:
+                entries[ticker] = previous[ticker]
+            continue
+        dates, closes = history
+        prices[ticker] = delta(dates, closes, since.get(ticker), previous.get(ticker))
+        entries[ticker] = marks(dates, closes)
+    return {"prices": prices, "missing": missing, "token": encode_token(entries)}
@@ -0,0 +1,214 @@
+"""
+Opt-in sampling profiler for single python_service requests.
+
+A request asks to be profiled with `?profile=1` (or the `X-Fincast-Profile`
+header); `profile=inline` returns the profile instead of the normal body.
+Only clients in PROFILE_ALLOWLIST (comma-separated IPs/CIDRs) may profile,
+and an empty allow-list disables the feature.
+
+Profiles are written in the folded-stack format understood by flamegraph.pl,
+speedscope and inferno, into PROFILE_DIR, keeping at most PROFILE_MAX_FILES.
+Requests that don't ask for a profile only pay for a header lookup.
+"""
+import os
+import sys
+import time
+import threading
+import ipaddress
+import contextvars
+import functools
+import inspect
+from collections import Counter
+from pathlib import Path
+
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+PROFILE_HEADER = "x-fincast-profile"
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", "/tmp/fincast-profiles"))
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "20"))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000.0
+
+
+def _parse_allowlist(raw):
+    networks = []
+    for item in (raw or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            sys.stderr.write(f"Ignoring invalid PROFILE_ALLOWLIST entry: {item}\n")
+    return networks
+
+
+ALLOWLIST = _parse_allowlist(os.environ.get("PROFILE_ALLOWLIST", ""))
+
+# The profiler for the current request, if any; copied into the threadpool
+_active = contextvars.ContextVar("fincast_profiler", default=None)
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of the threads serving one request."""
+
+    def __init__(self, label, interval=PROFILE_INTERVAL):
+        self.label = label
+        self.interval = interval
+        self.samples = Counter()
+        self.started = None
+        self.elapsed = 0.0
+        self._targets = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="fincast-profiler", daemon=True)
+        self._thread.start()
+
+    def attach(self, thread_id):
+        self._targets.add(thread_id)
+
+    def detach(self, thread_id):
+        self._targets.discard(thread_id)
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self.started is not None:
+            self.elapsed = time.perf_counter() - self.started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self._targets):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples[";".join(stack)] += 1
+
+    def folded(self):
+        """Render samples as 'frame;frame;frame count' lines."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+def _sampled(fn):
+    """Wrap a sync callable so an active request profiler samples its thread."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        profiler = _active.get()
+        if profiler is None:
+            return fn(*args, **kwargs)
+        thread_id = threading.get_ident()
+        profiler.attach(thread_id)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.detach(thread_id)
+    return wrapper
+
+
+def _profile_call(fn):
+    """Wrap an endpoint so an active request profiler samples its thread."""
+    if not inspect.iscoroutinefunction(fn):
+        return _sampled(fn)
+
+    @functools.wraps(fn)
+    async def async_wrapper(*args, **kwargs):
+        profiler = _active.get()
+        if profiler is None:
+            return await fn(*args, **kwargs)
+        thread_id = threading.get_ident()
+        profiler.attach(thread_id)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            profiler.detach(thread_id)
+    return async_wrapper
+
+
+async def run_sync(fn, *args, **kwargs):
+    """run_in_threadpool that keeps the worker thread in an active profile."""
+    return await run_in_threadpool(_sampled(fn), *args, **kwargs)
+
+
+class ProfilingRoute(APIRoute):
+    """Route class that makes every endpoint profilable on request."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _profile_call(endpoint), **kwargs)
+
+
+def _requested_mode(request):
+    mode = request.headers.get(PROFILE_HEADER) or request.query_params.get("profile")
+    if not mode or mode in ("0", "false"):
+        return None
+    return "inline" if mode == "inline" else "save"
+
+
+def _client_allowed(request):
+    if not ALLOWLIST or request.client is None:
+        return False
+    try:
+        addr = ipaddress.ip_address(request.client.host)
+    except ValueError:
+        return False
+    return any(addr in net for net in ALLOWLIST)
+
+
+def _save(profiler):
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{profiler.label}-{os.getpid()}-{threading.get_ident()}.folded"
+    path = PROFILE_DIR / name
+    path.write_text(profiler.folded())
+    # Keep the directory bounded: drop the oldest profiles first
+    profiles = sorted(PROFILE_DIR.glob("*.folded"), key=lambda p: p.stat().st_mtime)
+    for old in profiles[:max(0, len(profiles) - PROFILE_MAX_FILES)]:
+        try:
+            old.unlink()
+        except OSError:
+            pass
+    return path
+
+
+async def profile_middleware(request, call_next):
+    mode = _requested_mode(request)
+    if mode is None:
+        return await call_next(request)
+    if not _client_allowed(request):
+        return PlainTextResponse("Profiling not allowed for this client", status_code=403)
+
+    label = request.url.path.strip("/").replace("/", "_") or "root"
+    ticker = request.query_params.get("ticker")
+    if ticker:
+        label = f"{label}-{''.join(c for c in ticker if c.isalnum() or c in '.-')}"
+    profiler = SamplingProfiler(label)
+    token = _active.set(profiler)
+    profiler.start()
+    try:
+        response = await call_next(request)
+    finally:
+        profiler.stop()
+        _active.reset(token)
+
+    path = _save(profiler)
+    headers = {
+        "X-Profile-File": path.name,
+        "X-Profile-Samples": str(sum(profiler.samples.values())),
+        "X-Profile-Seconds": f"{profiler.elapsed:.3f}",
+    }
+    if mode == "inline":
+        headers["X-Profiled-Status"] = str(response.status_code)
+        return PlainTextResponse(profiler.folded(), headers=headers)
+    for key, value in headers.items():
+        response.headers[key] = value
+    return response
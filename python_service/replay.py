@@ -0,0 +1,164 @@
+"""
+Replay stand-in for the Yahoo-backed fetchers.
+
+With FETCH_BACKEND=replay, /yf serves recorded `fetch_financials` payloads
+from REPLAY_DIR instead of calling Yahoo. Tickers without a recording get a
+deterministic synthetic payload with the same schema, so load tests can use
+any number of distinct tickers.
+
+The handler still blocks for a configurable time, like the real upstream
+calls: REPLAY_COLD_MS the first time this process sees a ticker, and
+REPLAY_HOT_MS afterwards. FETCH_BACKEND=record fetches live and saves each
+result into REPLAY_DIR for later replay.
+
+synthetic_download stands in for yf.download(group_by='ticker') with
+deterministic OHLCV random walks, for benchmarks of the price path.
+"""
+import os
+import json
+import time
+import zlib
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+REPLAY_DIR = Path(os.environ.get("REPLAY_DIR", Path(__file__).parent / "replay_data"))
+REPLAY_COLD_MS = float(os.environ.get("REPLAY_COLD_MS", "1500"))
+REPLAY_HOT_MS = float(os.environ.get("REPLAY_HOT_MS", "20"))
+
+# Yahoo's sector names, spread over synthetic tickers
+SECTORS = (
+    "Technology", "Healthcare", "Financial Services", "Consumer Cyclical",
+    "Industrials", "Communication Services", "Consumer Defensive", "Energy",
+    "Basic Materials", "Real Estate", "Utilities",
+)
+
+_warm = set()
+_lock = threading.Lock()
+
+
+def _recording_path(ticker):
+    safe = "".join(c for c in ticker.upper() if c.isalnum() or c in ".-")
+    return REPLAY_DIR / f"{safe}.json"
+
+
+def synthetic_financials(ticker):
+    """Stable fake payload shaped like fetch_financials output."""
+    seed = zlib.crc32(ticker.upper().encode())
+    revenue = 1e9 * (1 + seed % 400)
+    gross_margin = 30 + seed % 40
+    ebitda_margin = 10 + seed % 25
+    fcf_margin = 5 + seed % 20
+    net_margin = 4 + seed % 15
+    shares = 1e8 * (1 + seed % 50)
+    price = 10 + seed % 490
+    historical = []
+    for i, year in enumerate(range(2021, 2025)):
+        rev_m = revenue / 1e6 * (0.85 + 0.05 * i)
+        historical.append({
+            "year": f"FY{str(year)[-2:]}",
+            "revenue": rev_m,
+            "revenueGrowth": 0.0 if i == 0 else (0.05 / (0.85 + 0.05 * (i - 1))) * 100.0,
+            "grossProfit": rev_m * gross_margin / 100.0,
+            "grossMargin": float(gross_margin),
+            "ebitda": rev_m * ebitda_margin / 100.0,
+            "ebitdaMargin": float(ebitda_margin),
+            "fcf": rev_m * fcf_margin / 100.0,
+            "fcfMargin": float(fcf_margin),
+            "netIncome": rev_m * net_margin / 100.0,
+            "netIncomeMargin": float(net_margin),
+            "eps": rev_m * 1e6 * net_margin / 100.0 / shares,
+        })
+    net_income = revenue * net_margin / 100.0
+    return {
+        "fy24_financials": {
+            "revenue": revenue,
+            "gross_margin_pct": float(gross_margin),
+            "ebitda": revenue * ebitda_margin / 100.0,
+            "net_income": net_income,
+            "eps": net_income / shares,
+            "shares_outstanding": shares,
+            "gross_profit": revenue * gross_margin / 100.0,
+            "ebitda_margin_pct": float(ebitda_margin),
+            "fcf": revenue * fcf_margin / 100.0,
+            "fcf_margin_pct": float(fcf_margin),
+        },
+        "market_data": {
+            "current_price": float(price),
+            "market_cap": price * shares,
+            "enterprise_value": price * shares * 1.05,
+            "pe_ratio": price / (net_income / shares),
+        },
+        "company_name": ticker.upper(),
+        "sector": SECTORS[seed % len(SECTORS)],
+        "industry": None,
+        "source": "replay",
+        "currency_info": {
+            "original_currency": "USD",
+            "converted_to_usd": False,
+            "conversion_rate": 1.0,
+            "exchange_rate_source": "none",
+        },
+        "historical_financials": historical,
+    }
+
+
+def synthetic_download(tickers, start, end, **kwargs):
+    """Frame shaped like yf.download(tickers, group_by='ticker', auto_adjust=True)."""
+    if isinstance(tickers, str):
+        tickers = tickers.split()
+    index = pd.bdate_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), name="Date")
+    frames = {}
+    for ticker in tickers:
+        seed = zlib.crc32(ticker.upper().encode())
+        rng = np.random.default_rng(seed)
+        close = (10 + seed % 490) * np.exp(np.cumsum(rng.normal(0.0003, 0.02, len(index))))
+        spread = np.abs(rng.normal(0, 0.01, len(index)))
+        frames[ticker] = pd.DataFrame({
+            "Open": close * (1 + rng.normal(0, 0.005, len(index))),
+            "High": close * (1 + spread),
+            "Low": close * (1 - spread),
+            "Close": close,
+            "Volume": rng.integers(1e5, 1e7, len(index)).astype(float),
+        }, index=index)
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, axis=1, names=["Ticker", "Price"])
+
+
+def replay_financials(ticker, deadline=None):
+    """Serve a recorded (or synthetic) payload after the simulated upstream delay."""
+    key = ticker.upper()
+    with _lock:
+        cold = key not in _warm
+        _warm.add(key)
+    delay = (REPLAY_COLD_MS if cold else REPLAY_HOT_MS) / 1000.0
+    if deadline is not None:
+        delay = min(delay, max(0.0, float(deadline)))
+    time.sleep(delay)
+    path = _recording_path(key)
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    return synthetic_financials(key)
+
+
+def record_financials(fetch):
+    """Wrap a live fetcher so every result is saved for replay."""
+    def _fetch(ticker, deadline=None):
+        result = fetch(ticker, deadline=deadline)
+        if result.get("missing"):
+            return result  # don't record partial results
+        REPLAY_DIR.mkdir(parents=True, exist_ok=True)
+        with open(_recording_path(ticker), "w") as f:
+            json.dump(result, f, allow_nan=False)
+        return result
+    return _fetch
+
+
+def reset():
+    """Forget which tickers are warm, so the next requests are cold again."""
+    with _lock:
+        _warm.clear()
@@ -0,0 +1,205 @@
+"""
+Rolling risk metrics for holdings and the whole portfolio.
+
+Volatility, beta against a benchmark (SPY), Sharpe ratio and max drawdown
+over trailing 30/90/252-day windows. Every ticker is a column of one
+date x ticker matrix and each statistic comes out of a single O(n) pass
+down it:
+
+- window sums (returns, squares, cross-products with the benchmark) are
+  differences of cumulative sums, so a window costs O(1) however long it is;
+- window max drawdowns use the van Herk/Gil-Werman block decomposition
+  (prefix and suffix highs, lows and drawdowns per block of `window`
+  rows), also O(n) and fully vectorized.
+
+Returns are simple daily returns, as in portfolio-analysis, and the
+portfolio is the daily-rebalanced weighted sum of its holdings' returns.
+"""
+import numpy as np
+
+import dcf
+import price_matrix
+from scripts.timing import span
+
+DEFAULT_WINDOWS = (30, 90, 252)
+BENCHMARK = "SPY"
+DEFAULT_RISK_FREE_PCT = 4.5  # same annual rate portfolio-analysis uses
+PORTFOLIO = "PORTFOLIO"
+
+
+def window_sum(x, window):
+    """Trailing `window`-row sums down axis 0; rows before a full window are NaN."""
+    out = np.full(x.shape, np.nan)
+    if window > x.shape[0]:
+        return out
+    c = np.cumsum(x, axis=0)
+    out[window - 1] = c[window - 1]
+    out[window:] = c[window:] - c[:-window]
+    return out
+
+
+def window_max_drawdown(levels, window):
+    """Trailing `window`-row max drawdown down axis 0, NaN-padded.
+
+    Peak and trough both lie inside the window. Blocks of `window` rows as
+    in van Herk/Gil-Werman: a window is the tail of one block and the head
+    of the next, and its drawdown is the deepest of the tail's, the head's
+    and the drop from the tail's high to the head's low.
+    """
+    n = levels.shape[0]
+    out = np.full(levels.shape, np.nan)
+    if window > n:
+        return out
+    blocks = -(-n // window)
+    padded = np.full((blocks * window,) + levels.shape[1:], np.nan)
+    padded[:n] = levels
+    shaped = padded.reshape((blocks, window) + levels.shape[1:])
+    reverse = shaped[:, ::-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # From each block's start up to a row: high, low, deepest drop
+        head_high = np.maximum.accumulate(shaped, axis=1)
+        head_low = np.minimum.accumulate(shaped, axis=1).reshape(padded.shape)
+        head_dd = np.maximum.accumulate(1.0 - shaped / head_high, axis=1).reshape(padded.shape)
+        # From a row to its block's end: high, deepest drop (each row as the peak, the low after it as trough)
+        tail_high = np.maximum.accumulate(reverse, axis=1)[:, ::-1].reshape(padded.shape)
+        tail_low = np.minimum.accumulate(reverse, axis=1)
+        tail_dd = np.maximum.accumulate(1.0 - tail_low / reverse, axis=1)[:, ::-1].reshape(padded.shape)
+        starts, ends = slice(0, n - window + 1), slice(window - 1, n)
+        across = np.maximum(np.maximum(tail_dd[starts], head_dd[ends]), 1.0 - head_low[ends] / tail_high[starts])
+    # A window that is exactly one block has no head part
+    one_block = ((np.arange(window - 1, n) + 1) % window == 0).reshape((-1,) + (1,) * (levels.ndim - 1))
+    out[window - 1:] = np.where(one_block, tail_dd[starts], across)
+    return out
+
+
+def rolling_metrics(returns, levels, bench_returns, window, risk_free=0.0):
+    """Annualized vol, beta, Sharpe and max drawdown for every column.
+
+    returns: (T, N) daily simple returns, NaN before a series starts.
+    levels: (T, N) price (or index) levels the returns come from.
+    bench_returns: (T,) benchmark returns on the same dates, no gaps.
+    Max drawdown is the deepest drop from a high to a later low, both
+    within the window.
+    """
+    valid = np.isfinite(returns)
+    count = np.maximum(valid.sum(axis=0), 1)
+    col_mean = np.where(valid, returns, 0.0).sum(axis=0) / count
+    # Centre first so the sum-of-squares variances don't lose precision
+    r = np.where(valid, returns - col_mean, 0.0)
+    m = (bench_returns - bench_returns.mean())[:, None]
+
+    full = window_sum(valid.astype(float), window) == window
+    s1 = window_sum(r, window)
+    s2 = window_sum(r * r, window)
+    var = np.maximum(s2 - s1 * s1 / window, 0.0) / (window - 1)
+    vol = np.sqrt(var * price_matrix.TRADING_DAYS)
+
+    m1 = window_sum(m, window)
+    m2 = window_sum(m * m, window)
+    cross = window_sum(r * m, window)
+    cov = cross - s1 * m1 / window
+    bench_var = m2 - m1 * m1 / window
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        beta = cov / bench_var
+        mean = s1 / window + col_mean
+        sharpe = (mean * price_matrix.TRADING_DAYS - risk_free) / vol
+    max_dd = window_max_drawdown(levels, window)
+
+    return {
+        "volatility": np.where(full, vol, np.nan),
+        "beta": np.where(full & (bench_var > 0), beta, np.nan),
+        "sharpe": np.where(full & (vol > 0), sharpe, np.nan),
+        "max_drawdown": np.where(full, max_dd, np.nan),
+    }
+
+
+def portfolio_levels(returns, weights):
+    """Daily-rebalanced portfolio returns and index level (starts at 1).
+
+    Holdings that haven't started trading yet are left out and the remaining
+    weights renormalized for that day.
+    """
+    valid = np.isfinite(returns)
+    w = np.where(valid, weights[None, :], 0.0)
+    total = w.sum(axis=1)
+    with np.errstate(invalid="ignore"):
+        port = np.where(total > 0, (np.where(valid, returns, 0.0) * w).sum(axis=1) / total, np.nan)
+    level = np.cumprod(1.0 + np.nan_to_num(port))
+    return port, level
+
+
+def analyze(closes, benchmark, weights=None, windows=DEFAULT_WINDOWS, risk_free_pct=DEFAULT_RISK_FREE_PCT):
+    """Rolling metrics for every column of `closes` plus the weighted portfolio.
+
+    closes: date x ticker frame; benchmark: Series of benchmark closes.
+    weights: {ticker: weight}; equal weights when omitted.
+    Returns (dates, series names, {window: {metric: (T, N+1) array}}).
+    """
+    frame = closes.join(benchmark.rename("__benchmark__"), how="inner").ffill()
+    frame = frame[frame["__benchmark__"].notna()]
+    bench = frame.pop("__benchmark__").to_numpy(dtype=float)
+    tickers = list(frame.columns)
+    prices = frame.to_numpy(dtype=float)
+
+    returns = prices[1:] / prices[:-1] - 1.0
+    bench_returns = bench[1:] / bench[:-1] - 1.0
+    levels = prices[1:]
+
+    if weights:
+        weights = {k.upper(): float(v) for k, v in weights.items()}
+        w = np.array([weights.get(t, 0.0) for t in tickers])
+    else:
+        w = np.ones(len(tickers))
+    port, port_level = portfolio_levels(returns, w / w.sum() if w.sum() else w)
+
+    returns = np.column_stack([returns, port])
+    levels = np.column_stack([levels, port_level])
+    results = {}
+    for window in windows:
+        with span("rolling_risk", window=window, series=returns.shape[1]):
+            results[window] = rolling_metrics(returns, levels, bench_returns, int(window), risk_free_pct / 100.0)
+    return frame.index[1:], tickers + [PORTFOLIO], results
+
+
+def to_payload(dates, names, results, points=None):
+    """Columnar chart payload plus the latest value of every metric.
+
+    `points` keeps only the most recent rows of each series.
+    """
+    rows = slice(-int(points), None) if points else slice(None)
+    series, latest = {}, {}
+    for window, metrics_by_name in results.items():
+        key = str(window)
+        series[key], latest[key] = {}, {}
+        for metric, arr in metrics_by_name.items():
+            series[key][metric] = dict(zip(names, dcf.json_grid(arr[rows].T)))
+            latest[key][metric] = dict(zip(names, dcf.json_grid(arr[-1])))
+    return {
+        "dates": [d.strftime("%Y-%m-%d") for d in dates[rows]],
+        "tickers": names,
+        "latest": latest,
+        "series": series,
+    }
+
+
+def rolling_risk(tickers, weights=None, windows=DEFAULT_WINDOWS, benchmark=BENCHMARK,
+                 risk_free_pct=DEFAULT_RISK_FREE_PCT, points=None, include_series=True):
+    """Fetch prices for `tickers` and the benchmark and build the payload."""
+    tickers = [t.upper() for t in tickers]
+    benchmark = benchmark.upper()
+    closes = price_matrix.load_closes(list(dict.fromkeys(tickers + [benchmark])))
+    if closes.empty or benchmark not in closes:
+        raise ValueError(f"No price history for benchmark {benchmark}")
+    missing = [t for t in tickers if t not in closes]
+    bench = closes[benchmark]
+    closes = closes[[t for t in dict.fromkeys(tickers) if t in closes]]
+    if closes.empty:
+        raise ValueError("No price history for any ticker")
+
+    dates, names, results = analyze(closes, bench, weights, windows, risk_free_pct)
+    payload = to_payload(dates, names, results, points)
+    if not include_series:
+        payload.pop("series")
+    payload.update({"benchmark": benchmark, "windows": [int(w) for w in windows], "missing": missing})
+    return payload
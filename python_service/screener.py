@@ -0,0 +1,166 @@
+"""
+Fundamental screener over the published universe snapshot.
+
+Filters are small expressions on snapshot table columns:
+
+    ebitda_margin_pct > 30
+    revenue_growth_pct >= 15%
+    sector == Technology
+
+Numbers may carry a trailing % (the columns are already in percent), text
+columns compare case-insensitively with == / !=. Every filter becomes one
+boolean mask over a column array, the masks are AND-ed, and the matches are
+ordered with a single argsort, so a screen over thousands of companies
+costs a few vectorized passes.
+
+The snapshot's table is converted to column arrays once per version and
+kept in memory until a new snapshot is published.
+"""
+import re
+import threading
+
+import numpy as np
+
+import dcf
+import snapshot
+
+DEFAULT_COLUMNS = [
+    "ticker", "company_name", "sector", "market_cap", "revenue",
+    "ebitda_margin_pct", "fcf_margin_pct", "revenue_growth_pct",
+    "pe_ratio", "ev_ebitda", "fcf_yield_pct",
+]
+MAX_LIMIT = 500
+
+OPERATORS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+    "=": np.equal,
+    "!=": np.not_equal,
+}
+_FILTER = re.compile(r"^\s*([A-Za-z_][A-Za-z0-9_]*)\s*(>=|<=|==|!=|>|<|=)\s*(.+?)\s*$")
+
+_universe = None
+_universe_lock = threading.Lock()
+
+
+class Universe:
+    """Column arrays of one snapshot table."""
+
+    def __init__(self, table, version):
+        self.version = version
+        self.size = len(table)
+        self.numeric = {}
+        self.text = {}
+        for column in table.columns:
+            if column in snapshot.TEXT_COLUMNS:
+                values = table[column].astype(object)
+                self.text[column] = values.where(values.notna(), None).to_numpy()
+            else:
+                # A view when the table is already float (a shared snapshot's is)
+                self.numeric[column] = table[column].to_numpy(dtype=float)
+        # Lower-cased copies so text filters don't re-normalize per request
+        self.folded = {
+            column: np.array([v.lower() if isinstance(v, str) else "" for v in values], dtype=object)
+            for column, values in self.text.items()
+        }
+
+    @property
+    def columns(self):
+        return [*self.text, *self.numeric]
+
+    def mask(self, column, op, value):
+        if column in self.numeric:
+            with np.errstate(invalid="ignore"):
+                # NaN compares False, so companies missing a metric drop out
+                return OPERATORS[op](self.numeric[column], value)
+        return OPERATORS[op](self.folded[column], value.lower())
+
+    def rows(self, index, columns):
+        out = [{} for _ in index]
+        for column in columns:
+            if column == "partial":
+                values = [bool(v) for v in self.numeric[column][index]]
+            elif column in self.numeric:
+                values = dcf.json_grid(self.numeric[column][index])
+            else:
+                values = self.text[column][index]
+            for row, v in zip(out, values):
+                row[column] = v
+        return out
+
+
+def parse_filter(expression, columns):
+    """(column, op, value) from 'column op value'; ValueError if it isn't one."""
+    match = _FILTER.match(expression or "")
+    if not match:
+        raise ValueError(f"Cannot parse filter: {expression!r}")
+    column, op, raw = match.groups()
+    if column not in columns:
+        raise ValueError(f"Unknown column: {column}")
+    raw = raw.strip().strip("'\"")
+    if column in snapshot.TEXT_COLUMNS:
+        if op not in ("=", "==", "!="):
+            raise ValueError(f"{column} only supports == and !=")
+        return column, op, raw
+    try:
+        value = float(raw.rstrip("%").replace(",", ""))
+    except ValueError:
+        raise ValueError(f"Not a number in filter: {expression!r}") from None
+    return column, op, value
+
+
+def parse_sort(sort, columns):
+    """(column, descending) from 'column', '-column' or 'column asc|desc'."""
+    if not sort:
+        return None, True
+    text = sort.strip()
+    descending = True
+    parts = text.split()
+    if len(parts) == 2 and parts[1].lower() in ("asc", "desc"):
+        text, descending = parts[0], parts[1].lower() == "desc"
+    elif text.startswith(("-", "+")):
+        text, descending = text[1:], text[0] == "-"
+    if text not in columns:
+        raise ValueError(f"Unknown sort column: {text}")
+    return text, descending
+
+
+def current_universe():
+    """Universe for the published snapshot, rebuilt only when its version changes."""
+    global _universe
+    snap = snapshot.current()
+    if snap is None:
+        return None
+    with _universe_lock:
+        if _universe is None or _universe.version != snap.version:
+            _universe = Universe(snap.table, snap.version)
+        return _universe
+
+
+def screen(universe, filters=(), sort=None, descending=True, offset=0, limit=50, columns=None):
+    """One page of tickers passing every filter, ordered by `sort`."""
+    keep = np.ones(universe.size, dtype=bool)
+    for column, op, value in filters:
+        keep &= universe.mask(column, op, value)
+    index = np.flatnonzero(keep)
+    if sort in universe.numeric:
+        values = universe.numeric[sort][index]
+        # Missing values sort last in either direction
+        order = np.lexsort((-values if descending else values, np.isnan(values)))
+        index = index[order]
+    elif sort is not None:
+        folded = universe.folded[sort][index]
+        order = np.argsort(folded, kind="stable")
+        index = index[order[::-1] if descending else order]
+    page = index[offset:offset + limit]
+    return {
+        "snapshot_version": universe.version,
+        "universe_size": universe.size,
+        "matches": int(index.size),
+        "offset": offset,
+        "limit": limit,
+        "results": universe.rows(page, columns or DEFAULT_COLUMNS),
+    }
@@ -0,0 +1,209 @@
+"""
+Read-only data shared between uvicorn workers through shared memory.
+
+With several workers each process would otherwise hold its own copy of the
+universe snapshot, the aligned price matrix and the FX table. Instead a
+loader (see shared_loader.py) writes each dataset into one shared memory
+segment and every worker maps it and reads the NumPy arrays in place.
+
+A segment is an 8-byte header length, a JSON header (metadata plus the
+dtype, shape and offset of every array) and the arrays, 64-byte aligned.
+Segments are never modified: a refresh writes a new segment and then
+atomically replaces SHARED_DATA_DIR/<dataset>, a small JSON pointer to the
+segment name, like snapshot CURRENT. Workers stat the pointer on each use
+and attach the new segment when it changes; the loader unlinks a segment
+once two newer ones are published. Unlinking only removes the name: a
+worker's mapping, and every array viewing it, stays valid until the last
+of those arrays is gone.
+
+Workers only look for segments with SHARED_DATA=1, which the launcher sets.
+Segments are mapped through /dev/shm, so this is Linux only; elsewhere
+workers find nothing to attach and load their own data as before.
+"""
+import os
+import json
+import time
+import mmap
+import tempfile
+import threading
+from pathlib import Path
+from multiprocessing import shared_memory
+
+import numpy as np
+
+SHARED_DATA = os.environ.get("SHARED_DATA", "0") == "1"
+SHARED_DATA_DIR = Path(os.environ.get("SHARED_DATA_DIR", Path(tempfile.gettempdir()) / "fincast-shared"))
+_ALIGN = 64
+# Where Linux keeps POSIX shared memory objects as files
+_SHM_DIR = Path("/dev/shm")
+# Segments kept per dataset by the publisher: the current one and the one before
+KEEP_SEGMENTS = 2
+
+
+def _aligned(n):
+    return -(-n // _ALIGN) * _ALIGN
+
+
+def _layout(arrays, meta):
+    """(header bytes, data offset, total size) for a set of arrays."""
+    specs, offset = {}, 0
+    for name, array in arrays.items():
+        specs[name] = {
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+            "order": "F" if array.ndim > 1 and array.flags.f_contiguous and not array.flags.c_contiguous else "C",
+            "offset": offset,
+        }
+        offset = _aligned(offset + array.nbytes)
+    header = json.dumps({"meta": meta, "arrays": specs}).encode()
+    base = _aligned(8 + len(header))
+    return header, base, base + max(offset, 1)
+
+
+def write_segment(name, arrays, meta):
+    """Create shared memory segment `name` holding `arrays` (name -> ndarray) and `meta`."""
+    arrays = {key: np.asarray(value) for key, value in arrays.items()}
+    for key, array in arrays.items():
+        if array.dtype.hasobject:
+            raise TypeError(f"Array {key!r} has object dtype and can't be shared")
+    header, base, size = _layout(arrays, meta)
+    shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    shm.buf[:8] = len(header).to_bytes(8, "little")
+    shm.buf[8:8 + len(header)] = header
+    specs = json.loads(header)["arrays"]
+    for key, array in arrays.items():
+        spec = specs[key]
+        view = np.ndarray(array.shape, array.dtype, buffer=shm.buf, offset=base + spec["offset"], order=spec["order"])
+        view[...] = array
+        del view
+    return shm
+
+
+class Segment:
+    """An attached segment: `meta` and read-only `arrays` viewing the shared memory.
+
+    There is no close(): NumPy arrays keep the mapping itself alive (not a
+    buffer export), so unmapping while a view survives would leave it
+    dangling. The mapping goes away with the last array that uses it.
+    """
+
+    def __init__(self, mapping):
+        length = int.from_bytes(mapping[:8], "little")
+        header = json.loads(mapping[8:8 + length])
+        base = _aligned(8 + length)
+        self.meta = header["meta"]
+        self.arrays = {}
+        for key, spec in header["arrays"].items():
+            array = np.ndarray(tuple(spec["shape"]), np.dtype(spec["dtype"]), buffer=mapping,
+                               offset=base + spec["offset"], order=spec["order"])
+            array.flags.writeable = False
+            self.arrays[key] = array
+
+    def __getitem__(self, key):
+        return self.arrays[key]
+
+
+def attach(name):
+    """Map segment `name` read-only; FileNotFoundError if it is gone.
+
+    Mapped as a plain file under /dev/shm rather than through SharedMemory,
+    which before Python 3.13 registers with the resource tracker and so
+    unlinks the segment when this worker exits.
+    """
+    with open(_SHM_DIR / name, "rb") as f:
+        return Segment(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class Publisher:
+    """Loader side: writes segments and swaps the dataset pointers."""
+
+    def __init__(self, directory=None, prefix=None):
+        self.dir = Path(directory or SHARED_DATA_DIR)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix or f"fc{os.getpid()}"
+        self.segments = {}
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def publish(self, dataset, arrays, meta):
+        """Write a new version of `dataset` and point readers at it; returns the segment name."""
+        with self.lock:
+            self.counter += 1
+            name = f"{self.prefix}_{dataset}_{self.counter}"
+            shm = write_segment(name, arrays, meta)
+            pointer = self.dir / dataset
+            tmp = pointer.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"segment": name, "published_at": time.time(), "bytes": shm.size}))
+            os.replace(tmp, pointer)
+            live = self.segments.setdefault(dataset, [])
+            live.append(shm)
+            while len(live) > KEEP_SEGMENTS:
+                old = live.pop(0)
+                old.close()
+                old.unlink()
+            return name
+
+    def close(self):
+        """Remove every pointer and segment this publisher created."""
+        with self.lock:
+            for dataset, live in self.segments.items():
+                try:
+                    (self.dir / dataset).unlink()
+                except FileNotFoundError:
+                    pass
+                for shm in live:
+                    shm.close()
+                    shm.unlink()
+            self.segments = {}
+
+
+_attached = {}   # dataset -> (pointer stat key, Segment)
+_attach_lock = threading.Lock()
+
+
+def segment(dataset):
+    """The current Segment of `dataset`, or None when nothing is published (or SHARED_DATA is off)."""
+    if not SHARED_DATA:
+        return None
+    pointer = SHARED_DATA_DIR / dataset
+    try:
+        stat = pointer.stat()
+    except FileNotFoundError:
+        return None
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _attach_lock:
+        current = _attached.get(dataset)
+        if current is not None and current[0] == key:
+            return current[1]
+        try:
+            fresh = attach(json.loads(pointer.read_text())["segment"])
+        except (FileNotFoundError, ValueError, KeyError):
+            # Swapped again while we read the pointer; keep what we have
+            return current[1] if current is not None else None
+        _attached[dataset] = (key, fresh)
+        return fresh
+
+
+def lookup(sorted_keys, keys):
+    """Positions of `keys` in the sorted string array `sorted_keys`, None if any is missing."""
+    # Not cast to sorted_keys.dtype: that would truncate longer keys into false matches
+    keys = np.asarray(list(keys), dtype=str)
+    if sorted_keys.size == 0:
+        return None if len(keys) else np.empty(0, dtype=int)
+    positions = np.searchsorted(sorted_keys, keys)
+    positions[positions >= sorted_keys.size] = 0
+    if not np.array_equal(sorted_keys[positions], keys):
+        return None
+    return positions
+
+
+def fx_rate(from_currency, to_currency="USD"):
+    """Rate from the shared FX table, None when it isn't published or lacks a currency."""
+    seg = segment("fx")
+    if seg is None:
+        return None
+    positions = lookup(seg["currencies"], [from_currency.upper(), to_currency.upper()])
+    if positions is None:
+        return None
+    usd = seg["usd_per_unit"]
+    return float(usd[positions[0]] / usd[positions[1]])
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Multi-worker launcher for python_service with a shared-memory data plane.
+
+    python shared_loader.py --workers 4 --port 10000
+
+Publishes the hot read-only datasets as shared memory segments (see
+shared_data.py), keeps them fresh from a loader thread, and runs
+`uvicorn main:app` with that many worker processes, which attach the
+segments instead of each loading its own copy:
+
+    universe   the published bulk snapshot (table columns and payloads),
+               republished whenever CURRENT changes
+    fx         USD rates for the fallback table's and the snapshot's
+               currencies, every SHARED_FX_INTERVAL seconds
+    prices     aligned closes of SHARED_PRICE_TICKERS ("snapshot" for the
+               snapshot's tickers, up to SHARED_PRICE_MAX_TICKERS, or a
+               comma-separated list), every SHARED_PRICES_INTERVAL seconds
+
+The loader checks for work every SHARED_DATA_INTERVAL seconds. Workers
+fall back to their usual paths for anything that isn't published (yet).
+Segments are removed when the launcher exits.
+
+Work that would otherwise be repeated by every worker is done once here or
+split between them: the pre-warming scheduler (PREWARM_TOP_N) runs in the
+loader on the workers' merged reports (see prewarm.py), and MC_WORKERS
+(default: all CPUs) is the machine's Monte Carlo process budget, divided
+between the workers' pools.
+"""
+import os
+import sys
+import time
+import shutil
+import asyncio
+import argparse
+import threading
+from pathlib import Path
+
+import numpy as np
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import snapshot
+import prewarm
+import montecarlo
+import price_matrix
+import shared_data
+from scripts.fetch_yfinance import EXCHANGE_RATE_URL, FALLBACK_FX_RATES, fetch_financials
+from scripts.fetch_portfolio_prices import fetch_close_matrix
+from scripts.result_cache import cache as result_cache
+
+SHARED_DATA_INTERVAL = float(os.environ.get("SHARED_DATA_INTERVAL", "60"))
+SHARED_FX_INTERVAL = float(os.environ.get("SHARED_FX_INTERVAL", "3600"))
+SHARED_PRICES_INTERVAL = float(os.environ.get("SHARED_PRICES_INTERVAL", "3600"))
+SHARED_PRICE_TICKERS = os.environ.get("SHARED_PRICE_TICKERS", "")
+SHARED_PRICE_MAX_TICKERS = int(os.environ.get("SHARED_PRICE_MAX_TICKERS", "3000"))
+
+
+def fx_arrays(currencies):
+    """(arrays, meta) of USD per unit of each currency, None if the rate API is down."""
+    try:
+        response = requests.get(EXCHANGE_RATE_URL.format(currency="USD"), timeout=10)
+        response.raise_for_status()
+        rates = response.json()["rates"]
+    except (requests.RequestException, ValueError, KeyError) as e:
+        # Stale API rates beat publishing the rough fallback table to every worker
+        print(f"[shared] FX rates unavailable: {e}", file=sys.stderr)
+        return None
+    table = {"USD": 1.0}
+    for currency in currencies:
+        per_usd = rates.get(currency)
+        if per_usd:
+            table[currency] = 1.0 / float(per_usd)
+        elif currency in FALLBACK_FX_RATES:
+            table[currency] = FALLBACK_FX_RATES[currency]
+    names = sorted(table)
+    arrays = {
+        "currencies": np.array(names, dtype=str),
+        "usd_per_unit": np.array([table[c] for c in names], dtype=float),
+    }
+    return arrays, {"published_at": time.time()}
+
+
+class Loader:
+    """Publishes each dataset when it is due."""
+
+    def __init__(self, publisher):
+        self.publisher = publisher
+        self.universe_version = None
+        self.tickers = []
+        self.currencies = set()
+        self.fx_due = 0.0
+        self.prices_due = 0.0
+        self.stopped = threading.Event()
+
+    def publish_universe(self):
+        """Publish the snapshot CURRENT names if it changed; this process keeps no copy."""
+        try:
+            version = (snapshot.SNAPSHOT_DIR / "CURRENT").read_text().strip()
+        except FileNotFoundError:
+            return False
+        if version == self.universe_version:
+            return False
+        snap = snapshot.Snapshot(snapshot.SNAPSHOT_DIR / version)
+        arrays, meta = snapshot.shared_arrays(snap)
+        self.publisher.publish("universe", arrays, meta)
+        self.universe_version = snap.version
+        self.tickers = list(snap.table["ticker"])
+        self.currencies = {c for c in snap.table["currency"].dropna().unique() if isinstance(c, str)}
+        print(f"[shared] universe {snap.version}: {len(snap.payloads)} tickers", file=sys.stderr)
+        return True
+
+    def publish_fx(self):
+        published = fx_arrays(sorted(set(FALLBACK_FX_RATES) | self.currencies))
+        if published is None:
+            return False
+        self.publisher.publish("fx", *published)
+        return True
+
+    def price_tickers(self):
+        spec = SHARED_PRICE_TICKERS.strip()
+        if spec.lower() == "snapshot":
+            tickers = self.tickers
+        else:
+            tickers = [t.strip().upper() for t in spec.split(",") if t.strip()]
+        return tickers[:SHARED_PRICE_MAX_TICKERS]
+
+    def publish_prices(self):
+        tickers = self.price_tickers()
+        if not tickers:
+            return False
+        frame = fetch_close_matrix(tickers)
+        if frame.empty:
+            return False
+        arrays, meta = price_matrix.shared_arrays(frame)
+        self.publisher.publish("prices", arrays, meta)
+        print(f"[shared] prices: {frame.shape[1]} tickers x {frame.shape[0]} days", file=sys.stderr)
+        return True
+
+    def _step(self, name, publish):
+        try:
+            return publish()
+        except Exception as e:
+            print(f"[shared] {name} publish failed: {e}", file=sys.stderr)
+            return False
+
+    def run_once(self):
+        """Publish whatever is due; FX and prices retry next round until they succeed."""
+        now = time.monotonic()
+        self._step("universe", self.publish_universe)
+        if now >= self.fx_due and self._step("fx", self.publish_fx):
+            self.fx_due = now + SHARED_FX_INTERVAL
+        if now >= self.prices_due and self._step("prices", self.publish_prices):
+            self.prices_due = now + SHARED_PRICES_INTERVAL
+
+    def run(self):
+        self.run_once()
+        while not self.stopped.wait(SHARED_DATA_INTERVAL):
+            self.run_once()
+
+
+def run_prewarm():
+    """The workers' pre-warming scheduler, on its own event loop in this thread."""
+    async def fetch(ticker):
+        return await asyncio.to_thread(fetch_financials, ticker)
+
+    async def run_sync(fn, *args, **kwargs):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    asyncio.run(prewarm.run_forever(fetch, run_sync, merge=True))
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run python_service workers on shared read-only data")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "10000")))
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    # Workers inherit the environment
+    os.environ["SHARED_DATA"] = "1"
+    os.environ["SHARED_DATA_DIR"] = str(shared_data.SHARED_DATA_DIR)
+    os.environ["MC_WORKERS"] = str(max(1, montecarlo.MC_WORKERS // workers))
+    # This process reads the universe from its own segments too (pre-warming checks it)
+    shared_data.SHARED_DATA = True
+    publisher = shared_data.Publisher()
+    loader = Loader(publisher)
+    # Universe and FX before the workers start; prices can take a while, so they follow
+    loader._step("universe", loader.publish_universe)
+    if loader._step("fx", loader.publish_fx):
+        loader.fx_due = time.monotonic() + SHARED_FX_INTERVAL
+    threading.Thread(target=loader.run, name="shared-loader", daemon=True).start()
+    if prewarm.PREWARM_TOP_N > 0:
+        if result_cache.backend is None:
+            print("[shared] pre-warming needs a shared result cache (RESULT_CACHE_URL); off", file=sys.stderr)
+        else:
+            threading.Thread(target=run_prewarm, name="shared-prewarm", daemon=True).start()
+    try:
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=workers,
+                    app_dir=str(Path(__file__).parent))
+    finally:
+        loader.stopped.set()
+        publisher.close()
+        shutil.rmtree(prewarm.REPORT_DIR, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Universe snapshots of `fetch_financials` output.
+
+A snapshot is one bulk refresh run (see bulk_refresh.py), stored under
+SNAPSHOT_DIR/<version>/:
+
+    checkpoint.jsonl   one line per finished ticker, appended as the run goes
+    payloads.jsonl     the full fetch_financials payload per ticker
+    table.parquet      flat, one row per ticker, one column per metric
+                       (table.csv when pyarrow isn't installed)
+    manifest.json      version, timings, counts, failures
+
+SNAPSHOT_DIR/CURRENT names the published version. While it is younger than
+SNAPSHOT_MAX_AGE_HOURS the service answers fetches for its tickers from the
+snapshot instead of calling Yahoo.
+
+In a multi-worker deployment the loader publishes the snapshot as a shared
+memory segment (see shared_data.py) and current() hands out a
+SharedSnapshot reading the table columns and payloads in place.
+"""
+import os
+import json
+import time
+import copy
+import threading
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import metrics
+import shared_data
+
+SNAPSHOT_DIR = Path(os.environ.get("SNAPSHOT_DIR", Path(__file__).parent / "snapshots"))
+SNAPSHOT_MAX_AGE_HOURS = float(os.environ.get("SNAPSHOT_MAX_AGE_HOURS", "36"))
+SNAPSHOT_SERVE = os.environ.get("SNAPSHOT_SERVE", "1") == "1"
+
+try:
+    import pyarrow  # noqa: F401
+    TABLE_FILE = "table.parquet"
+except ImportError:
+    TABLE_FILE = "table.csv"
+
+# Flat table columns, in order. Ratios and growth are in percent like the payload.
+COLUMNS = [
+    "ticker", "company_name", "sector", "industry", "currency",
+    "revenue", "gross_profit", "gross_margin_pct", "ebitda", "ebitda_margin_pct",
+    "net_income", "net_margin_pct", "eps", "shares_outstanding", "fcf", "fcf_margin_pct",
+    "current_price", "market_cap", "enterprise_value", "pe_ratio",
+    "ev_ebitda", "ev_sales", "ev_fcf", "fcf_yield_pct", "earnings_yield_pct",
+    "revenue_growth_pct", "revenue_cagr_pct", "history_years",
+    "partial", "fetched_at",
+]
+TEXT_COLUMNS = ("ticker", "company_name", "sector", "industry", "currency")
+
+
+def _ratio(numerator, denominator, scale=1.0):
+    return numerator / denominator * scale if numerator and denominator and denominator > 0 else None
+
+
+def flatten(ticker, payload, fetched_at=None):
+    """One table row from a fetch_financials payload."""
+    fy = payload.get("fy24_financials") or {}
+    md = payload.get("market_data") or {}
+    history = payload.get("historical_financials") or []
+    revenue = fy.get("revenue") or 0.0
+    ev = md.get("enterprise_value") or 0.0
+    market_cap = md.get("market_cap") or 0.0
+    cagr = None
+    if len(history) >= 2 and history[0].get("revenue", 0) > 0 and history[-1].get("revenue", 0) > 0:
+        cagr = ((history[-1]["revenue"] / history[0]["revenue"]) ** (1.0 / (len(history) - 1)) - 1.0) * 100.0
+    return {
+        "ticker": ticker.upper(),
+        "company_name": payload.get("company_name") or ticker.upper(),
+        "sector": payload.get("sector"),
+        "industry": payload.get("industry"),
+        "currency": (payload.get("currency_info") or {}).get("original_currency"),
+        "revenue": revenue,
+        "gross_profit": fy.get("gross_profit"),
+        "gross_margin_pct": fy.get("gross_margin_pct"),
+        "ebitda": fy.get("ebitda"),
+        "ebitda_margin_pct": fy.get("ebitda_margin_pct"),
+        "net_income": fy.get("net_income"),
+        "net_margin_pct": _ratio(fy.get("net_income"), revenue, 100.0),
+        "eps": fy.get("eps"),
+        "shares_outstanding": fy.get("shares_outstanding"),
+        "fcf": fy.get("fcf"),
+        "fcf_margin_pct": fy.get("fcf_margin_pct"),
+        "current_price": md.get("current_price"),
+        "market_cap": market_cap,
+        "enterprise_value": ev,
+        "pe_ratio": md.get("pe_ratio"),
+        "ev_ebitda": _ratio(ev, fy.get("ebitda")),
+        "ev_sales": _ratio(ev, revenue),
+        "ev_fcf": _ratio(ev, fy.get("fcf")),
+        "fcf_yield_pct": _ratio(fy.get("fcf"), market_cap, 100.0) if (fy.get("fcf") or 0) > 0 else None,
+        "earnings_yield_pct": _ratio(fy.get("net_income"), market_cap, 100.0),
+        "revenue_growth_pct": history[-1].get("revenueGrowth") if len(history) >= 2 else None,
+        "revenue_cagr_pct": cagr,
+        "history_years": len(history),
+        "partial": bool(payload.get("missing")),
+        "fetched_at": fetched_at,
+    }
+
+
+def build_table(rows):
+    table = pd.DataFrame(rows, columns=COLUMNS)
+    numeric = [c for c in COLUMNS if c not in TEXT_COLUMNS and c != "partial"]
+    table[numeric] = table[numeric].apply(pd.to_numeric, errors="coerce")
+    return table
+
+
+def write_table(table, run_dir):
+    path = Path(run_dir) / TABLE_FILE
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    if TABLE_FILE.endswith(".parquet"):
+        table.to_parquet(tmp, index=False)
+    else:
+        table.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def read_table(run_dir):
+    run_dir = Path(run_dir)
+    if (run_dir / "table.parquet").exists():
+        return pd.read_parquet(run_dir / "table.parquet")
+    return build_table(pd.read_csv(run_dir / "table.csv").to_dict("records"))
+
+
+def publish(version):
+    """Point CURRENT at a finished run (atomic rename)."""
+    tmp = SNAPSHOT_DIR / "CURRENT.tmp"
+    tmp.write_text(str(version))
+    os.replace(tmp, SNAPSHOT_DIR / "CURRENT")
+
+
+class Snapshot:
+    """A published snapshot: the flat table plus full payloads by ticker."""
+
+    def __init__(self, run_dir):
+        self.dir = Path(run_dir)
+        self.manifest = json.loads((self.dir / "manifest.json").read_text())
+        self.version = self.manifest["version"]
+        self.created = float(self.manifest["finished_at"])
+        self.table = read_table(self.dir)
+        self.payloads = {}
+        with open(self.dir / "payloads.jsonl") as f:
+            for line in f:
+                record = json.loads(line)
+                self.payloads[record["ticker"]] = record["payload"]
+
+    def age_hours(self):
+        return (time.time() - self.created) / 3600.0
+
+    def get(self, ticker):
+        payload = self.payloads.get(ticker.upper())
+        return copy.deepcopy(payload) if payload is not None else None
+
+
+def shared_arrays(snap):
+    """(arrays, meta) publishing a Snapshot as one shared segment.
+
+    Numeric columns go into one column-major float matrix, so each column
+    (and the DataFrame block over all of them) is a view of the segment;
+    text columns are fixed-width strings with "" for missing, and payloads
+    are their JSON concatenated, sliced by ticker through `offsets`.
+    """
+    table = snap.table
+    numeric = [c for c in table.columns if c not in TEXT_COLUMNS]
+    arrays = {"numeric": np.asfortranarray(table[numeric].to_numpy(dtype=float))}
+    for column in TEXT_COLUMNS:
+        if column in table.columns:
+            values = table[column]
+            arrays[f"text:{column}"] = np.array(
+                [v if isinstance(v, str) else "" for v in values.where(values.notna(), None)], dtype=str)
+    tickers = sorted(snap.payloads)
+    blobs = [json.dumps(snap.payloads[t]).encode() for t in tickers]
+    arrays["payload_tickers"] = np.array(tickers, dtype=str)
+    arrays["payload_offsets"] = np.concatenate([[0], np.cumsum([len(b) for b in blobs], dtype=np.int64)])
+    arrays["payloads"] = np.frombuffer(b"".join(blobs), dtype=np.uint8)
+    meta = {
+        "version": snap.version,
+        "created": snap.created,
+        "manifest": snap.manifest,
+        "numeric_columns": numeric,
+        "text_columns": [c for c in TEXT_COLUMNS if c in table.columns],
+    }
+    return arrays, meta
+
+
+class SharedPayloads:
+    """Read-only {ticker: payload} over a shared segment, decoded per lookup."""
+
+    def __init__(self, segment):
+        self.tickers = segment["payload_tickers"]
+        self.offsets = segment["payload_offsets"]
+        self.blob = segment["payloads"]
+
+    def _position(self, ticker):
+        found = shared_data.lookup(self.tickers, [ticker])
+        return None if found is None else int(found[0])
+
+    def __contains__(self, ticker):
+        return self._position(ticker) is not None
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def get(self, ticker, default=None):
+        i = self._position(ticker)
+        if i is None:
+            return default
+        return json.loads(self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes())
+
+
+class SharedSnapshot:
+    """Snapshot interface over a segment published by the shared data loader."""
+
+    def __init__(self, segment):
+        meta = segment.meta
+        self.segment = segment
+        self.manifest = meta["manifest"]
+        self.version = meta["version"]
+        self.created = float(meta["created"])
+        self.payloads = SharedPayloads(segment)
+        self._table = None
+
+    @property
+    def table(self):
+        # Built on first use; the numeric block stays a view of the segment
+        if self._table is None:
+            meta = self.segment.meta
+            table = pd.DataFrame(self.segment["numeric"], columns=meta["numeric_columns"], copy=False)
+            for i, column in enumerate(meta["text_columns"]):
+                values = self.segment[f"text:{column}"]
+                table.insert(i, column, np.where(values == "", None, values.astype(object)))
+            self._table = table
+        return self._table
+
+    def age_hours(self):
+        return (time.time() - self.created) / 3600.0
+
+    def get(self, ticker):
+        # Decoded fresh on every call, so callers can't mutate shared state
+        return self.payloads.get(ticker.upper())
+
+
+_current = None
+_current_key = None
+_current_lock = threading.Lock()
+
+
+def current():
+    """The published snapshot, reloaded when CURRENT changes; None if there is none."""
+    global _current, _current_key
+    segment = shared_data.segment("universe")
+    if segment is not None:
+        with _current_lock:
+            if not isinstance(_current, SharedSnapshot) or _current.segment is not segment:
+                _current, _current_key = SharedSnapshot(segment), None
+            return _current
+    pointer = SNAPSHOT_DIR / "CURRENT"
+    try:
+        stat = pointer.stat()
+    except FileNotFoundError:
+        return None
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _current_lock:
+        if key != _current_key:
+            version = pointer.read_text().strip()
+            _current = Snapshot(SNAPSHOT_DIR / version)
+            _current_key = key
+        return _current
+
+
+def lookup(ticker):
+    """Snapshot payload for a ticker if serving is on and the snapshot is fresh."""
+    if not SNAPSHOT_SERVE:
+        return None, None
+    try:
+        snap = current()
+    except (OSError, ValueError, KeyError) as e:
+        metrics.UPSTREAM_ERRORS.inc(stage="snapshot", error=type(e).__name__)
+        return None, None
+    if snap is None or snap.age_hours() > SNAPSHOT_MAX_AGE_HOURS:
+        return None, None
+    payload = snap.get(ticker)
+    metrics.record_cache("snapshot", payload is not None)
+    return payload, snap.version
+
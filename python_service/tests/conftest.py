@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The service imports its modules as top-level names (uvicorn main:app) and
+# the shared fetchers as scripts.*
+SERVICE = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(SERVICE), str(SERVICE.parent)]
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+import covariance_store
+
+
+def random_closes(days, tickers, seed=0):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0005, 0.02, size=(days, len(tickers)))
+    index = pd.bdate_range("2020-01-01", periods=days)
+    return pd.DataFrame(100.0 * np.cumprod(1.0 + returns, axis=0), index=index, columns=tickers)
+
+
+def window_returns(closes, window):
+    prices = closes.to_numpy()
+    return (prices[1:] / prices[:-1] - 1.0)[-window:]
+
+
+def test_sliding_updates_match_a_full_recompute():
+    tickers = ["AAA", "BBB", "CCC", "SPY"]
+    closes = random_closes(300, tickers)
+    store = covariance_store.CovarianceStore(window=60)
+    store.load(closes.iloc[:200])
+    # Every appended bar past the window also removes the oldest one
+    assert store.extend(closes.iloc[200:]) == 100
+    expected = window_returns(closes, 60)
+    assert store.n == 60
+    assert np.allclose(store.mean, expected.mean(axis=0))
+    assert np.allclose(store.covariance(annualize=False), np.cov(expected, rowvar=False))
+    betas = store.betas("SPY", ["AAA"])
+    cov = np.cov(expected[:, 0], expected[:, 3])
+    assert np.isclose(betas["AAA"], cov[0, 1] / cov[1, 1])
+
+
+def test_drop_oldest_matches_the_shorter_window():
+    closes = random_closes(80, ["AAA", "BBB"], seed=1)
+    store = covariance_store.CovarianceStore(window=100)
+    store.load(closes)
+    store.drop_oldest(30)
+    expected = window_returns(closes, 79 - 30)
+    assert store.n == expected.shape[0]
+    assert np.allclose(store.covariance(annualize=False), np.cov(expected, rowvar=False))
+
+
+def test_resync_after_many_updates_keeps_the_statistics(monkeypatch):
+    monkeypatch.setattr(covariance_store, "RESYNC_EVERY", 7)
+    closes = random_closes(120, ["AAA", "BBB"], seed=2)
+    store = covariance_store.CovarianceStore(window=20)
+    store.load(closes.iloc[:30])
+    store.extend(closes.iloc[30:])
+    assert np.allclose(store.covariance(annualize=False), np.cov(window_returns(closes, 20), rowvar=False))
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+import dcf
+
+
+def scalar_dcf(base, growth, margin, r, g):
+    """Textbook loop DCF of one scenario, all rates in %."""
+    revenue, ev, fcf = base, 0.0, 0.0
+    for year, (gr, m) in enumerate(zip(growth, margin), start=1):
+        revenue *= 1 + gr / 100
+        fcf = revenue * m / 100
+        ev += fcf / (1 + r / 100) ** year
+    terminal = fcf * (1 + g / 100) / (r / 100 - g / 100)
+    return ev + terminal / (1 + r / 100) ** len(growth)
+
+
+def test_grid_matches_scalar_dcf():
+    base = np.array([1000.0, 250.0])
+    growth = np.array([[10.0, 8.0, 6.0], [3.0, 3.0, 3.0]])
+    margin = np.array([[15.0, 16.0, 17.0], [20.0, 20.0, 20.0]])
+    rates, growths, shifts = np.array([8.0, 10.0]), np.array([2.0, 3.0]), np.array([-1.0, 0.0, 1.0])
+    grid = dcf.dcf_grid(base, growth, margin, rates, growths, shifts)
+    assert grid.shape == (2, 2, 2, 3)
+    for c in range(2):
+        for i, r in enumerate(rates):
+            for j, g in enumerate(growths):
+                for k, s in enumerate(shifts):
+                    expected = scalar_dcf(base[c], growth[c], margin[c] + s, r, g)
+                    assert np.isclose(grid[c, i, j, k], expected)
+
+
+def test_grid_is_nan_where_discount_does_not_exceed_growth():
+    grid = dcf.dcf_grid([100.0], [[5.0, 5.0]], [[10.0, 10.0]], [3.0, 8.0], [3.0, 4.0], [0.0])
+    assert np.isnan(grid[0, 0, :, 0]).all()
+    assert np.isfinite(grid[0, 1, :, 0]).all()
+
+
+def test_grid_spec_num_is_bounded_before_allocating():
+    assert dcf.grid_values({"start": 6, "stop": 14, "num": 5}, None).tolist() == [6.0, 8.0, 10.0, 12.0, 14.0]
+    for num in (0, -1, dcf.DCF_MAX_CELLS + 1):
+        with pytest.raises(ValueError):
+            dcf.grid_values({"start": 6, "stop": 14, "num": num}, None)
+    with pytest.raises(ValueError):
+        dcf.grid_values([], None)
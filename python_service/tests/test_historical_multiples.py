@@ -0,0 +1,17 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import historical_multiples
+
+
+def test_no_statements_gives_no_multiples(monkeypatch):
+    quarters = historical_multiples.quarterly_frame(None, pd.DataFrame(), None)
+    prices = pd.Series(np.linspace(10.0, 20.0, 30), index=pd.bdate_range("2024-01-01", periods=30))
+    assert historical_multiples.compute_multiples(prices, quarters).empty
+
+    # An ETF: empty statements, so no payload and no price download
+    monkeypatch.setattr(historical_multiples, "fetch_attr", lambda company, attr, ticker: pd.DataFrame())
+    monkeypatch.setattr(historical_multiples, "_price_history", lambda *args: pytest.fail("prices fetched for a ticker without statements"))
+    assert historical_multiples.fetch_multiples("SPY") is None
+
@@ -0,0 +1,52 @@
+from email.utils import formatdate
+
+from starlette.requests import Request
+
+import http_cache
+
+
+def request(**headers):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/yf",
+        "headers": [(k.replace("_", "-").encode(), v.encode()) for k, v in headers.items()],
+    })
+
+
+def test_first_response_carries_validators():
+    response = http_cache.respond(request(), {"ticker": "AAPL"}, "financials")
+    assert response.status_code == 200
+    assert response.headers["etag"] == http_cache.etag_for(response.body)
+    assert response.headers["cache-control"] == http_cache.CACHE_CONTROL["financials"]
+    assert "last-modified" in response.headers
+
+
+def test_matching_etag_gets_an_empty_304():
+    first = http_cache.respond(request(), {"ticker": "MSFT"}, "prices")
+    etag = first.headers["etag"]
+    for match in (etag, f'W/{etag}', f'"other", {etag}', "*"):
+        response = http_cache.respond(request(if_none_match=match), {"ticker": "MSFT"}, "prices")
+        assert response.status_code == 304
+        assert response.body == b""
+        assert response.headers["etag"] == etag
+        assert response.headers["cache-control"] == http_cache.CACHE_CONTROL["prices"]
+
+
+def test_changed_body_is_sent_again():
+    etag = http_cache.respond(request(), {"price": 1}, "prices").headers["etag"]
+    response = http_cache.respond(request(if_none_match=etag), {"price": 2}, "prices")
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_if_modified_since_applies_without_if_none_match():
+    first = http_cache.respond(request(), {"ticker": "NVDA"}, "history")
+    since = first.headers["last-modified"]
+    assert http_cache.respond(request(if_modified_since=since), {"ticker": "NVDA"}, "history").status_code == 304
+    earlier = formatdate(0, usegmt=True)
+    assert http_cache.respond(request(if_modified_since=earlier), {"ticker": "NVDA"}, "history").status_code == 200
+    # If-None-Match wins when both are sent
+    assert http_cache.respond(
+        request(if_none_match='"other"', if_modified_since=since), {"ticker": "NVDA"}, "history"
+    ).status_code == 200
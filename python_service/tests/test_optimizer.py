@@ -0,0 +1,39 @@
+import numpy as np
+
+import optimizer
+
+
+def bisect_projection(v, lower, upper):
+    """Reference projection: bisect for the tau where clip(v - tau) sums to 1."""
+    lo, hi = (v - upper).min() - 1.0, (v - lower).max() + 1.0
+    for _ in range(200):
+        tau = (lo + hi) / 2
+        if np.clip(v - tau, lower, upper).sum() > 1.0:
+            lo = tau
+        else:
+            hi = tau
+    return np.clip(v - (lo + hi) / 2, lower, upper)
+
+
+def test_projection_matches_bisection():
+    rng = np.random.default_rng(7)
+    for _ in range(200):
+        n = int(rng.integers(2, 30))
+        lower = np.zeros(n) if rng.random() < 0.5 else rng.uniform(0.0, 0.5 / n, n)
+        upper = np.maximum(lower + 0.01, rng.uniform(1.5 / n, 1.0, n))
+        v = rng.normal(scale=rng.choice([0.01, 1.0, 100.0]), size=n)
+        w = optimizer.project_capped_simplex(v, lower, upper)
+        assert np.isclose(w.sum(), 1.0)
+        assert (w >= lower - 1e-12).all() and (w <= upper + 1e-12).all()
+        assert np.allclose(w, bisect_projection(v, lower, upper), atol=1e-9)
+
+
+def test_feasible_point_is_its_own_projection():
+    w = np.array([0.1, 0.2, 0.3, 0.4])
+    assert np.allclose(optimizer.project_capped_simplex(w, np.zeros(4), np.full(4, 0.5)), w)
+
+
+def test_caps_that_sum_to_one_are_hit_exactly():
+    upper = np.array([0.5, 0.3, 0.2])
+    w = optimizer.project_capped_simplex(np.array([5.0, -3.0, 1.0]), np.zeros(3), upper)
+    assert np.allclose(w, upper)
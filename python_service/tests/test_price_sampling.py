@@ -0,0 +1,50 @@
+import numpy as np
+
+from scripts import price_sampling
+
+
+def reference_lttb(x, y, points):
+    """Straightforward LTTB loop over the same buckets."""
+    n = len(x)
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    chosen, a = [0], 0
+    for b in range(points - 2):
+        start, end = edges[b], edges[b + 1]
+        if b + 2 < points - 1:
+            next_start, next_end = edges[b + 1], edges[b + 2]
+            cx, cy = np.mean(x[next_start:next_end]), np.mean(y[next_start:next_end])
+        else:
+            cx, cy = x[-1], y[-1]
+        best, best_area = start, -1.0
+        for i in range(start, end):
+            area = abs((x[a] - cx) * (y[i] - y[a]) - (x[a] - x[i]) * (cy - y[a]))
+            if area > best_area:
+                best, best_area = i, area
+        chosen.append(best)
+        a = best
+    return np.array(chosen + [n - 1])
+
+
+def test_lttb_matches_the_reference_loop():
+    rng = np.random.default_rng(3)
+    for n, points in [(10, 3), (100, 7), (1260, 300), (1000, 999)]:
+        x = np.arange(n, dtype=float)
+        y = np.cumsum(rng.normal(size=n))
+        idx = price_sampling.lttb_indices(x, y, points)
+        assert idx.size == points
+        assert idx[0] == 0 and idx[-1] == n - 1
+        assert (np.diff(idx) > 0).all()
+        assert np.array_equal(idx, reference_lttb(x, y, points))
+
+
+def test_lttb_keeps_a_spike():
+    y = np.zeros(500)
+    y[321] = 50.0
+    assert 321 in price_sampling.lttb_indices(np.arange(500, dtype=float), y, 20)
+
+
+def test_lttb_small_budgets():
+    x = np.arange(10, dtype=float)
+    assert np.array_equal(price_sampling.lttb_indices(x, x, 20), np.arange(10))
+    assert np.array_equal(price_sampling.lttb_indices(x, x, 2), [0, 9])
+    assert np.array_equal(price_sampling.lttb_indices(x, x, 1), [0])
@@ -0,0 +1,102 @@
+import numpy as np
+
+import price_store
+from price_store import REVISION_BARS
+
+
+def history(days=60, start="2025-01-01", seed=4):
+    dates = np.arange(np.datetime64(start), np.datetime64(start) + days)
+    closes = 100.0 + np.cumsum(np.random.default_rng(seed).normal(size=days))
+    return dates, closes
+
+
+def test_splice_lays_the_recent_window_over_the_end():
+    dates, closes = history()
+    new_dates, new_closes = dates[-10:] + 3, np.concatenate([closes[-7:], [1.0, 2.0, 3.0]])
+    # The last few bars of the overlap may be restated
+    new_closes[6] += 0.5
+    spliced = price_store.splice(dates, closes, new_dates, new_closes)
+    assert spliced is not None
+    out_dates, out_closes = spliced
+    assert np.array_equal(out_dates, np.concatenate([dates, dates[-3:] + 3]))
+    assert np.array_equal(out_closes[:-10], closes[:-7])
+    assert np.array_equal(out_closes[-10:], new_closes)
+
+
+def test_splice_detects_a_readjusted_history():
+    dates, closes = history()
+    new_dates, new_closes = dates[-10:], closes[-10:] * 0.5
+    assert price_store.splice(dates, closes, new_dates, new_closes) is None
+
+
+def test_splice_without_new_bars_keeps_the_history():
+    dates, closes = history()
+    out = price_store.splice(dates, closes, dates[:0], closes[:0])
+    assert out[0] is dates and out[1] is closes
+
+
+def test_delta_for_a_current_client_sends_only_new_bars():
+    dates, closes = history()
+    mark = price_store.marks(dates[:-2], closes[:-2])
+    out = price_store.delta(dates, closes, mark=mark)
+    assert not out["reset"]
+    assert out["replace_from"] == str(dates[-2])
+    assert [row["date"] for row in out["bars"]] == [str(d) for d in dates[-2:]]
+    assert price_store.delta(dates, closes, mark=price_store.marks(dates, closes))["bars"] == []
+
+
+def test_delta_resends_the_tail_when_it_was_restated():
+    dates, closes = history()
+    mark = price_store.marks(dates, closes)
+    restated = closes.copy()
+    restated[-1] += 1.0
+    out = price_store.delta(dates, restated, mark=mark)
+    assert not out["reset"]
+    assert out["replace_from"] == str(dates[-REVISION_BARS])
+    assert len(out["bars"]) == REVISION_BARS
+
+
+def test_delta_resets_when_the_anchor_changed_or_is_unknown():
+    dates, closes = history()
+    mark = price_store.marks(dates, closes)
+    out = price_store.delta(dates, closes * 0.5, mark=mark)
+    assert out["reset"] and len(out["bars"]) == dates.size
+    unknown = ["2030-01-01", mark[1], mark[2]]
+    assert price_store.delta(dates, closes, mark=unknown)["reset"]
+
+
+def test_delta_since_a_date():
+    dates, closes = history()
+    out = price_store.delta(dates, closes, since=str(dates[-4]))
+    assert not out["reset"]
+    assert len(out["bars"]) == 3
+
+
+def test_token_round_trip():
+    dates, closes = history()
+    entries = {"AAPL": price_store.marks(dates, closes)}
+    assert price_store.decode_token(price_store.encode_token(entries)) == entries
+
+
+def test_splice_refuses_a_window_that_leaves_a_gap():
+    dates, closes = history(days=31, start="2025-01-01")
+    new_dates = np.arange(np.datetime64("2025-03-01"), np.datetime64("2025-03-15"))
+    assert price_store.splice(dates, closes, new_dates, np.ones(new_dates.size)) is None
+    # A long weekend between the two is not a gap
+    weekend = dates[-1] + 1 + np.arange(price_store.MAX_GAP_DAYS)
+    assert price_store.splice(dates, closes, weekend, np.ones(weekend.size)) is not None
+
+
+def test_top_up_reloads_a_history_that_ends_before_the_window(monkeypatch):
+    today = np.datetime64("today", "D")
+    old_dates, old_closes = history(days=31, start=str(today - 60))
+    recent_dates, recent_closes = history(days=30, start=str(today - 29))
+    store = price_store.PriceStore()
+    store._put("OLD", old_dates, old_closes, 0.0)
+    store._put("NEW", recent_dates[:-1], recent_closes[:-1], 0.0)
+    windows, reloads = [], []
+    monkeypatch.setattr(price_store, "fetch_close_series", lambda tickers, days: windows.append(tickers) or {})
+    monkeypatch.setattr(price_store, "fetch_prices_cached", lambda tickers, refresh: reloads.append(tickers) or {})
+    store._top_up([(t, store.entries[t]) for t in ("OLD", "NEW")], 1.0)
+    assert windows == [["NEW"]]
+    assert reloads == [["OLD"]]
@@ -0,0 +1,287 @@
+"""
+Async Yahoo Finance client for python_service.
+
+Calls Yahoo's JSON endpoints directly (chart, fundamentals-timeseries,
+quoteSummary) on one pooled httpx.AsyncClient and parses only the rows
+fetch_financials reads, into plain dicts instead of pandas DataFrames.
+The tables are then handed to scripts.fetch_yfinance.build_financials, so
+the payload matches the yfinance path field for field.
+
+Selected with FETCH_BACKEND=async.
+"""
+import asyncio
+import math
+import time
+
+import httpx
+
+import shared_data
+
+from scripts.fetch_yfinance import (
+    EXCHANGE_RATE_URL,
+    FALLBACK_FX_RATES,
+    STAGE_BUDGET_SHARES,
+    STAGE_FIELDS,
+    annotate_partial,
+    build_financials,
+    debug,
+    fallback_financials,
+    remember_complete,
+    safe_float,
+)
+from scripts.rate_limit import yahoo as yahoo_rate
+from scripts.timing import span
+
+CHART_URL = "https://query2.finance.yahoo.com/v8/finance/chart/{ticker}"
+TIMESERIES_URL = "https://query2.finance.yahoo.com/ws/fundamentals-timeseries/v1/finance/timeseries/{ticker}"
+QUOTE_SUMMARY_URL = "https://query2.finance.yahoo.com/v10/finance/quoteSummary/{ticker}"
+COOKIE_URL = "https://fc.yahoo.com"
+CRUMB_URL = "https://query1.finance.yahoo.com/v1/test/getcrumb"
+
+USER_AGENT = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+
+# Timeseries type -> yfinance row label, for the rows build_financials reads
+INCOME_ROWS = {
+    "TotalRevenue": "Total Revenue",
+    "GrossProfit": "Gross Profit",
+    "EBITDA": "EBITDA",
+    "NetIncome": "Net Income",
+    "DilutedEPS": "Diluted EPS",
+    "DilutedAverageShares": "Diluted Average Shares",
+}
+CASH_FLOW_ROWS = {
+    "OperatingCashFlow": "Operating Cash Flow",
+    "CapitalExpenditure": "Capital Expenditure",
+}
+# Merged in this order, later modules win, like yfinance's Ticker.info
+INFO_MODULES = ("assetProfile", "quoteType", "price", "summaryDetail", "defaultKeyStatistics", "financialData")
+
+
+class Statement:
+    """Rows x period columns, exposing the DataFrame bits build_financials uses."""
+
+    def __init__(self, rows):
+        # rows: {label: {period: value}}
+        self._rows = {label: values for label, values in rows.items() if values}
+        periods = set()
+        for values in self._rows.values():
+            periods.update(values)
+        # Newest period first, as in yfinance statements
+        self.columns = sorted(periods, reverse=True)
+        self.index = list(self._rows)
+        self.loc = self
+
+    @property
+    def empty(self):
+        return not self.columns
+
+    def __getitem__(self, key):
+        label, period = key
+        return self._rows[label].get(period, math.nan)
+
+
+class YahooClient:
+    """Shared connection pool plus Yahoo's cookie/crumb handshake."""
+
+    def __init__(self, max_connections=50, timeout=15.0):
+        self._client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+            follow_redirects=True,
+        )
+        self._crumb = None
+        self._crumb_lock = asyncio.Lock()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    async def _get_crumb(self, refresh=False):
+        async with self._crumb_lock:
+            if self._crumb is None or refresh:
+                try:
+                    await self._client.get(COOKIE_URL)
+                except httpx.HTTPError:
+                    pass  # only the cookie matters, fc.yahoo.com answers 404
+                resp = await self._client.get(CRUMB_URL)
+                resp.raise_for_status()
+                self._crumb = resp.text.strip()
+            return self._crumb
+
+    async def get_json(self, url, params=None, crumb=False):
+        params = dict(params or {})
+        if crumb:
+            params["crumb"] = await self._get_crumb()
+        await yahoo_rate.acquire_async()
+        resp = await self._client.get(url, params=params)
+        if crumb and resp.status_code in (401, 403):
+            params["crumb"] = await self._get_crumb(refresh=True)
+            resp = await self._client.get(url, params=params)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def current_price(self, ticker):
+        """Last daily close over the past month, or 0."""
+        with span("price_download", ticker=ticker) as sp:
+            data = await self.get_json(CHART_URL.format(ticker=ticker), {"range": "1mo", "interval": "1d"})
+            result = (data.get("chart", {}).get("result") or [{}])[0]
+            quote = (result.get("indicators", {}).get("quote") or [{}])[0]
+            closes = [c for c in quote.get("close") or [] if c is not None]
+            if not closes:
+                sp["status"] = "empty"
+                return 0
+            return safe_float(closes[-1])
+
+    async def statements(self, ticker):
+        """Annual income statement and cash flow rows as Statement tables."""
+        wanted = {**INCOME_ROWS, **CASH_FLOW_ROWS}
+        with span("income_stmt", ticker=ticker, engine="async"):
+            data = await self.get_json(
+                TIMESERIES_URL.format(ticker=ticker),
+                {
+                    "symbol": ticker,
+                    "type": ",".join(f"annual{key}" for key in wanted),
+                    "period1": 493590046,
+                    "period2": int(time.time()),
+                },
+            )
+        rows = {}
+        for series in data.get("timeseries", {}).get("result") or []:
+            types = series.get("meta", {}).get("type") or []
+            if not types or not types[0].startswith("annual"):
+                continue
+            key = types[0][len("annual"):]
+            if key not in wanted:
+                continue
+            values = {}
+            for point in series.get(types[0]) or []:
+                if not point or "asOfDate" not in point:
+                    continue
+                raw = (point.get("reportedValue") or {}).get("raw")
+                if raw is not None:
+                    values[point["asOfDate"]] = raw
+            rows[wanted[key]] = values
+        income = Statement({label: rows.get(label, {}) for label in INCOME_ROWS.values()})
+        cash_flow = Statement({label: rows.get(label, {}) for label in CASH_FLOW_ROWS.values()})
+        return income, cash_flow
+
+    async def info(self, ticker):
+        """Flattened quoteSummary modules, keyed like yfinance's Ticker.info."""
+        with span("info", ticker=ticker, engine="async"):
+            data = await self.get_json(
+                QUOTE_SUMMARY_URL.format(ticker=ticker),
+                {"modules": ",".join(INFO_MODULES)},
+                crumb=True,
+            )
+        result = (data.get("quoteSummary", {}).get("result") or [{}])[0]
+        info = {}
+        for module in INFO_MODULES:
+            for key, value in (result.get(module) or {}).items():
+                if isinstance(value, dict):
+                    if "raw" not in value:
+                        continue
+                    value = value["raw"]
+                if value is None:
+                    continue
+                info[key] = value
+        return info
+
+    async def exchange_rate(self, from_currency, to_currency="USD"):
+        if from_currency == to_currency:
+            return 1.0
+        try:
+            resp = await self._client.get(EXCHANGE_RATE_URL.format(currency=from_currency), timeout=10)
+            if resp.status_code == 200:
+                return resp.json()["rates"].get(to_currency, 1.0)
+        except Exception:
+            pass
+        return FALLBACK_FX_RATES.get(from_currency, 1.0)
+
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = YahooClient()
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def fetch_financials(ticker, deadline=None):
+    """Async counterpart of scripts.fetch_yfinance.fetch_financials.
+
+    With a deadline (seconds), stages get the same budget shares as the
+    yfinance path and the result carries `missing`/`stale` manifests.
+    """
+    client = get_client()
+    start = time.monotonic()
+    debug(f"Fetching data for {ticker} (async engine)...")
+
+    def within(coro, share):
+        if deadline is None:
+            return coro
+        return asyncio.wait_for(coro, max(0.0, deadline * share))
+
+    price, statements, info = await asyncio.gather(
+        within(client.current_price(ticker), STAGE_BUDGET_SHARES["price_download"]),
+        within(client.statements(ticker), STAGE_BUDGET_SHARES["income_stmt"]),
+        within(client.info(ticker), STAGE_BUDGET_SHARES["info"]),
+        return_exceptions=True,
+    )
+    failed = []
+    if isinstance(price, Exception):
+        debug(f"Download failed: {price!r}")
+        failed.append("price_download")
+        price = 0
+    income_stmt = cash_flow = None
+    if isinstance(statements, Exception):
+        debug(f"Error getting financial data: {statements!r}")
+        failed.extend(["income_stmt", "cash_flow"])
+        if deadline is None:
+            # Matches the yfinance path: no statements means no info either
+            info = None
+    else:
+        income_stmt, cash_flow = statements
+    if isinstance(info, Exception):
+        debug(f"Error getting info: {info!r}")
+        failed.append("info")
+        info = None
+
+    rate = 1.0
+    currency = (info or {}).get("currency")
+    # The shared FX table, when a multi-worker loader publishes one, saves the API call
+    shared_rate = shared_data.fx_rate(currency) if currency and currency != "USD" else None
+    if shared_rate is not None:
+        rate = shared_rate
+    elif currency and currency != "USD":
+        fx = client.exchange_rate(currency)
+        if deadline is not None:
+            fx = asyncio.wait_for(fx, max(0.0, start + deadline - time.monotonic()))
+        try:
+            rate = await fx
+        except asyncio.TimeoutError:
+            failed.append("fx")
+            rate = FALLBACK_FX_RATES.get(currency, 1.0)
+
+    try:
+        result = build_financials(ticker, price, income_stmt, cash_flow, info, get_rate=lambda *_: rate)
+    except Exception as e:
+        debug(f"Error in fetch_financials: {e}")
+        result = fallback_financials(ticker, price)
+        failed = list(STAGE_FIELDS)
+    if deadline is not None:
+        return annotate_partial(ticker, result, failed)
+    if not failed:
+        remember_complete(ticker, result)
+    return result
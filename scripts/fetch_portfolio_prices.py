@@ -2,116 +2,339 @@
 """
 Python script to fetch historical price data for portfolio analysis using yfinance.
 Returns 5 years of daily prices for given tickers.
-Usage: python fetch_portfolio_prices.py tick1 tick2 tick3 ...
+Usage: python fetch_portfolio_prices.py tick1 tick2 tick3 ... [--interval weekly] [--lookback 1y] [--points 300]
+
+Tickers are downloaded in chunks of PRICE_CHUNK_SIZE with up to
+PRICE_CHUNK_WORKERS chunks in flight, so one bad ticker or a failed call
+only costs its own chunk. A chunk is one yf.download where the installed
+yfinance allows concurrent downloads (see yf_download.py); otherwise it is
+a Ticker.history call per ticker, on up to PRICE_HISTORY_THREADS threads,
+so the chunks still run in parallel. Tickers a chunk didn't return are retried one by
+one on a pool of PRICE_RETRY_WORKERS. Both phases stop once PRICE_BUDGET
+seconds have been spent, answering with what finished (the portfolio routes
+must answer within Vercel's 60 seconds).
+
+Only closes are kept: each chunk's OHLCV frame is cut down to its Close
+columns as soon as it arrives. fetch_close_matrix goes further for the
+analytics and builds the date x ticker matrix straight from those columns,
+in PRICE_DTYPE (float32 to halve it). PRICE_MEMORY_MB caps how much OHLCV
+can be in flight at once by shrinking the chunk pool.
 """
+import os
 import sys
 import json
+import time
 import yfinance as yf
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from pathlib import Path
 from datetime import datetime, timedelta
 
-def fetch_prices(tickers):
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.timing import span, add_listener, json_lines_listener
+from scripts.result_cache import cache as result_cache
+from scripts.rate_limit import yahoo as yahoo_rate
+from scripts.price_sampling import shape_prices
+from scripts import upstream
+from scripts import yf_download
+
+PRICE_CHUNK_SIZE = int(os.environ.get("PRICE_CHUNK_SIZE", "50"))
+PRICE_CHUNK_WORKERS = int(os.environ.get("PRICE_CHUNK_WORKERS", "4"))
+PRICE_RETRY_WORKERS = int(os.environ.get("PRICE_RETRY_WORKERS", "4"))
+PRICE_HISTORY_THREADS = int(os.environ.get("PRICE_HISTORY_THREADS", "8"))
+PRICE_BUDGET = float(os.environ.get("PRICE_BUDGET", "45"))
+# Bulk downloads this small are hedged with per-ticker history calls
+HEDGE_MAX_TICKERS = 10
+# Cap on the downloads in flight (0 = no cap); see chunk_plan
+PRICE_MEMORY_MB = float(os.environ.get("PRICE_MEMORY_MB", "0"))
+# Dtype of close matrices; float32 halves them at ~7 significant digits
+PRICE_DTYPE = os.environ.get("PRICE_DTYPE", "float64")
+# Rough peak bytes one ticker's 5-year OHLCV costs while yfinance assembles a download
+DOWNLOAD_BYTES_PER_TICKER = 1260 * 6 * 8 * 4
+# Called with each ticker whose download was cached, negatives too (prewarm sets it)
+on_prices_cached = None
+
+
+def close_series(df, dtype=float):
+    """Close column of one ticker's frame as a Series, NaNs dropped."""
+    if df is None or df.empty or 'Close' not in df.columns:
+        return None
+    close = df['Close']
+    if isinstance(close, pd.DataFrame):
+        close = close.iloc[:, 0]
+    close = close.dropna()
+    return close.astype(dtype) if not close.empty else None
+
+
+def series_rows(close):
+    """[{date, close}] from a close Series."""
+    if close is None or close.empty:
+        return []
+    dates = close.index.strftime('%Y-%m-%d')
+    return [{'date': d, 'close': c} for d, c in zip(dates, close.astype(float).tolist())]
+
+
+def rows_series(rows, dtype=float):
+    """Inverse of series_rows, for cached histories."""
+    if not rows:
+        return None
+    return pd.Series([row['close'] for row in rows], index=pd.to_datetime([row['date'] for row in rows]),
+                     dtype=dtype)
+
+
+def _closes_only(data, chunk):
+    """The Close columns of a download as a date x ticker frame."""
+    if isinstance(data.columns, pd.MultiIndex):
+        if 'Close' not in data.columns.get_level_values(1):
+            return pd.DataFrame()
+        return data.xs('Close', axis=1, level=1)
+    # A flat frame only comes back for a single ticker
+    if len(chunk) != 1 or 'Close' not in data.columns:
+        return pd.DataFrame()
+    return data[['Close']].set_axis(chunk, axis=1)
+
+
+def chunk_plan(tickers):
+    """(chunk size, chunk workers) that keep the downloads in flight within PRICE_MEMORY_MB."""
+    size, workers = PRICE_CHUNK_SIZE, PRICE_CHUNK_WORKERS
+    if PRICE_MEMORY_MB > 0:
+        fits = max(1, int(PRICE_MEMORY_MB * 2**20 // DOWNLOAD_BYTES_PER_TICKER))
+        # Fewer chunks in flight first, smaller chunks only when one chunk doesn't fit
+        workers = max(1, min(workers, fits // size))
+        size = max(1, min(size, fits // workers))
+    return size, max(1, min(workers, -(-len(tickers) // size)))
+
+
+def _history(ticker, start_date, end_date):
+    yahoo_rate.acquire()
+    return yf.Ticker(ticker).history(start=start_date, end=end_date, interval='1d', auto_adjust=True)
+
+
+def _histories(tickers, start_date, end_date):
+    """Ticker.history per ticker, shaped like a group_by='ticker' download."""
+    with ThreadPoolExecutor(max_workers=max(1, min(PRICE_HISTORY_THREADS, len(tickers)))) as pool:
+        hists = list(pool.map(lambda t: _history(t, start_date, end_date), tickers))
+    frames = {t: hist for t, hist in zip(tickers, hists) if not hist.empty}
+    return pd.concat(frames, axis=1) if frames else pd.DataFrame()
+
+
+def _download(chunk, start_date, end_date):
+    if not yf_download.REENTRANT:
+        # Concurrent yf.download calls would share module state
+        return _histories(chunk, start_date, end_date)
+    yahoo_rate.acquire()
+    return yf.download(chunk, start=start_date, end=end_date, interval='1d',
+                       progress=False, auto_adjust=True, group_by='ticker')
+
+
+def download_chunk(chunk, start_date, end_date, dtype=float):
+    """{ticker: close Series} for the tickers of one chunk that came back with data."""
+    with span("price_download", tickers=len(chunk)) as sp:
+        # Hedges use Ticker.history, which shares no state with a download in flight
+        data = upstream.call(
+            "price_history",
+            lambda: _download(chunk, start_date, end_date),
+            (lambda: _histories(chunk, start_date, end_date)) if len(chunk) <= HEDGE_MAX_TICKERS else None,
+        )
+        if data is None or data.empty:
+            sp["status"] = "empty"
+            return {}
+    with span("price_parse", tickers=len(chunk)):
+        # Yahoo can't be asked for closes alone; drop Open/High/Low/Volume before anything else
+        closes = _closes_only(data, chunk)
+        del data
+        found = {}
+        for ticker in chunk:
+            if ticker in closes.columns:
+                close = closes[ticker]
+                if isinstance(close, pd.DataFrame):
+                    close = close.iloc[:, 0]
+                close = close.dropna()
+                if not close.empty:
+                    found[ticker] = close.astype(dtype)
+    return found
+
+
+def download_one(ticker, start_date, end_date, dtype=float):
+    yahoo_rate.acquire()
+    with span("price_fallback", ticker=ticker):
+        hist = upstream.call(
+            "price_fallback",
+            lambda: yf.Ticker(ticker).history(start=start_date, end=end_date, interval='1d', auto_adjust=True),
+        )
+    return close_series(hist, dtype)
+
+
+def fetch_close_series(tickers, dtype=float, days=5*365):
+    """{ticker: close Series} for the tickers that came back with data, over the last `days`."""
     if not tickers:
         return {}
-        
-    # Fetch 5 years of historical data
+
+    # Fetch 5 years of historical data unless asked for a shorter window
     end_date = datetime.now()
-    start_date = end_date - timedelta(days=5*365)
-    
+    start_date = end_date - timedelta(days=days)
+    started = time.monotonic()
+    size, workers = chunk_plan(tickers)
+    chunks = [tickers[i:i + size] for i in range(0, len(tickers), size)]
+    sys.stderr.write(f"Downloading data for {len(tickers)} tickers in {len(chunks)} chunks "
+                     f"from {start_date.date()} to {end_date.date()}\n")
+
     result = {}
-    
+    retry = []
+    breaker_open = out_of_budget = False
+    pool = ThreadPoolExecutor(max_workers=workers)
+    futures = {pool.submit(download_chunk, chunk, start_date, end_date, dtype): chunk for chunk in chunks}
     try:
-        sys.stderr.write(f"Downloading data for {tickers} from {start_date.date()} to {end_date.date()}\n")
-        
-        # Always use group_by='ticker' to try to get consistent structure
-        # auto_adjust=True handles splits/dividends
-        data = yf.download(
-            tickers,
-            start=start_date,
-            end=end_date,
-            interval='1d',
-            progress=False,
-            auto_adjust=True,
-            group_by='ticker'
-        )
-        
-        if data.empty:
-            sys.stderr.write("Returned data is empty\n")
-            return {t: [] for t in tickers}
-
-        for ticker in tickers:
-            prices = []
+        for future in as_completed(futures, timeout=max(0.0, PRICE_BUDGET - (time.monotonic() - started))):
+            chunk = futures.pop(future)
             try:
-                # Determine how to access data for this ticker
-                df = None
-                
-                # Check if columns are MultiIndex (Ticker, Price)
-                if isinstance(data.columns, pd.MultiIndex):
-                    try:
-                        df = data[ticker]
-                    except KeyError:
-                        sys.stderr.write(f"Ticker {ticker} not found in MultiIndex columns\n")
-                        df = None
-                else:
-                    # Flat Index (usually happens if only 1 ticker is requested, even with group_by sometimes?)
-                    # If flat, assume this IS the data for the single ticker
-                    # But verify ticker name? No, yf doesn't include ticker in flat columns (just Open, Close)
-                    if len(tickers) == 1 and tickers[0] == ticker:
-                        df = data
-                    else:
-                        # If we have multiple tickers but flat index? Should not happen with group_by='ticker'.
-                        # Unless yfinance failed for others.
-                        # We'll assume if flat request mapped to this ticker.
-                         df = data
-                
-                if df is not None and not df.empty:
-                    # Check for Close column
-                    if 'Close' in df.columns:
-                        for index, row in df.iterrows():
-                            try:
-                                close_val = float(row['Close'])
-                                if str(close_val) != 'nan':
-                                    prices.append({
-                                        'date': index.strftime('%Y-%m-%d'),
-                                        'close': close_val
-                                    })
-                            except:
-                                pass
-                        sys.stderr.write(f"Parsed {len(prices)} prices for {ticker}\n")
-                    else:
-                        sys.stderr.write(f"No 'Close' column for {ticker}. Columns: {df.columns}\n")
-                
+                found = future.result()
+            except upstream.CircuitOpen:
+                breaker_open = True
+                found = {}
             except Exception as e:
-                sys.stderr.write(f"Error processing {ticker}: {e}\n")
-            
-            result[ticker] = prices
-                    
-    except Exception as e:
-        sys.stderr.write(f"Bulk download error: {str(e)}\n")
-        # Fallback: try fetching one by one
-        for ticker in tickers:
-            try:
-                sys.stderr.write(f"Fallback fetching {ticker}...\n")
-                hist = yf.Ticker(ticker).history(start=start_date, end=end_date, interval='1d', auto_adjust=True)
-                prices = []
-                if not hist.empty and 'Close' in hist.columns:
-                    for index, row in hist.iterrows():
-                        prices.append({
-                            'date': index.strftime('%Y-%m-%d'),
-                            'close': float(row['Close'])
-                        })
-                result[ticker] = prices
-            except Exception as e2:
-                sys.stderr.write(f"Fallback error for {ticker}: {str(e2)}\n")
-                result[ticker] = []
+                sys.stderr.write(f"Chunk download error ({len(chunk)} tickers): {e}\n")
+                found = {}
+            result.update(found)
+            retry.extend(t for t in chunk if t not in found)
+    except FuturesTimeout:
+        # Out of budget before the retries: answer with the chunks that finished
+        out_of_budget = True
+        sys.stderr.write(f"Price budget of {PRICE_BUDGET:.0f}s spent, "
+                         f"{sum(len(c) for c in futures.values())} tickers in unfinished chunks abandoned\n")
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if breaker_open:
+        # Yahoo is degraded; don't walk the tickers one by one
+        sys.stderr.write("Price downloads are failing fast while the circuit breaker is open\n")
+    elif retry and not out_of_budget:
+        sys.stderr.write(f"Retrying {len(retry)} tickers individually\n")
+        pool = ThreadPoolExecutor(max_workers=max(1, min(PRICE_RETRY_WORKERS, len(retry))))
+        futures = {pool.submit(download_one, t, start_date, end_date, dtype): t for t in retry}
+        remaining = max(0.0, PRICE_BUDGET - (time.monotonic() - started))
+        try:
+            for future in as_completed(futures, timeout=remaining):
+                ticker = futures[future]
+                try:
+                    close = future.result()
+                except Exception as e:
+                    sys.stderr.write(f"Fallback error for {ticker}: {str(e)}\n")
+                    continue
+                if close is not None:
+                    result[ticker] = close
+        except FuturesTimeout:
+            # Out of budget: answer with what finished, drop queued retries
+            sys.stderr.write(f"Price budget of {PRICE_BUDGET:.0f}s spent, "
+                             f"{sum(1 for f in futures if not f.done())} retries abandoned\n")
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
 
+    sys.stderr.write(f"Parsed prices for {sum(1 for t in tickers if t in result)}/{len(tickers)} tickers "
+                     f"in {time.monotonic() - started:.1f}s\n")
     return result
 
+
+def fetch_prices(tickers, interval="daily", lookback=None, points=None):
+    """{ticker: [{date, close}]}; see price_sampling for interval/lookback/points."""
+    if not tickers:
+        return {}
+    closes = fetch_close_series(tickers)
+    return shape_prices({t: series_rows(closes.pop(t, None)) for t in tickers}, interval, lookback, points)
+
+
+def cache_prices(ticker, rows):
+    """Cache a freshly downloaded history ([] or None caches a negative)."""
+    result_cache.set("prices", ticker.upper(), rows or None)
+    if on_prices_cached is not None:
+        on_prices_cached(ticker)
+
+
+def fetch_prices_cached(tickers, refresh=False, interval="daily", lookback=None, points=None):
+    """fetch_prices behind the shared result cache, downloading only the misses.
+
+    With `refresh`, every ticker is downloaded again and the cache rewritten.
+    Daily histories are cached; interval/lookback/points shape the answer.
+
+    Tickers that came back without any prices while others in the same
+    download did are cached as negatives; an empty download is more likely
+    an upstream failure than a batch of invalid tickers.
+    """
+    result, misses = {}, []
+    for ticker in tickers:
+        hit, prices = (False, None) if refresh else result_cache.get("prices", ticker.upper())
+        if hit:
+            result[ticker] = prices or []
+        else:
+            misses.append(ticker)
+    if misses:
+        fetched = fetch_prices(misses)
+        any_prices = any(fetched.get(t) for t in misses)
+        for ticker in misses:
+            prices = fetched.get(ticker) or []
+            if prices or any_prices:
+                cache_prices(ticker, prices)
+            elif upstream.is_open("price_history"):
+                # Better an expired history than none while Yahoo is degraded
+                prices = result_cache.get_stale("prices", ticker.upper()) or []
+            result[ticker] = prices
+    return shape_prices({t: result[t] for t in tickers}, interval, lookback, points)
+
+
+def fetch_close_matrix(tickers, dtype=None, refresh=False):
+    """Cached closes as one date x ticker frame; tickers without data are dropped.
+
+    Built column by column from close Series, so the universe never exists
+    as lists of row dicts or as full OHLCV frames; rows are only made (and
+    dropped) one ticker at a time for the cache. dtype defaults to
+    PRICE_DTYPE; float32 halves the frame.
+    """
+    dtype = np.dtype(dtype or PRICE_DTYPE)
+    columns, misses = {}, []
+    for ticker in tickers:
+        hit, prices = (False, None) if refresh else result_cache.get("prices", ticker.upper())
+        if not hit:
+            misses.append(ticker)
+        elif prices:
+            columns[ticker] = rows_series(prices, dtype)
+    if misses:
+        # Same negative and stale-fallback rules as fetch_prices_cached
+        fetched = fetch_close_series(misses, dtype)
+        any_prices = bool(fetched)
+        for ticker in misses:
+            close = fetched.pop(ticker, None)
+            if close is not None or any_prices:
+                cache_prices(ticker, series_rows(close))
+            elif upstream.is_open("price_history"):
+                close = rows_series(result_cache.get_stale("prices", ticker.upper()), dtype)
+            if close is not None:
+                columns[ticker] = close
+    if not columns:
+        return pd.DataFrame(dtype=dtype)
+    frame = pd.concat({t: columns.pop(t) for t in tickers if t in columns}, axis=1).sort_index()
+    return frame[~frame.index.duplicated(keep="last")]
+
+
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print(json.dumps({"error": "Usage: python fetch_portfolio_prices.py TICKER1 [TICKER2 ...]"}))
+    args = sys.argv[1:]
+    options = {}
+    for flag in ("--interval", "--lookback", "--points"):
+        if flag in args:
+            i = args.index(flag)
+            options[flag[2:]] = args[i + 1] if i + 1 < len(args) else None
+            del args[i:i + 2]
+    if not args or None in options.values():
+        print(json.dumps({"error": "Usage: python fetch_portfolio_prices.py TICKER1 [TICKER2 ...] "
+                                   "[--interval daily|weekly|monthly] [--lookback 1y] [--points N]"}))
         sys.exit(1)
-        
-    tickers = sys.argv[1:]
-    data = fetch_prices(tickers)
-    print(json.dumps(data))
+    if "points" in options:
+        options["points"] = int(options["points"])
+
+    tickers = args
+    add_listener(json_lines_listener())
+    data = fetch_prices_cached(tickers, **options)
+    with span("serialization", tickers=len(tickers)):
+        payload = json.dumps(data)
+    print(payload)
@@ -3,12 +3,27 @@
 Python script to fetch yfinance data for a given ticker.
 Called from Node.js to get real financial data.
 """
+import os
 import sys
+import copy
 import json
 import math
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from pathlib import Path
 import yfinance as yf
 import requests
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.timing import span, add_listener, json_lines_listener
+from scripts.rate_limit import yahoo as yahoo_rate
+from scripts.result_cache import cache as result_cache
+from scripts import upstream
+from scripts import yf_download
+
 
 def debug(*args, **kwargs):
     try:
@@ -26,38 +41,42 @@ def safe_float(value, default=0.0):
         return default
 
 
+# Approximate USD rates used when the exchange rate API is unavailable
+FALLBACK_FX_RATES = {
+    'EUR': 1.08, 'GBP': 1.27, 'CAD': 0.74, 'AUD': 0.66,
+    'JPY': 0.0067, 'CHF': 1.12, 'CNY': 0.14, 'INR': 0.012,
+    'BRL': 0.21, 'MXN': 0.059, 'KRW': 0.00076, 'SGD': 0.74,
+    'HKD': 0.13, 'SEK': 0.095, 'NOK': 0.095, 'DKK': 0.14,
+    'PLN': 0.25, 'CZK': 0.044, 'HUF': 0.0028, 'RUB': 0.011
+}
+EXCHANGE_RATE_URL = "https://api.exchangerate-api.com/v4/latest/{currency}"
+# Optional (from, to) -> rate or None tried before the API; python_service
+# points it at the shared FX table in multi-worker mode
+fx_table_lookup = None
+
+
 def get_exchange_rate(from_currency, to_currency='USD'):
     """Get exchange rate from a free API."""
     if from_currency == to_currency:
         return 1.0
+    if fx_table_lookup is not None:
+        rate = fx_table_lookup(from_currency, to_currency)
+        if rate is not None:
+            return rate
     
     try:
         # Using a free exchange rate API
-        url = f"https://api.exchangerate-api.com/v4/latest/{from_currency}"
+        url = EXCHANGE_RATE_URL.format(currency=from_currency)
         response = requests.get(url, timeout=10)
         if response.status_code == 200:
             data = response.json()
             return data['rates'].get(to_currency, 1.0)
         else:
             # Fallback to approximate rates for common currencies
-            fallback_rates = {
-                'EUR': 1.08, 'GBP': 1.27, 'CAD': 0.74, 'AUD': 0.66,
-                'JPY': 0.0067, 'CHF': 1.12, 'CNY': 0.14, 'INR': 0.012,
-                'BRL': 0.21, 'MXN': 0.059, 'KRW': 0.00076, 'SGD': 0.74,
-                'HKD': 0.13, 'SEK': 0.095, 'NOK': 0.095, 'DKK': 0.14,
-                'PLN': 0.25, 'CZK': 0.044, 'HUF': 0.0028, 'RUB': 0.011
-            }
-            return fallback_rates.get(from_currency, 1.0)
+            return FALLBACK_FX_RATES.get(from_currency, 1.0)
     except Exception:
         # Return fallback rate if API fails
-        fallback_rates = {
-            'EUR': 1.08, 'GBP': 1.27, 'CAD': 0.74, 'AUD': 0.66,
-            'JPY': 0.0067, 'CHF': 1.12, 'CNY': 0.14, 'INR': 0.012,
-            'BRL': 0.21, 'MXN': 0.059, 'KRW': 0.00076, 'SGD': 0.74,
-            'HKD': 0.13, 'SEK': 0.095, 'NOK': 0.095, 'DKK': 0.14,
-            'PLN': 0.25, 'CZK': 0.044, 'HUF': 0.0028, 'RUB': 0.011
-        }
-        return fallback_rates.get(from_currency, 1.0)
+        return FALLBACK_FX_RATES.get(from_currency, 1.0)
 
 
 def convert_currency(value, from_currency, to_currency='USD'):
@@ -69,154 +88,132 @@ def convert_currency(value, from_currency, to_currency='USD'):
     return value * rate
 
 
-def fetch_financials(ticker):
-    """Fetch financial data from yfinance for a given ticker."""
-    try:
-        debug(f"Fetching data for {ticker}...")
-        
-        # Create ticker object
-        company = yf.Ticker(ticker)
-        
-        # Get current price from download method
-        current_price = 0
-        try:
-            hist = yf.download(ticker, period="1mo", interval="1d", progress=False, ignore_tz=True)
-            if hist is not None and not hist.empty:
-                current_price = safe_float(hist['Close'].iloc[-1])
-                debug(f"Got current price from download: ${current_price}")
-            else:
-                debug("Download returned empty data")
-        except Exception as e:
-            debug(f"Download failed: {e}")
-        
-        # Get financial data using the working methods
-        fy24_financials = {
-            "revenue": 0,
-            "gross_margin_pct": 0,
-            "ebitda": 0,
-            "net_income": 0,
-            "eps": 0,
-            "shares_outstanding": 0
-        }
-        
-        market_data = {
-            "current_price": current_price,
-            "market_cap": 0,
-            "enterprise_value": 0,
-            "pe_ratio": 0
-        }
-        
-        historical_financials = []
+def build_financials(ticker, current_price, income_stmt, cash_flow, info, get_rate=get_exchange_rate):
+    """Assemble the fetch_financials payload from already fetched data.
 
-        try:
-            # Get income statement data
-            income_stmt = company.income_stmt
-            # Try to get cash flow statement (newer yfinance uses cash_flow)
-            cash_flow = None
-            try:
-                cash_flow = company.cash_flow
-            except Exception:
-                try:
-                    cash_flow = company.cashflow
-                except Exception:
-                    cash_flow = None
-            if income_stmt is not None and not income_stmt.empty and len(income_stmt.columns) > 0:
-                latest_year = income_stmt.columns[0]
-                debug(f"Latest financial year: {latest_year}")
-                
-                # Extract key metrics
+    income_stmt and cash_flow only need the parts of the DataFrame API used
+    here (empty, index, columns, loc[row, col]), so other fetch engines can
+    pass lighter tables and still produce identical output. The exchange
+    rate is looked up once through get_rate.
+    """
+    # Get financial data using the working methods
+    fy24_financials = {
+        "revenue": 0,
+        "gross_margin_pct": 0,
+        "ebitda": 0,
+        "net_income": 0,
+        "eps": 0,
+        "shares_outstanding": 0
+    }
+    
+    market_data = {
+        "current_price": current_price,
+        "market_cap": 0,
+        "enterprise_value": 0,
+        "pe_ratio": 0
+    }
+    
+    historical_financials = []
+
+    try:
+        if income_stmt is not None and not income_stmt.empty and len(income_stmt.columns) > 0:
+            latest_year = income_stmt.columns[0]
+            debug(f"Latest financial year: {latest_year}")
+            
+            # Extract key metrics
+            if 'Total Revenue' in income_stmt.index:
+                revenue = income_stmt.loc['Total Revenue', latest_year]
+                fy24_financials["revenue"] = safe_float(revenue)
+                debug(f"Revenue: ${fy24_financials['revenue']:,.0f}")
+            
+            if 'Gross Profit' in income_stmt.index and 'Total Revenue' in income_stmt.index:
+                gross_profit = income_stmt.loc['Gross Profit', latest_year]
+                revenue = income_stmt.loc['Total Revenue', latest_year]
+                fy24_financials["gross_profit"] = safe_float(gross_profit)
+                debug(f"Gross Profit: ${fy24_financials['gross_profit']:,.0f}")
+                if revenue != 0:
+                    fy24_financials["gross_margin_pct"] = (safe_float(gross_profit) / safe_float(revenue)) * 100
+                    debug(f"Gross Margin: {fy24_financials['gross_margin_pct']:.1f}%")
+            
+            if 'EBITDA' in income_stmt.index:
+                ebitda = income_stmt.loc['EBITDA', latest_year]
+                fy24_financials["ebitda"] = safe_float(ebitda)
+                debug(f"EBITDA: ${fy24_financials['ebitda']:,.0f}")
+                # Calculate EBITDA margin
                 if 'Total Revenue' in income_stmt.index:
-                    revenue = income_stmt.loc['Total Revenue', latest_year]
-                    fy24_financials["revenue"] = safe_float(revenue)
-                    debug(f"Revenue: ${fy24_financials['revenue']:,.0f}")
-                
-                if 'Gross Profit' in income_stmt.index and 'Total Revenue' in income_stmt.index:
-                    gross_profit = income_stmt.loc['Gross Profit', latest_year]
-                    revenue = income_stmt.loc['Total Revenue', latest_year]
-                    fy24_financials["gross_profit"] = safe_float(gross_profit)
-                    debug(f"Gross Profit: ${fy24_financials['gross_profit']:,.0f}")
+                    revenue = fy24_financials["revenue"]
                     if revenue != 0:
-                        fy24_financials["gross_margin_pct"] = (safe_float(gross_profit) / safe_float(revenue)) * 100
-                        debug(f"Gross Margin: {fy24_financials['gross_margin_pct']:.1f}%")
-                
-                if 'EBITDA' in income_stmt.index:
-                    ebitda = income_stmt.loc['EBITDA', latest_year]
-                    fy24_financials["ebitda"] = safe_float(ebitda)
-                    debug(f"EBITDA: ${fy24_financials['ebitda']:,.0f}")
-                    # Calculate EBITDA margin
-                    if 'Total Revenue' in income_stmt.index:
-                        revenue = fy24_financials["revenue"]
-                        if revenue != 0:
-                            fy24_financials["ebitda_margin_pct"] = (safe_float(ebitda) / revenue) * 100
-                            debug(f"EBITDA Margin: {fy24_financials['ebitda_margin_pct']:.1f}%")
-                
-                if 'Net Income' in income_stmt.index:
-                    net_income = income_stmt.loc['Net Income', latest_year]
-                    fy24_financials["net_income"] = safe_float(net_income)
-                    debug(f"Net Income: ${fy24_financials['net_income']:,.0f}")
-                
-                if 'Diluted EPS' in income_stmt.index:
-                    eps = income_stmt.loc['Diluted EPS', latest_year]
-                    fy24_financials["eps"] = safe_float(eps)
-                    debug(f"EPS: ${fy24_financials['eps']:.2f}")
-                
-                if 'Diluted Average Shares' in income_stmt.index:
-                    shares = income_stmt.loc['Diluted Average Shares', latest_year]
-                    fy24_financials["shares_outstanding"] = safe_float(shares)
-                    debug(f"Shares Outstanding: {fy24_financials['shares_outstanding']:,.0f}")
-                
-                # Calculate FCF (Free Cash Flow) from cash flow statement when available
-                try:
-                    if cash_flow is not None and not cash_flow.empty and latest_year in cash_flow.columns:
-                        # Support multiple possible index labels for OCF and CapEx
-                        ocf_labels = [
-                            'Operating Cash Flow',
-                            'Total Cash From Operating Activities',
-                            'Cash Flow From Operating Activities'
-                        ]
-                        capex_labels = [
-                            'Capital Expenditure',
-                            'Capital Expenditures'
-                        ]
-                        ocf = None
-                        capex = None
-                        for ocf_label in ocf_labels:
-                            if ocf_label in cash_flow.index:
-                                ocf = safe_float(cash_flow.loc[ocf_label, latest_year])
-                                break
-                        for capex_label in capex_labels:
-                            if capex_label in cash_flow.index:
-                                capex = safe_float(cash_flow.loc[capex_label, latest_year])
-                                break
-                        if ocf is not None and capex is not None:
-                            # In Yahoo data CapEx is typically negative; ocf + capex is correct
-                            fcf_latest = safe_float(ocf + capex)
-                            fy24_financials["fcf"] = fcf_latest
-                            if fy24_financials["revenue"]:
-                                fy24_financials["fcf_margin_pct"] = (fcf_latest / fy24_financials["revenue"]) * 100.0
-                            debug(f"FCF (from CF stmt): ${fy24_financials['fcf']:,.0f}, FCF Margin: {fy24_financials.get('fcf_margin_pct', 0):.1f}%")
-                        else:
-                            # Fallback: estimate 25% if CF data missing
-                            revenue = fy24_financials["revenue"]
-                            estimated_fcf = revenue * 0.25
-                            fy24_financials["fcf"] = estimated_fcf
-                            fy24_financials["fcf_margin_pct"] = 25.0
-                            debug(f"Estimated FCF (fallback): ${estimated_fcf:,.0f} (25% of revenue)")
+                        fy24_financials["ebitda_margin_pct"] = (safe_float(ebitda) / revenue) * 100
+                        debug(f"EBITDA Margin: {fy24_financials['ebitda_margin_pct']:.1f}%")
+            
+            if 'Net Income' in income_stmt.index:
+                net_income = income_stmt.loc['Net Income', latest_year]
+                fy24_financials["net_income"] = safe_float(net_income)
+                debug(f"Net Income: ${fy24_financials['net_income']:,.0f}")
+            
+            if 'Diluted EPS' in income_stmt.index:
+                eps = income_stmt.loc['Diluted EPS', latest_year]
+                fy24_financials["eps"] = safe_float(eps)
+                debug(f"EPS: ${fy24_financials['eps']:.2f}")
+            
+            if 'Diluted Average Shares' in income_stmt.index:
+                shares = income_stmt.loc['Diluted Average Shares', latest_year]
+                fy24_financials["shares_outstanding"] = safe_float(shares)
+                debug(f"Shares Outstanding: {fy24_financials['shares_outstanding']:,.0f}")
+            
+            # Calculate FCF (Free Cash Flow) from cash flow statement when available
+            try:
+                if cash_flow is not None and not cash_flow.empty and latest_year in cash_flow.columns:
+                    # Support multiple possible index labels for OCF and CapEx
+                    ocf_labels = [
+                        'Operating Cash Flow',
+                        'Total Cash From Operating Activities',
+                        'Cash Flow From Operating Activities'
+                    ]
+                    capex_labels = [
+                        'Capital Expenditure',
+                        'Capital Expenditures'
+                    ]
+                    ocf = None
+                    capex = None
+                    for ocf_label in ocf_labels:
+                        if ocf_label in cash_flow.index:
+                            ocf = safe_float(cash_flow.loc[ocf_label, latest_year])
+                            break
+                    for capex_label in capex_labels:
+                        if capex_label in cash_flow.index:
+                            capex = safe_float(cash_flow.loc[capex_label, latest_year])
+                            break
+                    if ocf is not None and capex is not None:
+                        # In Yahoo data CapEx is typically negative; ocf + capex is correct
+                        fcf_latest = safe_float(ocf + capex)
+                        fy24_financials["fcf"] = fcf_latest
+                        if fy24_financials["revenue"]:
+                            fy24_financials["fcf_margin_pct"] = (fcf_latest / fy24_financials["revenue"]) * 100.0
+                        debug(f"FCF (from CF stmt): ${fy24_financials['fcf']:,.0f}, FCF Margin: {fy24_financials.get('fcf_margin_pct', 0):.1f}%")
                     else:
+                        # Fallback: estimate 25% if CF data missing
                         revenue = fy24_financials["revenue"]
                         estimated_fcf = revenue * 0.25
                         fy24_financials["fcf"] = estimated_fcf
                         fy24_financials["fcf_margin_pct"] = 25.0
-                        debug(f"Estimated FCF (no CF stmt): ${estimated_fcf:,.0f} (25% of revenue)")
-                except Exception as cferr:
-                    debug(f"FCF computation failed: {cferr}")
+                        debug(f"Estimated FCF (fallback): ${estimated_fcf:,.0f} (25% of revenue)")
+                else:
                     revenue = fy24_financials["revenue"]
                     estimated_fcf = revenue * 0.25
                     fy24_financials["fcf"] = estimated_fcf
                     fy24_financials["fcf_margin_pct"] = 25.0
-                    debug(f"Estimated FCF (error fallback): ${estimated_fcf:,.0f} (25% of revenue)")
+                    debug(f"Estimated FCF (no CF stmt): ${estimated_fcf:,.0f} (25% of revenue)")
+            except Exception as cferr:
+                debug(f"FCF computation failed: {cferr}")
+                revenue = fy24_financials["revenue"]
+                estimated_fcf = revenue * 0.25
+                fy24_financials["fcf"] = estimated_fcf
+                fy24_financials["fcf_margin_pct"] = 25.0
+                debug(f"Estimated FCF (error fallback): ${estimated_fcf:,.0f} (25% of revenue)")
 
-                # Build historical financials (last up to 4 periods) in $M
+            # Build historical financials (last up to 4 periods) in $M
+            with span("historical_build", ticker=ticker) as sp:
                 try:
                     # Ensure we have required rows
                     idx = income_stmt.index
@@ -298,130 +295,445 @@ def fetch_financials(ticker):
                                 "eps": eps_val
                             })
                 except Exception as he:
+                    sp["status"] = "error"
+                    sp["error"] = type(he).__name__
                     debug(f"Failed to build historical financials: {he}")
+        
+        # Get market data
+        if info:
+            if 'marketCap' in info:
+                market_data["market_cap"] = safe_float(info['marketCap'])
+                debug(f"Market Cap: ${market_data['market_cap']:,.0f}")
             
-            # Get market data
-            info = company.info
-            if info:
-                if 'marketCap' in info:
-                    market_data["market_cap"] = safe_float(info['marketCap'])
-                    debug(f"Market Cap: ${market_data['market_cap']:,.0f}")
-                
-                if 'enterpriseValue' in info:
-                    market_data["enterprise_value"] = safe_float(info['enterpriseValue'])
-                    debug(f"Enterprise Value: ${market_data['enterprise_value']:,.0f}")
-                
-                if 'trailingPE' in info:
-                    market_data["pe_ratio"] = safe_float(info['trailingPE'])
-                    debug(f"P/E Ratio: {market_data['pe_ratio']:.2f}")
-                
-                # Update current price if not already set
-                if current_price == 0 and 'currentPrice' in info:
-                    market_data["current_price"] = safe_float(info['currentPrice'])
-                    current_price = market_data["current_price"]
-                    debug(f"Current Price from info: ${current_price:.2f}")
+            if 'enterpriseValue' in info:
+                market_data["enterprise_value"] = safe_float(info['enterpriseValue'])
+                debug(f"Enterprise Value: ${market_data['enterprise_value']:,.0f}")
             
-        except Exception as e:
-            debug(f"Error getting financial data: {e}")
-        
-        # Get company name
-        company_name = ticker
-        try:
-            if info and 'longName' in info:
-                company_name = info['longName']
-            elif info and 'shortName' in info:
-                company_name = info['shortName']
-        except Exception as e:
-            debug(f"Error getting company name: {e}")
-        
-        # Get currency info
-        currency_info = {
-            "original_currency": "USD",
-            "converted_to_usd": False,
-            "conversion_rate": 1.0,
-            "exchange_rate_source": "none"
-        }
+            if 'trailingPE' in info:
+                market_data["pe_ratio"] = safe_float(info['trailingPE'])
+                debug(f"P/E Ratio: {market_data['pe_ratio']:.2f}")
+            
+            # Update current price if not already set
+            if current_price == 0 and 'currentPrice' in info:
+                market_data["current_price"] = safe_float(info['currentPrice'])
+                current_price = market_data["current_price"]
+                debug(f"Current Price from info: ${current_price:.2f}")
         
+    except Exception as e:
+        debug(f"Error getting financial data: {e}")
+    
+    # Get company name
+    company_name = ticker
+    try:
+        if info and 'longName' in info:
+            company_name = info['longName']
+        elif info and 'shortName' in info:
+            company_name = info['shortName']
+    except Exception as e:
+        debug(f"Error getting company name: {e}")
+    
+    # Get currency info
+    currency_info = {
+        "original_currency": "USD",
+        "converted_to_usd": False,
+        "conversion_rate": 1.0,
+        "exchange_rate_source": "none"
+    }
+    
+    with span("fx", ticker=ticker) as sp:
         try:
             if info and 'currency' in info:
                 original_currency = info['currency']
                 if original_currency and original_currency != 'USD':
                     currency_info["original_currency"] = original_currency
-                    conversion_rate = get_exchange_rate(original_currency, 'USD')
+                    conversion_rate = get_rate(original_currency, 'USD')
                     currency_info["conversion_rate"] = conversion_rate
                     currency_info["converted_to_usd"] = True
                     currency_info["exchange_rate_source"] = "exchangerate-api"
-                    
+                
                     # Convert financial values to USD
                     if fy24_financials["revenue"] > 0:
-                        fy24_financials["revenue"] = convert_currency(fy24_financials["revenue"], original_currency, 'USD')
+                        fy24_financials["revenue"] = fy24_financials["revenue"] * conversion_rate
                     if fy24_financials["ebitda"] > 0:
-                        fy24_financials["ebitda"] = convert_currency(fy24_financials["ebitda"], original_currency, 'USD')
+                        fy24_financials["ebitda"] = fy24_financials["ebitda"] * conversion_rate
                     if fy24_financials["net_income"] > 0:
-                        fy24_financials["net_income"] = convert_currency(fy24_financials["net_income"], original_currency, 'USD')
+                        fy24_financials["net_income"] = fy24_financials["net_income"] * conversion_rate
                     if market_data["market_cap"] > 0:
-                        market_data["market_cap"] = convert_currency(market_data["market_cap"], original_currency, 'USD')
+                        market_data["market_cap"] = market_data["market_cap"] * conversion_rate
                     if market_data["enterprise_value"] > 0:
-                        market_data["enterprise_value"] = convert_currency(market_data["enterprise_value"], original_currency, 'USD')
+                        market_data["enterprise_value"] = market_data["enterprise_value"] * conversion_rate
 
-                    # Convert historical values to USD (they are in $M, so convert base then divide)
+                    # Convert historical values to USD (they are in $M; the rate is unit-free)
                     if historical_financials:
                         for row in historical_financials:
-                            # Convert base currency amounts first
-                            row["revenue"] = convert_currency(row["revenue"] * 1_000_000.0, original_currency, 'USD') / 1_000_000.0
-                            row["grossProfit"] = convert_currency(row["grossProfit"] * 1_000_000.0, original_currency, 'USD') / 1_000_000.0
-                            row["ebitda"] = convert_currency(row["ebitda"] * 1_000_000.0, original_currency, 'USD') / 1_000_000.0
-                            row["netIncome"] = convert_currency(row["netIncome"] * 1_000_000.0, original_currency, 'USD') / 1_000_000.0
-                            row["fcf"] = convert_currency(row["fcf"] * 1_000_000.0, original_currency, 'USD') / 1_000_000.0
+                            row["revenue"] = row["revenue"] * conversion_rate
+                            row["grossProfit"] = row["grossProfit"] * conversion_rate
+                            row["ebitda"] = row["ebitda"] * conversion_rate
+                            row["netIncome"] = row["netIncome"] * conversion_rate
+                            row["fcf"] = row["fcf"] * conversion_rate
         except Exception as e:
+            sp["status"] = "error"
+            sp["error"] = type(e).__name__
             debug(f"Error handling currency conversion: {e}")
-        
-        result = {
-            "fy24_financials": fy24_financials,
-            "market_data": market_data,
-            "company_name": company_name,
-            "source": "yfinance",
-            "currency_info": currency_info,
-            "historical_financials": historical_financials
+    
+    result = {
+        "fy24_financials": fy24_financials,
+        "market_data": market_data,
+        "company_name": company_name,
+        "sector": (info or {}).get("sector"),
+        "industry": (info or {}).get("industry"),
+        "source": "yfinance",
+        "currency_info": currency_info,
+        "historical_financials": historical_financials
+    }
+    
+    debug("Successfully fetched financial data!")
+    return result
+
+
+def fallback_financials(ticker, current_price=0):
+    """Payload returned when fetching fails outright."""
+    return {
+        "fy24_financials": {
+            "revenue": 0,
+            "gross_margin_pct": 0,
+            "ebitda": 0,
+            "net_income": 0,
+            "eps": 0,
+            "shares_outstanding": 0
+        },
+        "market_data": {
+            "current_price": current_price,
+            "market_cap": 0,
+            "enterprise_value": 0,
+            "pe_ratio": 0
+        },
+        "company_name": ticker,
+        "source": "yfinance_alternative",
+        "currency_info": {
+            "original_currency": "USD",
+            "converted_to_usd": False,
+            "conversion_rate": 1.0,
+            "exchange_rate_source": "none"
+        }
+    }
+
+
+def fresh_ticker(ticker):
+    """A new yf.Ticker for hedged duplicates, so they share no state with the first call."""
+    yahoo_rate.acquire()
+    return yf.Ticker(ticker)
+
+
+def download_current_price(ticker):
+    """Latest close from a one-month daily download, or 0 if unavailable."""
+    current_price = 0
+    try:
+        yahoo_rate.acquire()
+        # Queue for the download lock before the timed call, not inside it
+        with yf_download.guarded(), span("price_download", ticker=ticker) as sp:
+            # The hedge uses Ticker.history: concurrent yf.download calls share module state
+            hist = upstream.call(
+                "price_download",
+                lambda: yf.download(ticker, period="1mo", interval="1d", progress=False, ignore_tz=True),
+                lambda: fresh_ticker(ticker).history(period="1mo", interval="1d"),
+            )
+            if hist is not None and not hist.empty:
+                current_price = safe_float(hist['Close'].iloc[-1])
+                debug(f"Got current price from download: ${current_price}")
+            else:
+                sp["status"] = "empty"
+                debug("Download returned empty data")
+    except Exception as e:
+        debug(f"Download failed: {e}")
+    return current_price
+
+
+def _cash_flow(company):
+    # Try to get cash flow statement (newer yfinance uses cash_flow)
+    try:
+        return company.cash_flow
+    except Exception:
+        return company.cashflow
+
+
+def fetch_cash_flow(company, ticker):
+    yahoo_rate.acquire()
+    with span("cash_flow", ticker=ticker) as sp:
+        try:
+            return upstream.call(
+                "cash_flow", lambda: _cash_flow(company), lambda: _cash_flow(fresh_ticker(ticker))
+            )
+        except Exception as cfe:
+            sp["status"] = "error"
+            sp["error"] = type(cfe).__name__
+            return None
+
+
+def fetch_attr(company, attr, ticker):
+    """Read a yfinance Ticker property (income_stmt, info, ...) inside a span."""
+    yahoo_rate.acquire()
+    with span(attr, ticker=ticker):
+        return upstream.call(
+            attr, lambda: getattr(company, attr), lambda: getattr(fresh_ticker(ticker), attr)
+        )
+
+
+# With a deadline, each upstream stage may run until this share of the
+# budget has elapsed. The stages run concurrently; what is left after
+# them is for FX and assembly.
+STAGE_BUDGET_SHARES = {
+    "price_download": 0.6,
+    "income_stmt": 0.85,
+    "cash_flow": 0.85,
+    "info": 0.85,
+}
+
+# Result fields each stage feeds, reported when the stage didn't finish
+STAGE_FIELDS = {
+    "price_download": ["market_data.current_price"],
+    "income_stmt": ["fy24_financials", "historical_financials"],
+    "cash_flow": ["fy24_financials.fcf", "fy24_financials.fcf_margin_pct", "historical_financials"],
+    "info": [
+        "market_data.market_cap",
+        "market_data.enterprise_value",
+        "market_data.pe_ratio",
+        "company_name",
+        "sector",
+        "industry",
+        "currency_info",
+    ],
+}
+
+# Fields other stages fill in the reporting currency, converted with info's currency
+CURRENCY_FIELDS = ["fy24_financials", "historical_financials"]
+
+# Without a deadline, fetches run under this one while any stage's breaker is
+# open, so the open stages fail fast and are refilled from stale data
+DEGRADED_DEADLINE = float(os.environ.get("DEGRADED_DEADLINE", "8"))
+
+# Last complete result per ticker, used to fill stages that miss a deadline
+LAST_COMPLETE_MAX = 256
+_last_complete = OrderedDict()
+_last_complete_lock = threading.Lock()
+
+_stage_pool = None
+_stage_pool_lock = threading.Lock()
+
+
+def _get_stage_pool():
+    global _stage_pool
+    with _stage_pool_lock:
+        if _stage_pool is None:
+            _stage_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="fetch-stage")
+        return _stage_pool
+
+
+def remember_complete(ticker, result):
+    if result.get("source") != "yfinance":
+        return
+    with _last_complete_lock:
+        _last_complete[ticker.upper()] = copy.deepcopy(result)
+        _last_complete.move_to_end(ticker.upper())
+        while len(_last_complete) > LAST_COMPLETE_MAX:
+            _last_complete.popitem(last=False)
+
+
+def _copy_field(src, dst, path):
+    keys = path.split(".")
+    for key in keys[:-1]:
+        src = src.get(key) if isinstance(src, dict) else None
+        dst = dst.setdefault(key, {})
+    if not isinstance(src, dict) or keys[-1] not in src:
+        return False
+    dst[keys[-1]] = copy.deepcopy(src[keys[-1]])
+    return True
+
+
+def annotate_partial(ticker, result, failed_stages):
+    """Add `missing`/`stale` field manifests for stages that didn't finish.
+
+    Fields are refilled from the last complete result for the ticker where
+    possible (and listed as stale); the rest are listed as missing. A
+    refilled currency conversion brings the converted statements with it.
+    """
+    with _last_complete_lock:
+        previous = _last_complete.get(ticker.upper())
+    missing, stale = set(), set()
+    for stage in failed_stages:
+        if stage == "fx":
+            # Values were converted with the approximate fallback table
+            stale.add("currency_info.conversion_rate")
+            continue
+        if stage == "price_download" and result["market_data"].get("current_price"):
+            continue  # info supplied the price
+        for field in STAGE_FIELDS.get(stage, []):
+            if previous is not None and _copy_field(previous, result, field):
+                stale.add(field)
+            else:
+                missing.add(field)
+    if "currency_info" in stale and result["currency_info"].get("converted_to_usd"):
+        # Without info this fetch didn't know the currency, so its statements
+        # are still in the reporting currency; take the converted ones with the rate
+        for field in CURRENCY_FIELDS:
+            if field in stale:
+                continue
+            if _copy_field(previous, result, field):
+                stale.add(field)
+            else:
+                missing.add(field)
+    if not failed_stages:
+        remember_complete(ticker, result)
+    result["missing"] = sorted(missing)
+    result["stale"] = sorted(stale)
+    return result
+
+
+def fetch_financials_within(ticker, deadline):
+    """fetch_financials under a time budget in seconds, returning partial data.
+
+    Upstream stages run concurrently and are abandoned once their share of
+    the budget is spent; the result carries `missing`/`stale` manifests.
+    """
+    start = time.monotonic()
+    budget = max(0.0, float(deadline))
+    pool = _get_stage_pool()
+    failed = []
+    current_price = 0
+    try:
+        debug(f"Fetching data for {ticker} within {budget:.1f}s...")
+        company = yf.Ticker(ticker)
+        futures = {
+            "price_download": pool.submit(download_current_price, ticker),
+            "income_stmt": pool.submit(fetch_attr, company, "income_stmt", ticker),
+            "cash_flow": pool.submit(fetch_cash_flow, company, ticker),
+            "info": pool.submit(fetch_attr, company, "info", ticker),
         }
+        values = {}
+        for stage, future in futures.items():
+            remaining = start + budget * STAGE_BUDGET_SHARES[stage] - time.monotonic()
+            try:
+                values[stage] = future.result(timeout=max(0.0, remaining))
+            except FuturesTimeout:
+                debug(f"{stage} missed its deadline share, continuing without it")
+                failed.append(stage)
+            except Exception as e:
+                debug(f"{stage} failed: {e}")
+                failed.append(stage)
+        current_price = values.get("price_download", 0)
+
+        def rate_within_budget(from_currency, to_currency='USD'):
+            future = pool.submit(get_exchange_rate, from_currency, to_currency)
+            try:
+                return future.result(timeout=max(0.0, start + budget - time.monotonic()))
+            except Exception:
+                failed.append("fx")
+                return FALLBACK_FX_RATES.get(from_currency, 1.0)
+
+        result = build_financials(
+            ticker,
+            current_price,
+            values.get("income_stmt"),
+            values.get("cash_flow"),
+            values.get("info"),
+            get_rate=rate_within_budget,
+        )
+    except Exception as e:
+        debug(f"Error in fetch_financials: {e}")
+        result = fallback_financials(ticker, current_price)
+        failed = list(STAGE_FIELDS)
+    return annotate_partial(ticker, result, failed)
+
+
+def fetch_financials(ticker, deadline=None):
+    """Fetch financial data from yfinance for a given ticker.
+
+    With a deadline (seconds), see fetch_financials_within.
+    """
+    if deadline is None and any(upstream.is_open(stage) for stage in STAGE_FIELDS):
+        deadline = DEGRADED_DEADLINE
+    if deadline is not None:
+        return fetch_financials_within(ticker, deadline)
+    current_price = 0
+    try:
+        debug(f"Fetching data for {ticker}...")
+        
+        # Create ticker object
+        company = yf.Ticker(ticker)
         
-        debug("Successfully fetched financial data!")
+        # Get current price from download method
+        current_price = download_current_price(ticker)
+
+        income_stmt = None
+        cash_flow = None
+        info = None
+        try:
+            # Get income statement data
+            income_stmt = fetch_attr(company, "income_stmt", ticker)
+            cash_flow = fetch_cash_flow(company, ticker)
+            # Get market data
+            info = fetch_attr(company, "info", ticker)
+        except Exception as e:
+            debug(f"Error getting financial data: {e}")
+
+        result = build_financials(ticker, current_price, income_stmt, cash_flow, info)
+        if info and income_stmt is not None:
+            remember_complete(ticker, result)
         return result
         
     except Exception as e:
         debug(f"Error in fetch_financials: {e}")
         # Return fallback data
-        return {
-            "fy24_financials": {
-                "revenue": 0,
-                "gross_margin_pct": 0,
-                "ebitda": 0,
-                "net_income": 0,
-                "eps": 0,
-                "shares_outstanding": 0
-            },
-            "market_data": {
-                "current_price": current_price,
-                "market_cap": 0,
-                "enterprise_value": 0,
-                "pe_ratio": 0
-            },
-            "company_name": ticker,
-            "source": "yfinance_alternative",
-            "currency_info": {
-                "original_currency": "USD",
-                "converted_to_usd": False,
-                "conversion_rate": 1.0,
-                "exchange_rate_source": "none"
-            }
-        }
+        return fallback_financials(ticker, current_price)
+
+
+def cache_financials(ticker, result):
+    """Share a fetch result through the result cache if it is final.
+
+    Complete results are cached; the bare fallback (no price either) means
+    Yahoo doesn't know the ticker and is cached as a negative result.
+    Partial results (stages missing, or refilled from a stale copy) and
+    failed-but-priced results are left for the next fetch.
+    """
+    key = ticker.upper()
+    if result.get("source") == "yfinance_alternative" and not result["market_data"].get("current_price"):
+        result_cache.set("financials", key, None)
+    elif result.get("source") == "yfinance" and not result.get("missing") and not result.get("stale"):
+        result_cache.set("financials", key, result)
+
+
+def cached_financials(ticker):
+    """(hit, payload) from the result cache; a cached invalid ticker gives the fallback."""
+    hit, result = result_cache.get("financials", ticker.upper())
+    if hit and result is None:
+        result = fallback_financials(ticker.upper())
+    return hit, result
+
+
+def fetch_financials_cached(ticker, deadline=None):
+    """fetch_financials behind the shared result cache."""
+    hit, result = cached_financials(ticker)
+    if hit:
+        return result
+    result = fetch_financials(ticker, deadline=deadline)
+    cache_financials(ticker, result)
+    return result
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        debug(json.dumps({"error": "Usage: python fetch_yfinance.py <TICKER>"}))
+    if len(sys.argv) not in (2, 3):
+        debug(json.dumps({"error": "Usage: python fetch_yfinance.py <TICKER> [DEADLINE_SECONDS]"}))
         sys.exit(1)
     ticker = sys.argv[1].upper()
-    result = fetch_financials(ticker)
+    deadline = float(sys.argv[2]) if len(sys.argv) == 3 else None
+    # Stage spans go to stderr as JSON lines; stdout stays a single JSON document
+    add_listener(json_lines_listener())
+    result = fetch_financials_cached(ticker, deadline=deadline)
     # Ensure strict JSON output
-    print(json.dumps(result, allow_nan=False)) 
\ No newline at end of file
+    with span("serialization", ticker=ticker):
+        payload = json.dumps(result, allow_nan=False)
+    print(payload)
+    if deadline is not None:
+        # Stage threads abandoned at the deadline would otherwise block exit
+        sys.stdout.flush()
+        os._exit(0) 
\ No newline at end of file
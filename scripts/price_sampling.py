@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Resampling and downsampling of fetch_prices histories.
+
+Histories are [{date, close}] lists of daily closes. Three optional steps
+shrink them before they are sent anywhere:
+
+    lookback   keep the most recent window: "90d", "26w", "6mo", "1y", "ytd", "max"
+    interval   "daily", "weekly" or "monthly": the last close of each period,
+               dated on the period's last trading day (for analytics)
+    points     at most this many points, picked with Largest-Triangle-Three-
+               Buckets so peaks and troughs survive (for charts)
+
+Everything works on NumPy arrays of the dates and closes; LTTB only loops
+over its output buckets, each one a vectorized area computation.
+"""
+import re
+import datetime
+
+import numpy as np
+
+INTERVALS = ("daily", "weekly", "monthly")
+_LOOKBACK = re.compile(r"^(\d+)\s*(d|w|mo|m|y)$")
+_LOOKBACK_DAYS = {"d": 1, "w": 7, "mo": 30.4375, "m": 30.4375, "y": 365.25}
+
+
+def to_arrays(rows):
+    dates = np.array([r["date"] for r in rows], dtype="datetime64[D]")
+    closes = np.array([r["close"] for r in rows], dtype=float)
+    return dates, closes
+
+
+def to_rows(dates, closes):
+    return [{"date": d, "close": c} for d, c in zip(dates.astype(str).tolist(), closes.tolist())]
+
+
+def parse_lookback(spec, today=None):
+    """First date kept for a lookback spec, None for "max"/None; ValueError if invalid."""
+    if spec is None:
+        return None
+    spec = str(spec).strip().lower()
+    today = today or datetime.date.today()
+    if spec in ("", "max"):
+        return None
+    if spec == "ytd":
+        return np.datetime64(datetime.date(today.year, 1, 1), "D")
+    match = _LOOKBACK.match(spec)
+    if not match:
+        raise ValueError(f"Invalid lookback: {spec!r} (use e.g. 90d, 26w, 6mo, 1y, ytd, max)")
+    days = int(round(int(match.group(1)) * _LOOKBACK_DAYS[match.group(2)]))
+    return np.datetime64(today, "D") - np.timedelta64(days, "D")
+
+
+def resample(dates, closes, interval):
+    """Last close of each week or month."""
+    if interval == "daily" or dates.size == 0:
+        return dates, closes
+    if interval == "weekly":
+        # 1970-01-01 was a Thursday; shifting by 3 makes weeks start on Monday
+        period = (dates.astype("int64") + 3) // 7
+    elif interval == "monthly":
+        period = dates.astype("datetime64[M]").astype("int64")
+    else:
+        raise ValueError(f"Invalid interval: {interval!r} (use {', '.join(INTERVALS)})")
+    last = np.flatnonzero(np.append(period[1:] != period[:-1], True))
+    return dates[last], closes[last]
+
+
+def lttb_indices(x, y, points):
+    """Indices of `points` samples chosen by Largest-Triangle-Three-Buckets."""
+    n = x.size
+    if points >= n:
+        return np.arange(n)
+    if points < 3:
+        return np.array([0, n - 1][:max(points, 1)])
+    # Bucket edges over the interior points; the first and last are always kept
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    starts, ends = edges[:-1], edges[1:]
+    # Average of each bucket, used as the third vertex for the bucket before it
+    counts = ends - starts
+    avg_x = np.add.reduceat(x[:-1], starts) / counts
+    avg_y = np.add.reduceat(y[:-1], starts) / counts
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    chosen = np.empty(points, dtype=int)
+    chosen[0], chosen[-1] = 0, n - 1
+    a = 0
+    for b, (start, end) in enumerate(zip(starts, ends)):
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((x[a] - avg_x[b]) * (by - y[a]) - (x[a] - bx) * (avg_y[b] - y[a]))
+        a = start + int(area.argmax())
+        chosen[b + 1] = a
+    return chosen
+
+
+def shape(rows, interval="daily", lookback=None, points=None):
+    """Apply lookback, then interval, then the point budget to one history."""
+    if not rows:
+        return rows
+    dates, closes = to_arrays(rows)
+    cutoff = parse_lookback(lookback)
+    if cutoff is not None:
+        keep = dates >= cutoff
+        dates, closes = dates[keep], closes[keep]
+    dates, closes = resample(dates, closes, interval or "daily")
+    if points and dates.size > points:
+        idx = lttb_indices(dates.astype("int64").astype(float), closes, int(points))
+        dates, closes = dates[idx], closes[idx]
+    return to_rows(dates, closes)
+
+
+def shape_prices(data, interval="daily", lookback=None, points=None):
+    """shape() over a fetch_prices result ({ticker: rows})."""
+    if (interval or "daily") == "daily" and not lookback and not points:
+        return data
+    return {ticker: shape(rows, interval, lookback, points) for ticker, rows in data.items()}
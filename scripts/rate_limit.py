@@ -0,0 +1,69 @@
+"""
+Token-bucket rate limit for upstream Yahoo requests.
+
+Every fetch stage (price download, statements, info, ...) takes one token
+from the shared `yahoo` bucket before it calls out, whichever engine or
+caller runs it, so on-demand requests and bulk refreshes in one process
+stay under a single request rate.
+
+Configured with YAHOO_RATE_LIMIT (requests per second, 0 = unlimited,
+the default) and YAHOO_RATE_BURST (bucket size, default 2x the rate).
+"""
+import os
+import time
+import asyncio
+import threading
+
+
+class TokenBucket:
+    def __init__(self, rate=0.0, burst=None):
+        self.lock = threading.Lock()
+        self.configure(rate, burst)
+
+    def configure(self, rate, burst=None):
+        with self.lock:
+            self.rate = max(0.0, float(rate or 0.0))
+            self.capacity = max(1.0, float(burst) if burst else 2.0 * self.rate)
+            self.tokens = self.capacity
+            self.updated = time.monotonic()
+            self.waited = 0.0
+
+    def _reserve(self):
+        """Take a token now or say how long until one is free."""
+        with self.lock:
+            if self.rate <= 0:
+                return 0.0
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Going negative queues callers behind each other in arrival order
+            self.tokens -= 1.0
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.waited += wait
+            return wait
+
+    def available(self):
+        """Tokens that could be taken right now without waiting."""
+        with self.lock:
+            if self.rate <= 0:
+                return float("inf")
+            now = time.monotonic()
+            return min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+yahoo = TokenBucket(
+    float(os.environ.get("YAHOO_RATE_LIMIT", "0") or 0),
+    float(os.environ.get("YAHOO_RATE_BURST", "0") or 0) or None,
+)
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Two-tier cache for fetch results shared across processes.
+
+L1 is a small TTL'd LRU in the process. L2 is shared by every process that
+points at it, so a ticker fetched by one Vercel instance or service worker
+is a cache hit for the rest. RESULT_CACHE_URL picks the L2 backend:
+
+    redis://[:password@]host:6379/0   any Redis-protocol server
+    file:///var/cache/fincast         one file per key on a shared disk
+    memory://                         in-process dict (tests, single worker)
+
+and leaving it unset keeps L1 only. Values are zlib-compressed JSON under
+versioned keys (fincast:<kind>:v<version>:<key>), so changing a payload's
+shape is a version bump instead of a flush. Lookups that found nothing
+(invalid tickers) are cached too, for RESULT_CACHE_NEGATIVE_TTL seconds.
+
+An unreachable L2 never fails a fetch: errors count as misses and the
+backend is skipped for a while before it is tried again.
+
+Cached values are shared between callers and must be treated as read-only.
+
+For local testing, `python result_cache.py serve [port]` runs an in-memory
+Redis stand-in that speaks enough of the protocol for the redis backend.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import socket
+import struct
+import hashlib
+import threading
+import socketserver
+from collections import OrderedDict
+from pathlib import Path
+from urllib.parse import urlparse, unquote
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.timing import span
+
+# Bump a kind's version when the shape of its cached payload changes
+KIND_VERSIONS = {"financials": 1, "prices": 1, "valuation": 1, "jobs": 1, "multiples": 1}
+KEY_PREFIX = os.environ.get("RESULT_CACHE_PREFIX", "fincast")
+TTLS = {
+    "financials": float(os.environ.get("RESULT_CACHE_FINANCIALS_TTL", "900")),
+    "prices": float(os.environ.get("RESULT_CACHE_PRICES_TTL", "3600")),
+    # Per-ticker portfolio job results; no older than the financials they came from
+    "valuation": float(os.environ.get("RESULT_CACHE_VALUATION_TTL", "900")),
+    "jobs": float(os.environ.get("RESULT_CACHE_JOBS_TTL", "3600")),
+    "multiples": float(os.environ.get("RESULT_CACHE_MULTIPLES_TTL", "3600")),
+}
+NEGATIVE_TTL = float(os.environ.get("RESULT_CACHE_NEGATIVE_TTL", "300"))
+# Entries kept in process per kind; a price history is ~100x a financials payload
+L1_SIZES = {
+    "financials": int(os.environ.get("RESULT_CACHE_L1_FINANCIALS", "512")),
+    "prices": int(os.environ.get("RESULT_CACHE_L1_PRICES", "64")),
+    "valuation": int(os.environ.get("RESULT_CACHE_L1_VALUATION", "1024")),
+    "jobs": int(os.environ.get("RESULT_CACHE_L1_JOBS", "256")),
+    "multiples": int(os.environ.get("RESULT_CACHE_L1_MULTIPLES", "64")),
+}
+L2_TIMEOUT = float(os.environ.get("RESULT_CACHE_TIMEOUT", "0.25"))
+# How long an L2 that errored is skipped before it is tried again
+L2_BACKOFF = 30.0
+
+_MISSING = object()
+# Stored for lookups that found nothing, so they aren't retried upstream
+_NEGATIVE = b"-"
+_JSON = b"z"
+
+
+def encode(value):
+    if value is None:
+        return _NEGATIVE
+    return _JSON + zlib.compress(json.dumps(value, separators=(",", ":")).encode(), 6)
+
+
+def decode(blob):
+    if blob == _NEGATIVE:
+        return None
+    if blob[:1] != _JSON:
+        raise ValueError("unknown cache encoding")
+    return json.loads(zlib.decompress(blob[1:]))
+
+
+class MemoryBackend:
+    """Dict with expiry, the same semantics as app/lib/redis.js."""
+
+    def __init__(self):
+        self.store = {}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.store.get(key)
+            if item is None:
+                return None
+            value, expiry = item
+            if expiry and expiry < time.time():
+                del self.store[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.store[key] = (value, time.time() + ttl if ttl else None)
+
+    def delete(self, key):
+        with self.lock:
+            self.store.pop(key, None)
+
+
+class FileBackend:
+    """One file per key: 8-byte expiry timestamp, then the value."""
+
+    def __init__(self, directory):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        return self.dir / hashlib.sha1(key.encode()).hexdigest()
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        (expiry,) = struct.unpack(">d", data[:8])
+        if expiry and expiry < time.time():
+            path.unlink(missing_ok=True)
+            return None
+        return data[8:]
+
+    def set(self, key, value, ttl):
+        path = self._path(key)
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(struct.pack(">d", time.time() + ttl if ttl else 0.0) + value)
+        os.replace(tmp, path)
+
+    def delete(self, key):
+        self._path(key).unlink(missing_ok=True)
+
+
+class RedisError(Exception):
+    pass
+
+
+class RedisBackend:
+    """Just enough of the Redis protocol (RESP2) for GET, SET with expiry and DEL."""
+
+    def __init__(self, host="localhost", port=6379, db=0, password=None, timeout=L2_TIMEOUT):
+        self.address = (host, port)
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = (sock, sock.makefile("rb"))
+        self.local.conn = conn
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", str(self.db))
+        return conn
+
+    def _read(self, stream):
+        line = stream.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("connection closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest
+        if kind == b"-":
+            raise RedisError(rest.decode(errors="replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            size = int(rest)
+            if size < 0:
+                return None
+            data = stream.read(size + 2)
+            return data[:-2]
+        raise RedisError(f"unexpected reply {line[:20]!r}")
+
+    def _call(self, *args):
+        conn = getattr(self.local, "conn", None) or self._connect()
+        sock, stream = conn
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            arg = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(arg), arg))
+        try:
+            sock.sendall(b"".join(parts))
+            return self._read(stream)
+        except (OSError, ConnectionError):
+            self.local.conn = None
+            sock.close()
+            raise
+
+    def get(self, key):
+        return self._call("GET", key)
+
+    def set(self, key, value, ttl):
+        self._call("SET", key, value, "PX", max(1, int(ttl * 1000)))
+
+    def delete(self, key):
+        self._call("DEL", key)
+
+
+def backend_from_url(url):
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return MemoryBackend()
+    if parsed.scheme == "file":
+        return FileBackend(unquote(parsed.path))
+    if parsed.scheme in ("redis", "tcp"):
+        db = parsed.path.strip("/")
+        return RedisBackend(
+            parsed.hostname or "localhost",
+            parsed.port or 6379,
+            int(db) if db else 0,
+            unquote(parsed.password) if parsed.password else None,
+        )
+    raise ValueError(f"Unsupported RESULT_CACHE_URL scheme: {parsed.scheme}")
+
+
+class ResultCache:
+    def __init__(self, backend=None, l1_sizes=L1_SIZES):
+        self.backend = backend
+        self.l1 = {}
+        self.l1_sizes = dict(l1_sizes)
+        self.lock = threading.Lock()
+        self.l2_down_until = 0.0
+
+    def key(self, kind, key):
+        return f"{KEY_PREFIX}:{kind}:v{KIND_VERSIONS.get(kind, 1)}:{key}"
+
+    def _l1_get(self, kind, full_key, stale=False):
+        with self.lock:
+            entries = self.l1.get(kind)
+            item = entries.get(full_key) if entries else None
+            if item is None:
+                return _MISSING
+            value, expiry = item
+            # Expired entries stay until evicted, as stale fallbacks
+            if expiry < time.monotonic() and not stale:
+                return _MISSING
+            entries.move_to_end(full_key)
+            return value
+
+    def _l1_set(self, kind, full_key, value, ttl):
+        with self.lock:
+            entries = self.l1.setdefault(kind, OrderedDict())
+            entries[full_key] = (value, time.monotonic() + ttl)
+            entries.move_to_end(full_key)
+            while len(entries) > self.l1_sizes.get(kind, 128):
+                entries.popitem(last=False)
+
+    def _l2(self, op, *args):
+        if self.backend is None or time.monotonic() < self.l2_down_until:
+            return None
+        try:
+            return getattr(self.backend, op)(*args)
+        except Exception:
+            self.l2_down_until = time.monotonic() + L2_BACKOFF
+            raise
+
+    def get(self, kind, key):
+        """(hit, value); value is None for a cached negative result."""
+        full_key = self.key(kind, key)
+        value = self._l1_get(kind, full_key)
+        with span("cache_l1", kind=kind, cache=f"{kind}_l1") as sp:
+            sp["cache_hit"] = value is not _MISSING
+        if value is not _MISSING or self.backend is None:
+            return value is not _MISSING, (None if value is _MISSING else value)
+        with span("cache_l2", kind=kind, cache=f"{kind}_l2") as sp:
+            try:
+                blob = self._l2("get", full_key)
+                value = _MISSING if blob is None else decode(blob)
+            except Exception as e:
+                sp["status"] = "error"
+                sp["error"] = type(e).__name__
+                value = _MISSING
+            sp["cache_hit"] = value is not _MISSING
+        if value is not _MISSING:
+            # L2 doesn't hand back the remaining TTL; a short L1 lifetime bounds the skew
+            self._l1_set(kind, full_key, value, min(TTLS.get(kind, 60.0), 60.0) if value is not None else NEGATIVE_TTL)
+            return True, value
+        return False, None
+
+    def get_stale(self, kind, key):
+        """The last value this process held for a key, even if expired (None if none)."""
+        value = self._l1_get(kind, self.key(kind, key), stale=True)
+        return None if value is _MISSING else value
+
+    def set(self, kind, key, value):
+        """Store a value (None caches a negative result)."""
+        full_key = self.key(kind, key)
+        ttl = NEGATIVE_TTL if value is None else TTLS.get(kind, 60.0)
+        self._l1_set(kind, full_key, value, ttl)
+        if self.backend is None:
+            return
+        with span("cache_l2_set", kind=kind) as sp:
+            try:
+                self._l2("set", full_key, encode(value), ttl)
+            except Exception as e:
+                sp["status"] = "error"
+                sp["error"] = type(e).__name__
+
+    def delete(self, kind, key):
+        full_key = self.key(kind, key)
+        with self.lock:
+            self.l1.get(kind, {}).pop(full_key, None)
+        try:
+            self._l2("delete", full_key)
+        except Exception:
+            pass
+
+    def cached(self, kind, key, fetch, negative=lambda value: False, cacheable=lambda value: True):
+        """Cached `fetch()`; results for which `negative` is true are cached as None."""
+        hit, value = self.get(kind, key)
+        if hit:
+            return value
+        value = fetch()
+        if negative(value):
+            self.set(kind, key, None)
+        elif cacheable(value):
+            self.set(kind, key, value)
+        return value
+
+
+cache = ResultCache(backend_from_url(os.environ.get("RESULT_CACHE_URL")))
+
+
+class _StandInHandler(socketserver.StreamRequestHandler):
+    def _reply(self, value):
+        if value is None:
+            self.wfile.write(b"$-1\r\n")
+        elif isinstance(value, int):
+            self.wfile.write(b":%d\r\n" % value)
+        elif isinstance(value, str):
+            self.wfile.write(value.encode() + b"\r\n")
+        else:
+            self.wfile.write(b"$%d\r\n%s\r\n" % (len(value), value))
+
+    def handle(self):
+        store = self.server.store
+        while True:
+            header = self.rfile.readline()
+            if not header.startswith(b"*"):
+                return
+            args = []
+            for _ in range(int(header[1:])):
+                size = int(self.rfile.readline()[1:])
+                args.append(self.rfile.read(size + 2)[:-2])
+            command = args[0].upper()
+            if command == b"GET":
+                self._reply(store.get(args[1].decode()))
+            elif command == b"SET":
+                ttl = None
+                if len(args) >= 5 and args[3].upper() in (b"EX", b"PX"):
+                    ttl = int(args[4]) / (1000.0 if args[3].upper() == b"PX" else 1.0)
+                store.set(args[1].decode(), args[2], ttl)
+                self._reply("+OK")
+            elif command == b"DEL":
+                store.delete(args[1].decode())
+                self._reply(1)
+            elif command in (b"PING", b"AUTH", b"SELECT"):
+                self._reply("+PONG" if command == b"PING" else "+OK")
+            elif command == b"FLUSHDB":
+                with store.lock:
+                    store.store.clear()
+                self._reply("+OK")
+            else:
+                self._reply(f"-ERR unknown command '{command.decode()}'")
+            self.wfile.flush()
+
+
+class _StandInServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve_stand_in(port=6380, host="127.0.0.1"):
+    """In-memory Redis stand-in (GET, SET EX/PX, DEL, PING, FLUSHDB)."""
+    server = _StandInServer((host, port), _StandInHandler)
+    server.store = MemoryBackend()
+    return server
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "serve":
+        print("Usage: python result_cache.py serve [port]", file=sys.stderr)
+        sys.exit(1)
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 6380
+    print(f"Redis stand-in listening on 127.0.0.1:{port}", file=sys.stderr)
+    serve_stand_in(port).serve_forever()
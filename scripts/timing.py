@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Structured stage timing for the fetch scripts.
+
+Each stage of a fetch (price download, statements, info, FX, ...) runs inside
+`span(stage)`. Finished spans are handed to registered listeners: the CLI
+scripts print them to stderr as JSON lines, python_service feeds them into
+its Prometheus metrics.
+"""
+import sys
+import json
+import time
+from contextlib import contextmanager
+
+_listeners = []
+
+
+def add_listener(fn):
+    """Register a callable that receives every finished span record."""
+    if fn not in _listeners:
+        _listeners.append(fn)
+    return fn
+
+
+def remove_listener(fn):
+    try:
+        _listeners.remove(fn)
+    except ValueError:
+        pass
+
+
+@contextmanager
+def span(stage, **attrs):
+    """Time a stage. The yielded dict can be annotated (e.g. status='empty')."""
+    record = {"stage": stage}
+    record.update(attrs)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["status"] = "error"
+        record["error"] = type(e).__name__
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - start) * 1000.0, 3)
+        record["ts"] = round(time.time(), 3)
+        record.setdefault("status", "ok")
+        for fn in list(_listeners):
+            try:
+                fn(record)
+            except Exception:
+                pass
+
+
+def emit(stage, **attrs):
+    """Hand listeners a point-in-time event (a hedge fired, a breaker opened, ...)."""
+    record = {"stage": stage, "event": True, "ts": round(time.time(), 3)}
+    record.update(attrs)
+    for fn in list(_listeners):
+        try:
+            fn(record)
+        except Exception:
+            pass
+
+
+def json_lines_listener(stream=None):
+    """Listener that writes one JSON object per span, for CLI use."""
+    def _emit(record):
+        out = stream or sys.stderr
+        try:
+            out.write(json.dumps({"span": record}, default=str) + "\n")
+        except Exception:
+            pass
+    return _emit
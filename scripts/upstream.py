@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Hedged calls and circuit breakers for upstream Yahoo endpoints.
+
+`call(endpoint, fn, hedge)` runs one upstream request (a download, a
+statement, info, ...). Each endpoint keeps a window of recent latencies;
+once a call has been running longer than the endpoint's observed p95, a
+duplicate (`hedge`, or `fn` again) is fired and whichever finishes first
+wins. Hedges are capped at HEDGE_BUDGET of an endpoint's calls so a
+slow-down doesn't double the load on Yahoo.
+
+Each endpoint also has a circuit breaker. BREAKER_FAILURES consecutive
+failures open it and calls fail fast with CircuitOpen for BREAKER_COOLDOWN
+seconds, so callers go straight to cached or stale data. After that one
+trial call is let through: success closes the breaker, failure reopens it.
+
+Hedges and breaker changes are emitted as timing events; python_service
+counts them in its metrics.
+"""
+import os
+import sys
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from scripts.timing import emit
+
+HEDGE_ENABLED = os.environ.get("HEDGE_REQUESTS", "1") == "1"
+HEDGE_QUANTILE = 0.95
+# Latencies an endpoint needs before its p95 is trusted for hedging
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", "0.25"))
+HEDGE_BUDGET = float(os.environ.get("HEDGE_BUDGET", "0.1"))
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", "30"))
+LATENCY_WINDOW = 256
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(Exception):
+    """The endpoint's breaker is open; use cached or stale data."""
+
+
+class Endpoint:
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.calls = 0
+        self.hedges = 0
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_running = False
+
+    def observe(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None if this call shouldn't be hedged."""
+        with self.lock:
+            if len(self.latencies) < HEDGE_MIN_SAMPLES or self.hedges >= HEDGE_BUDGET * self.calls:
+                return None
+            ordered = sorted(self.latencies)
+        return max(HEDGE_MIN_DELAY, ordered[int(HEDGE_QUANTILE * (len(ordered) - 1))])
+
+    def _transition(self, state):
+        self.state = state
+        emit("breaker", endpoint=self.name, outcome=state, state=state)
+
+    def allow(self):
+        with self.lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= BREAKER_COOLDOWN:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self.trial_running:
+                    return False
+                self.trial_running = True
+                return True
+            if self.state == OPEN:
+                return False
+            self.calls += 1
+            return True
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.trial_running = False
+            if self.state != CLOSED:
+                self._transition(CLOSED)
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= BREAKER_FAILURES):
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+_pool = None
+
+
+def endpoint(name):
+    with _endpoints_lock:
+        ep = _endpoints.get(name)
+        if ep is None:
+            ep = _endpoints[name] = Endpoint(name)
+        return ep
+
+
+def is_open(name):
+    ep = endpoint(name)
+    with ep.lock:
+        return ep.state == OPEN and time.monotonic() - ep.opened_at < BREAKER_COOLDOWN
+
+
+def _get_pool():
+    global _pool
+    with _endpoints_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=64, thread_name_prefix="upstream")
+        return _pool
+
+
+def _timed(ep, fn):
+    def run():
+        start = time.monotonic()
+        result = fn()
+        ep.observe(time.monotonic() - start)
+        return result
+    return run
+
+
+def call(name, fn, hedge=None):
+    """Run fn() against endpoint `name` with hedging and the circuit breaker."""
+    ep = endpoint(name)
+    if not ep.allow():
+        emit("breaker", endpoint=name, outcome="rejected")
+        raise CircuitOpen(name)
+    delay = ep.hedge_delay() if HEDGE_ENABLED else None
+    try:
+        if delay is None:
+            result = _timed(ep, fn)()
+        else:
+            result = _hedged(ep, fn, hedge or fn, delay)
+    except Exception:
+        ep.failure()
+        raise
+    ep.success()
+    return result
+
+
+def _hedged(ep, fn, hedge, delay):
+    pool = _get_pool()
+    primary = pool.submit(_timed(ep, fn))
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+    with ep.lock:
+        ep.hedges += 1
+    backup = pool.submit(_timed(ep, hedge))
+    pending = {primary, backup}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                emit("hedge", endpoint=ep.name, outcome="won" if future is backup else "lost")
+                return future.result()
+            error = future.exception()
+    emit("hedge", endpoint=ep.name, outcome="failed")
+    raise error
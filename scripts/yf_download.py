@@ -0,0 +1,40 @@
+"""
+yf.download, guarded against its own shared state.
+
+yfinance up to and including 0.2.65 (the version python_service pins)
+collects yf.download results in module globals, so two downloads at once
+can swap each other's tickers. Newer versions thread a per-call context
+through the downloader instead; REENTRANT says which one is installed.
+
+Every yf.download in the repo runs inside `guarded()`, which serializes
+them when they aren't reentrant. Enter it outside upstream.call, so time
+spent queueing for the lock isn't measured as upstream latency (and
+doesn't trigger hedges). Callers that need downloads to run in parallel
+regardless use Ticker.history, which shares no module state.
+"""
+import inspect
+import threading
+from contextlib import contextmanager
+
+import yfinance as yf
+
+
+def _download_is_reentrant():
+    try:
+        return "ctx" in inspect.signature(yf.multi._download_one).parameters
+    except (AttributeError, TypeError, ValueError):
+        return False
+
+
+REENTRANT = _download_is_reentrant()
+_lock = threading.Lock()
+
+
+@contextmanager
+def guarded():
+    """Hold the download lock for the block, unless yf.download is reentrant."""
+    if REENTRANT:
+        yield
+        return
+    with _lock:
+        yield